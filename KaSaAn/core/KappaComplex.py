@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
-"""Contains `KappaComplex`, a class to represents a list of agents chained into a larger entity, and the `embed_and_map`
-function."""
+"""Contains `KappaComplex`, a class to represents a list of agents chained into a larger entity, and the
+`embed_and_map`, `iter_embeddings`, and `count_embeddings` functions."""
 
 import xml.etree.ElementTree as ET
 import re
+import warnings
 import networkx as nx
 from pathlib import Path
 from collections import deque
-from typing import Deque, Dict, List, Optional, Set, Tuple, Union
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
 
 from .KappaMultiAgentGraph import KappaMultiAgentGraph
 from .KappaAgent import KappaAgent
@@ -35,6 +36,10 @@ class KappaComplex(KappaMultiAgentGraph):
         self._kappa_expression: str
         self._composition: Dict[KappaAgent, int]
         """Maps an agent type to an abundance"""
+        self._automorphisms: Optional[int] = None
+        """Number of automorphisms when read as a pattern; computed on first request"""
+        self._automorphisms_exact: Optional[bool] = None
+        """Whether that number alone yields the symmetry-corrected count; computed on first request"""
 
         self._raw_expression = expression
         # get the set of agents making up this complex
@@ -136,11 +141,11 @@ class KappaComplex(KappaMultiAgentGraph):
             q_complex = KappaComplex(query)
         else:
             q_complex = query
-        total_maps, unique_maps = embed_and_map(q_complex, self)
+        total_maps, unique_maps = count_embeddings(q_complex, self)
         if symmetry_adjust:
-            return len(unique_maps)
+            return unique_maps
         else:
-            return len(total_maps)
+            return total_maps
 
     def get_number_of_embeddings(self, query, symmetry_adjust: bool = True) -> int:
         """Wrapper for the two specialized functions, for agent and complex. Optional parameter to not perform
@@ -159,6 +164,29 @@ class KappaComplex(KappaMultiAgentGraph):
             except ComplexParseError:
                 raise ValueError('Could not parse <{}> as a KappaAgent nor as a KappaComplex.'.format(query))
 
+    def get_number_of_automorphisms(self) -> int:
+        """Returns the number of automorphisms of this complex, read as a pattern, i.e. the number of raw embeddings
+        it has into itself. Computed once, then cached. For a ring of three `Bob(h[10], t[11]), Bob(h[11], t[12]),
+        Bob(h[12], t[10])` this is 3."""
+        if self._automorphisms is None:
+            self._automorphisms = sum(1 for _ in iter_embeddings(self, self))
+        return self._automorphisms
+
+    def _automorphism_count_is_exact(self) -> bool:
+        """Dividing raw embeddings by the number of automorphisms reproduces the image-set count of `embed_and_map`
+        only if the automorphisms of the bond skeleton also respect the agents' other sites; e.g. in `B(b[1]{a}),
+        B(b[1])` the skeleton can swap the two agents but the internal state prevents it, and a target with two `{a}`
+        would have two raw embeddings sharing one image. Computed once, then cached."""
+        if self._automorphisms_exact is None:
+            skeleton_agents = []
+            for agent in self._agents:
+                bonded_ports = [str(port.get_port_name()) + '[' + port.get_port_current_bond() + ']'
+                                for port in agent.get_agent_ports() if port.get_port_current_bond().isdigit()]
+                skeleton_agents.append(agent.get_agent_name() + '(' + ' '.join(bonded_ports) + ')')
+            skeleton = KappaComplex(', '.join(skeleton_agents))
+            self._automorphisms_exact = skeleton.get_number_of_automorphisms() == self.get_number_of_automorphisms()
+        return self._automorphisms_exact
+
     def get_agent_identifiers(self) -> List[int]:
         """Returns a list with the numeric agent identifiers, if any."""
         return self._agent_by_idents.keys()
@@ -461,21 +489,69 @@ There are three ways of satisfying the query in the target, and these rotations
 However, the set of identifiers making up the image of the query in the target is the same for these three:
 `(0, 2, 1)`, `(1, 0, 2)`, and `(2, 1, 0)` are equivalent, and so the target contains only one copy of the query.
 These dual-purpose interpretation of the "embedding" concept yields a function that returns both.
+
+Both collections are held in memory at once; to consume mappings as they are found, see `iter_embeddings`.
+    """
+    maps_all: List[NetMap] = list(iter_embeddings(ka_query, ka_target))
+    maps_distinct: Set[NetMap] = set(maps_all)
+    return maps_all, maps_distinct
+
+
+def count_embeddings(ka_query: KappaComplex, ka_target: KappaComplex, validate: bool = False) -> Tuple[int, int]:
+    """
+Returns the number of embeddings of `ka_query` into `ka_target`, both raw and automorphism-corrected, without keeping
+the mappings. The automorphism group of the query is computed once and cached on the query, so the corrected number is
+the raw one divided by the group's size; no mapping is hashed. Queries whose symmetry depends on the target (see
+`KappaComplex._automorphism_count_is_exact`) fall back to hashing the images, as `embed_and_map` does. With `validate`,
+the image-hashing path is always used, and a warning is issued if the shortcut would have disagreed.
+>>> from KaSaAn.core.KappaComplex import count_embeddings, KappaComplex
+>>> my_comp = KappaComplex('Bob(h[10], t[11]), Bob(h[11], t[12]), Bob(h[12], t[10])')
+>>> count_embeddings(my_comp, my_comp)
+(3, 1)
+    """
+    shortcut = ka_query._automorphism_count_is_exact()
+    if shortcut and not validate:
+        raw_number = sum(1 for _ in iter_embeddings(ka_query, ka_target))
+        unique_number, remainder = divmod(raw_number, ka_query.get_number_of_automorphisms())
+        if remainder == 0:
+            return raw_number, unique_number
+    raw_number = 0
+    hashes_seen: Set[int] = set()
+    for map_found in iter_embeddings(ka_query, ka_target):
+        raw_number += 1
+        hashes_seen.add(hash(map_found))
+    if validate and shortcut and raw_number // ka_query.get_number_of_automorphisms() != len(hashes_seen):
+        warnings.warn('Automorphism shortcut disagrees with image count for query <{}> in target <{}>'.format(
+            ka_query, ka_target))
+    return raw_number, len(hashes_seen)
+
+
+def iter_embeddings(ka_query: KappaComplex, ka_target: KappaComplex, unique: bool = False) -> Iterator[NetMap]:
+    """
+Lazy counterpart to `embed_and_map`: yields the mappings of `ka_query` into `ka_target` one at a time, as the
+traversal finds them. With `unique`, mappings whose image is identical to one already yielded are skipped; only
+the hashes of the yielded mappings are retained for this, not the mappings themselves.
+>>> from KaSaAn.core.KappaComplex import iter_embeddings, KappaComplex
+>>> my_comp = KappaComplex('Bob(h[10], t[11]), Bob(h[11], t[12]), Bob(h[12], t[10])')
+>>> sum(1 for _ in iter_embeddings(my_comp, my_comp))
+3
+>>> sum(1 for _ in iter_embeddings(my_comp, my_comp, unique=True))
+1
     """
     # litany of short circuits
     if ka_query.get_size_of_complex() > ka_target.get_size_of_complex():    # not enough agents
-        return ([], [])
+        return
     if ka_query.get_number_of_bonds() > ka_target.get_number_of_bonds():    # not enough bonds
-        return ([], [])
+        return
     query_comp = ka_query.get_complex_composition()
     target_comp = ka_target.get_complex_composition()
     if not set(query_comp) <= set(target_comp):                             # query agent(s) not present in target
-        return ([], [])
+        return
     for agent_type, query_abundance in query_comp.items():
         if agent_type not in target_comp:                                   # query agent missing in target
-            return ([], [])
+            return
         if target_comp[agent_type] < query_abundance:                       # target sum formula too small
-            return ([], [])
+            return
     # start from the least abundant type, get their node indexes in query network and target network;
     # from the <<query is improper subset of target>> check above, all of query's are in target by type, so query's
     # minimum must be a type in common; moreover all query's type abundances are equal or greater in target, so if
@@ -487,24 +563,21 @@ These dual-purpose interpretation of the "embedding" concept yields a function t
         raise ValueError('Error: query is not a connected graph.')
     if not nx.is_connected(target_network):
         raise ValueError('Error: target is not a connected graph.')
-    common_min_q: List[int] = []
-    for node_id in query_network.nodes:
-        if common_min in query_network.nodes[node_id]['kappa']:
-            common_min_q.append(node_id)
-    common_min_t: List[int] = []
-    for node_id in target_network.nodes:
-        if common_min in target_network.nodes[node_id]['kappa']:
-            common_min_t.append(node_id)
-    # embark on systematic traversal
-    query_start_node = common_min_q[0]
-    maps_all: List[NetMap] = []
-    maps_distinct:  Set[NetMap] = set()
-    for target_start_node in common_min_t:
+    query_start_node = next(node_id for node_id in query_network.nodes
+                            if common_min in query_network.nodes[node_id]['kappa'])
+    # embark on systematic traversal; NetMap equality is hash equality, so the hashes suffice for uniqueness
+    hashes_seen: Set[int] = set()
+    for target_start_node in target_network.nodes:
+        if common_min not in target_network.nodes[target_start_node]['kappa']:
+            continue
         map_found = _traverse_from(query_network, target_network, query_start_node, target_start_node)
         if map_found:
-            maps_all.append(map_found)
-            maps_distinct.add(map_found)
-    return maps_all, maps_distinct
+            if unique:
+                map_hash = hash(map_found)
+                if map_hash in hashes_seen:
+                    continue
+                hashes_seen.add(map_hash)
+            yield map_found
 
 
 def _traverse_from(query_net: nx.MultiGraph, target_net: nx.MultiGraph, q_start: int, t_start: int) -> Optional[NetMap]:
@@ -50,3 +50,7 @@ class RuleParseError(KappaError):
 
 class KappaEqualtiyError(KappaError):
     """Exception raised when comparing apples to oranges."""
+
+
+class TraceParseError(KappaError):
+    """Exception raised when failing to parse a trace file."""
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Contains the `KappaMixture` class, a mutable reaction mixture that replays the actions of a KaSim trace, and can be
+turned into a `KappaSnapshot` at any step."""
+
+import numpy as np
+import pathlib
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from .KappaComplex import KappaComplex, iter_embeddings
+from .KappaSnapshot import KappaSnapshot
+from .KappaTrace import KappaTrace, TraceAction, TraceInit, TracePert, TraceRule
+
+
+class KappaMixture:
+    """Class for representing a reaction mixture that changes one trace step at a time. Agents are stored in flat
+    arrays indexed by agent identifier (and by site, for internal states and bonds), as in the trace. Complex membership
+    is maintained incrementally: binding two complexes relabels the agents of the smaller one; freeing a bond searches
+    from both of its ends at once, and stops as soon as the ends meet, or one side runs out, in which case that side is
+    a new complex, so the cost is bounded by the size of the smaller part. Removing an agent re-labels the rest of its
+    complex. The side effects listed by events are not replayed: removing an agent frees its partners directly.
+    >>> from KaSaAn.core import KappaTrace, KappaMixture
+    >>> my_trace = KappaTrace('models/trace_viz/t.json')
+    >>> my_mixture = KappaMixture.from_trace(my_trace)
+    >>> for step in my_trace:
+    ...     my_mixture.apply_step(step)
+    >>> my_snap = my_mixture.to_snapshot()
+    >>> my_snap.get_total_mass() == my_mixture.get_number_of_agents()
+    True"""
+
+    def __init__(self, signatures: List[Dict[str, Any]], uuid: Optional[str] = None):
+        # type declarations
+        self._signatures: List[Dict[str, Any]] = signatures
+        self._uuid: Optional[str] = uuid
+        self._max_sites: int = max([len(signature['decl']) for signature in signatures] + [1])
+        self._agent_type: List[int] = []
+        self._internal_state: List[int] = []
+        self._bond_agent: List[int] = []
+        self._bond_site: List[int] = []
+        self._complex_of: List[int] = []
+        self._complex_members: Dict[int, Set[int]] = {}
+        self._next_complex_label: int = 0
+        self._agent_number: int = 0
+        self._event: int = 0
+        self._time: float = 0.0
+        self._step_number: int = 0
+        # names used when writing expressions
+        self._agent_names: List[str] = [signature['name'] for signature in signatures]
+        self._site_names: List[List[str]] = [[site['name'] for site in signature['decl']] for signature in signatures]
+        self._state_names: List[List[List[str]]] = [
+            [[state['name'] if isinstance(state, dict) else str(state) for state in (site['decl'][0] or [])]
+             for site in signature['decl']] for signature in signatures]
+
+    @classmethod
+    def from_trace(cls, trace: KappaTrace) -> 'KappaMixture':
+        """Returns an empty mixture with the signatures of the trace's model, ready to replay its steps."""
+        return cls(trace.get_signatures(), trace.get_trace_uuid())
+
+    def __repr__(self) -> str:
+        return 'KappaMixture of {} agents in {} complexes, at event {}'.format(
+            self._agent_number, len(self._complex_members), self._event)
+
+    # ### state queries
+    def get_number_of_agents(self) -> int:
+        """Returns the number of agents currently in the mixture."""
+        return self._agent_number
+
+    def get_number_of_complexes(self) -> int:
+        """Returns the number of complexes currently in the mixture."""
+        return len(self._complex_members)
+
+    def get_mixture_event(self) -> int:
+        """Returns the event number of the last step applied, or zero before the first timed step."""
+        return self._event
+
+    def get_mixture_time(self) -> float:
+        """Returns the simulation time of the last step applied, or zero before the first timed step."""
+        return self._time
+
+    def get_number_of_steps(self) -> int:
+        """Returns the number of trace steps applied so far."""
+        return self._step_number
+
+    def get_complex_sizes(self) -> List[int]:
+        """Returns the size of each complex, in no particular order."""
+        return [len(members) for members in self._complex_members.values()]
+
+    def get_largest_complex_size(self) -> int:
+        """Returns the size of the largest complex, or zero for an empty mixture."""
+        return max(self.get_complex_sizes(), default=0)
+
+    def _complex_label_of(self, agent_id: int) -> int:
+        """Returns the label of the complex of an agent; raises ValueError if the agent is not in the mixture, as it
+        was never created, or was removed."""
+        if not 0 <= agent_id < len(self._complex_of) or self._complex_of[agent_id] < 0:
+            raise ValueError('Agent {} not in mixture at event {}'.format(agent_id, self._event))
+        return self._complex_of[agent_id]
+
+    def get_complex_of_agent(self, agent_id: int) -> Set[int]:
+        """Returns the identifiers of the agents in the same complex as the given one, itself included."""
+        return set(self._complex_members[self._complex_label_of(agent_id)])
+
+    def get_complex_expression(self, agent_id: int, identifiers: bool = False) -> str:
+        """Returns the Kappa expression of the complex the given agent is in; see `to_snapshot_text` for
+        `identifiers`."""
+        return self._complex_expression(self._complex_members[self._complex_label_of(agent_id)], identifiers)
+
+    def get_partner(self, agent_id: int, site: int) -> Optional[Tuple[int, int]]:
+        """Returns the agent and site bound to the given site, or None if it is free."""
+        slot = agent_id * self._max_sites + site
+        return (self._bond_agent[slot], self._bond_site[slot]) if self._bond_agent[slot] >= 0 else None
+
+    # ### trace replay
+    def apply_step(self, step: Any) -> None:
+        """Applies a typed trace step, see `KappaTrace.iter_steps`: the actions of initial mixture, rule, and
+        perturbation steps; then takes the step's event number and time, if it has them."""
+        if isinstance(step, TraceInit):
+            for action in step.actions:
+                self.apply_action(action)
+        elif isinstance(step, (TraceRule, TracePert)):
+            for action in step.event.actions:
+                self.apply_action(action)
+        info = getattr(step, 'info', None)
+        if info is not None:
+            self._event, self._time = info.event, info.time
+        self._step_number += 1
+
+    def apply_action(self, action: TraceAction) -> None:
+        """Applies one trace action to the mixture."""
+        if action.kind == 'Create':
+            self._create(action.target.id, action.target.type, action.detail)
+        elif action.kind == 'Mod_internal':
+            self._internal_state[action.target.agent.id * self._max_sites + action.target.site] = action.detail
+        elif action.kind == 'Bind' or action.kind == 'Bind_to':
+            self._bind(action.target.agent.id, action.target.site, action.detail.agent.id, action.detail.site)
+        elif action.kind == 'Free':
+            self._free(action.target.agent.id, action.target.site)
+        elif action.kind == 'Remove':
+            self._remove(action.target.id)
+        else:
+            raise ValueError('Unknown trace action <{}>'.format(action.kind))
+
+    def _grow(self, agent_id: int) -> None:
+        """Extends the arrays, doubling them, so they can hold the given agent identifier."""
+        if agent_id < len(self._agent_type):
+            return
+        extra_agents = max(agent_id + 1, 2 * len(self._agent_type)) - len(self._agent_type)
+        self._agent_type.extend([-1] * extra_agents)
+        self._complex_of.extend([-1] * extra_agents)
+        self._internal_state.extend([-1] * extra_agents * self._max_sites)
+        self._bond_agent.extend([-1] * extra_agents * self._max_sites)
+        self._bond_site.extend([-1] * extra_agents * self._max_sites)
+
+    def _new_complex(self, members: Set[int]) -> int:
+        """Labels the given agents as a complex of their own; returns the label."""
+        label = self._next_complex_label
+        self._next_complex_label += 1
+        self._complex_members[label] = members
+        for agent_id in members:
+            self._complex_of[agent_id] = label
+        return label
+
+    def _create(self, agent_id: int, agent_type: int, sites: Tuple[Tuple[int, Optional[int]], ...]) -> None:
+        self._grow(agent_id)
+        if self._agent_type[agent_id] >= 0:
+            raise ValueError('Agent {} created, but already present'.format(agent_id))
+        self._agent_type[agent_id] = agent_type
+        first_slot = agent_id * self._max_sites
+        for slot in range(first_slot, first_slot + self._max_sites):
+            self._internal_state[slot] = -1
+            self._bond_agent[slot] = -1
+            self._bond_site[slot] = -1
+        for site, internal_state in sites:
+            if internal_state is not None:
+                self._internal_state[first_slot + site] = internal_state
+        self._new_complex({agent_id})
+        self._agent_number += 1
+
+    def _bind(self, agent_a: int, site_a: int, agent_b: int, site_b: int) -> None:
+        slot_a = agent_a * self._max_sites + site_a
+        slot_b = agent_b * self._max_sites + site_b
+        if self._bond_agent[slot_a] == agent_b and self._bond_site[slot_a] == site_b:
+            return  # already bound to each other
+        self._bond_agent[slot_a], self._bond_site[slot_a] = agent_b, site_b
+        self._bond_agent[slot_b], self._bond_site[slot_b] = agent_a, site_a
+        label_a, label_b = self._complex_of[agent_a], self._complex_of[agent_b]
+        if label_a == label_b:
+            return
+        # union: relabel the smaller complex
+        if len(self._complex_members[label_a]) < len(self._complex_members[label_b]):
+            label_a, label_b = label_b, label_a
+        absorbed = self._complex_members.pop(label_b)
+        for agent_id in absorbed:
+            self._complex_of[agent_id] = label_a
+        self._complex_members[label_a] |= absorbed
+
+    def _neighbors(self, agent_id: int) -> Iterator[int]:
+        """Yields the agents bound to the given one, once per bond."""
+        first_slot = agent_id * self._max_sites
+        for partner in self._bond_agent[first_slot:first_slot + self._max_sites]:
+            if partner >= 0:
+                yield partner
+
+    def _free(self, agent_id: int, site: int) -> None:
+        slot = agent_id * self._max_sites + site
+        partner, partner_site = self._bond_agent[slot], self._bond_site[slot]
+        if partner < 0:
+            return  # already free, e.g. when both ends of a bond are freed
+        self._bond_agent[slot] = self._bond_site[slot] = -1
+        partner_slot = partner * self._max_sites + partner_site
+        self._bond_agent[partner_slot] = self._bond_site[partner_slot] = -1
+        if partner == agent_id:
+            return
+        # split detection: grow both sides in turn; if they meet, the complex is whole, otherwise the side that runs
+        # out first is a new complex
+        visited = ({agent_id}, {partner})
+        frontiers = ([agent_id], [partner])
+        while frontiers[0] and frontiers[1]:
+            for side in (0, 1):
+                next_frontier = []
+                for current in frontiers[side]:
+                    for neighbor in self._neighbors(current):
+                        if neighbor in visited[1 - side]:
+                            return
+                        if neighbor not in visited[side]:
+                            visited[side].add(neighbor)
+                            next_frontier.append(neighbor)
+                frontiers[side][:] = next_frontier
+                if not next_frontier:
+                    break
+        split_side = visited[0] if not frontiers[0] else visited[1]
+        self._complex_members[self._complex_of[agent_id]] -= split_side
+        self._new_complex(split_side)
+
+    def _remove(self, agent_id: int) -> None:
+        first_slot = agent_id * self._max_sites
+        partners = set()
+        for slot in range(first_slot, first_slot + self._max_sites):
+            partner = self._bond_agent[slot]
+            if partner >= 0:
+                partner_slot = partner * self._max_sites + self._bond_site[slot]
+                self._bond_agent[partner_slot] = self._bond_site[partner_slot] = -1
+                self._bond_agent[slot] = self._bond_site[slot] = -1
+                if partner != agent_id:
+                    partners.add(partner)
+        label = self._complex_of[agent_id]
+        remaining = self._complex_members.pop(label)
+        remaining.discard(agent_id)
+        self._agent_type[agent_id] = -1
+        self._complex_of[agent_id] = -1
+        self._agent_number -= 1
+        # the rest of the complex may have fallen apart; label each piece reachable from a former partner
+        unassigned = set(remaining)
+        for partner in partners:
+            if partner not in unassigned:
+                continue
+            piece = {partner}
+            frontier = [partner]
+            while frontier:
+                frontier = [neighbor for current in frontier for neighbor in self._neighbors(current)
+                            if neighbor not in piece and not piece.add(neighbor)]
+            unassigned -= piece
+            self._new_complex(piece)
+
+    # ### output
+    def _agent_expression(self, agent_id: int, bond_labels: Dict[Tuple[int, int], int], identifiers: bool) -> str:
+        """Writes an agent, with its sites in signature order, numbering new bonds as they are found."""
+        agent_type = self._agent_type[agent_id]
+        site_expressions = []
+        for site, site_name in enumerate(self._site_names[agent_type]):
+            slot = agent_id * self._max_sites + site
+            partner = self._bond_agent[slot]
+            if partner < 0:
+                bond_expression = '[.]'
+            else:
+                bond_key = min((agent_id, site), (partner, self._bond_site[slot]))
+                if bond_key not in bond_labels:
+                    bond_labels[bond_key] = len(bond_labels) + 1
+                bond_expression = '[{}]'.format(bond_labels[bond_key])
+            state = self._internal_state[slot]
+            state_expression = '{{{}}}'.format(self._state_names[agent_type][site][state]) if state >= 0 else ''
+            site_expressions.append(site_name + bond_expression + state_expression)
+        return '{}{}({})'.format('x{}:'.format(agent_id) if identifiers else '', self._agent_names[agent_type],
+                                 ' '.join(site_expressions))
+
+    def _complex_expression(self, members: Set[int], identifiers: bool) -> str:
+        """Writes a complex, walking its bonds from its lowest agent identifier, so that bound agents are near."""
+        start = min(members)
+        order = [start]
+        seen = {start}
+        for current in order:
+            for neighbor in sorted(self._neighbors(current)):
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    order.append(neighbor)
+        bond_labels: Dict[Tuple[int, int], int] = {}
+        return ', '.join(self._agent_expression(agent_id, bond_labels, identifiers) for agent_id in order)
+
+    def _sorted_complexes(self, largest_only: bool = False) -> List[Set[int]]:
+        """Returns the complexes ordered by their lowest agent identifier, so output does not depend on labels; with
+        `largest_only`, only those of the largest size."""
+        complexes = self._complex_members.values()
+        if largest_only:
+            largest_size = self.get_largest_complex_size()
+            complexes = [members for members in complexes if len(members) == largest_size]
+        return sorted(complexes, key=min)
+
+    def get_species(self, largest_only: bool = False) -> List[Tuple[str, int, int]]:
+        """Returns the distinct species of the mixture, as tuples of their Kappa expression, size, and abundance.
+        Isomorphic complexes are counted together: monomers by their expression, larger complexes by their composition
+        and bonds, and an embedding test among those that agree. With `largest_only`, only the species of the largest
+        size are returned, which is much cheaper for mixtures with many mid-sized complexes."""
+        monomers: Dict[str, int] = {}
+        candidates: Dict[Tuple, List[List[Any]]] = {}
+        for members in self._sorted_complexes(largest_only):
+            expression = self._complex_expression(members, identifiers=False)
+            if len(members) == 1:
+                monomers[expression] = monomers.get(expression, 0) + 1
+                continue
+            # agents with their bond labels blanked, sorted, are the same for isomorphic complexes
+            invariant = tuple(sorted(self._agent_expression(agent_id, {}, False) for agent_id in members))
+            bucket = candidates.setdefault(invariant, [])
+            if len(bucket) == 0:
+                bucket.append([expression, None, 1])
+                continue
+            this_complex = KappaComplex(expression)
+            for entry in bucket:
+                if entry[1] is None:
+                    entry[1] = KappaComplex(entry[0])
+                if next(iter_embeddings(entry[1], this_complex), None) is not None:
+                    entry[2] += 1
+                    break
+            else:
+                bucket.append([expression, this_complex, 1])
+        species = [(expression, 1, abundance) for expression, abundance in monomers.items()]
+        for invariant, bucket in candidates.items():
+            species.extend((expression, len(invariant), abundance) for expression, _, abundance in bucket)
+        return species
+
+    def to_snapshot_text(self, identifiers: bool = False, largest_only: bool = False,
+                         snapshot_time: Optional[float] = None) -> str:
+        """Returns the mixture written as a KaSim snapshot file would be. With `identifiers`, agents carry their trace
+        identifier, e.g. `x12:A(b[.])`, and each complex is written on its own line. With `largest_only`, only the
+        largest complexes are written, enough for `KappaSnapshot.read_largest_complexes`. The time written is that of
+        the last step applied, unless a `snapshot_time` is given, e.g. when sampling the mixture at regular times."""
+        lines = ['// Snapshot [Event: {}]'.format(self._event),
+                 '// "uuid" : "{}"'.format(self._uuid if self._uuid is not None else '000000000'),
+                 '%def: "T0" "{}"'.format(repr(float(self._time if snapshot_time is None else snapshot_time))), '']
+        if identifiers:
+            for members in self._sorted_complexes(largest_only):
+                lines.append('%init: 1 /*{} agents*/ {}'.format(
+                    len(members), self._complex_expression(members, identifiers=True)))
+        else:
+            for expression, size, abundance in self.get_species(largest_only):
+                lines.append('%init: {} /*{} agents*/ {}'.format(abundance, size, expression))
+        return '\n'.join(lines) + '\n'
+
+    def to_snapshot(self, snapshot_name: Optional[str] = None, identifiers: bool = False,
+                    snapshot_time: Optional[float] = None) -> KappaSnapshot:
+        """Returns the mixture as a `KappaSnapshot`, named after the event if no name is given; see `to_snapshot_text`
+        for the other arguments."""
+        if snapshot_name is None:
+            snapshot_name = 'snap_{}.ka'.format(self._event)
+        return KappaSnapshot(snapshot_name, self.to_snapshot_text(identifiers, snapshot_time=snapshot_time))
+
+    # ### checkpoints
+    def save_checkpoint(self, checkpoint_file: Union[pathlib.Path, str], trace_offset: int = -1) -> None:
+        """Saves the state of the mixture to a NumPy archive, along with the byte offset in the trace of the next step
+        to apply, e.g. from `KappaTrace.iter_raw_steps`, so replay can resume from there."""
+        with open(checkpoint_file, 'wb') as cp_file:
+            np.savez(cp_file, agent_type=np.array(self._agent_type, dtype=np.int64),
+                     internal_state=np.array(self._internal_state, dtype=np.int64),
+                     bond_agent=np.array(self._bond_agent, dtype=np.int64),
+                     bond_site=np.array(self._bond_site, dtype=np.int64),
+                     counters=np.array([self._event, self._step_number, trace_offset], dtype=np.int64),
+                     time=np.array(self._time), uuid=str(self._uuid))
+
+    @classmethod
+    def load_checkpoint(cls, checkpoint_file: Union[pathlib.Path, str],
+                        trace: KappaTrace) -> Tuple['KappaMixture', int]:
+        """Restores a mixture saved by `save_checkpoint`, for the given trace; returns it along with the trace offset
+        from which to resume. Complexes are re-derived from the bonds."""
+        mixture = cls.from_trace(trace)
+        with np.load(checkpoint_file) as archive:
+            if str(archive['uuid']) != str(trace.get_trace_uuid()):
+                raise ValueError('Checkpoint {} is not of trace {}'.format(
+                    checkpoint_file, trace.get_trace_file_name()))
+            mixture._agent_type = archive['agent_type'].tolist()
+            mixture._internal_state = archive['internal_state'].tolist()
+            mixture._bond_agent = archive['bond_agent'].tolist()
+            mixture._bond_site = archive['bond_site'].tolist()
+            mixture._event, mixture._step_number, trace_offset = (int(value) for value in archive['counters'])
+            mixture._time = float(archive['time'])
+        mixture._complex_of = [-1] * len(mixture._agent_type)
+        for agent_id, agent_type in enumerate(mixture._agent_type):
+            if agent_type < 0 or mixture._complex_of[agent_id] >= 0:
+                continue
+            piece = {agent_id}
+            frontier = [agent_id]
+            while frontier:
+                frontier = [neighbor for current in frontier for neighbor in mixture._neighbors(current)
+                            if neighbor not in piece and not piece.add(neighbor)]
+            mixture._new_complex(piece)
+        mixture._agent_number = sum(1 for agent_type in mixture._agent_type if agent_type >= 0)
+        return mixture, trace_offset
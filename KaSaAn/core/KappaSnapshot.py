@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Contains the `KappaSnapshot` class, meant to represent a fully specified state of a reaction mixture."""
 
+import bisect
 import concurrent.futures as cofu
 import re
 import os
@@ -9,10 +10,10 @@ import networkx as nx
 import numpy as np
 import pathlib
 import xml.etree.ElementTree as ET
-from typing import List, Optional, Set, ItemsView, Dict, Tuple, Union
+from typing import Iterator, List, Optional, Set, ItemsView, Dict, Tuple, Union
 
 from .KappaMultiAgentGraph import KappaMultiAgentGraph
-from .KappaComplex import KappaComplex, embed_and_map
+from .KappaComplex import KappaComplex, NetMap, count_embeddings, iter_embeddings
 from .KappaAgent import KappaAgent, KappaToken
 from .KappaError import (
     SnapshotAgentParseError, SnapshotTokenParseError, SnapshotParseError, AgentParseError,
@@ -22,7 +23,9 @@ from .KappaError import (
 class KappaSnapshot(KappaMultiAgentGraph):
     """Class for representing Kappa snapshots. A snapshot contains a dictionary, where the kappa expression
      serves as the key, and the abundance serves as the value. Many of the methods for this class are simple re-namings
-     of the `Dict()` class', but with more informative names for Kappa entities."""
+     of the `Dict()` class', but with more informative names for Kappa entities. If the contents of the snapshot file
+     were already read, e.g. by a prefetching loader, they can be given as `raw_expression`, and the file is not opened
+     again."""
 
     # define pattern for the header
     _header_title_pat = r"//\sSnapshot\s\[Event:\s(\d+)\]"
@@ -33,13 +36,14 @@ class KappaSnapshot(KappaMultiAgentGraph):
     _header_pat_vr = re.compile(_header_title_pat + _header_t_zero_pat)
     # define pattern for a KappaComplex entry line
     _line_complex_re = re.compile(r'^(\d+)\s/\*(\d+)\sagents\*/\s(.+)$')
+    _line_size_re = re.compile(r'^(\d+)\s/\*(\d+)\sagents\*/')
     # define pattern for a KappaToken entry line
     _token_value_pat = r'((?:(?:\d+\.\d+)|(?:\d+\.)|(?:\.\d+)|(?:\d+))[eE]?[+-]?\d?)'
     _token_name_pat = r'([_~][a-zA-Z0-9_~+-]+|[a-zA-Z][a-zA-Z0-9_~+-]*)'
     _line_token_pat = r'^' + _token_value_pat + r'\s' + _token_name_pat + r'$'
     _line_token_re = re.compile(_line_token_pat)
 
-    def __init__(self, snapshot_file: Union[pathlib.Path, str]):
+    def __init__(self, snapshot_file: Union[pathlib.Path, str], raw_expression: Optional[str] = None):
         # type declarations
         self._file_name: str
         self._complexes: Dict[KappaComplex, int]
@@ -52,6 +56,17 @@ class KappaSnapshot(KappaMultiAgentGraph):
         self._snapshot_uuid: str
         self._snapshot_time: float
         self._total_mass: int = 0
+        self._agent_index: Optional[Dict[Tuple[str, str], Dict[Tuple[str, str], Dict[int, Set[int]]]]] = None
+        self._agent_type_index: Optional[Dict[str, Dict[int, Set[int]]]] = None
+        self._agent_index_complexes: List[KappaComplex] = []
+        self._size_buckets: Dict[int, List[KappaComplex]]
+        self._abundance_buckets: Dict[int, List[KappaComplex]]
+        self._sorted_sizes: List[int]
+        self._sorted_abundances: List[int]
+        self._complexes_by_mass: List[KappaComplex]
+        self._cumulative_size_weights: Dict[str, List[int]]
+        self._composition_matrix: Optional[
+            Tuple[List[KappaAgent], np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
         # initialization of structures
         if isinstance(snapshot_file, str):
             self._file_name = os.path.split(snapshot_file)[1]
@@ -65,25 +80,16 @@ class KappaSnapshot(KappaMultiAgentGraph):
         self._tokens = dict()
         self._known_sizes = []
         self._identifier_complex_map = {}
-        # read file into a single string
-        with open(snapshot_file, 'r') as kf:
-            self._raw_expression = kf.read()
+        # read file into a single string, unless its contents were already read, e.g. by a prefetching loader
+        if raw_expression is None:
+            with open(snapshot_file, 'r') as kf:
+                self._raw_expression = kf.read()
+        else:
+            self._raw_expression = raw_expression
         # remove newlines, split by "%init:" keyword
         digest: List[str] = self._raw_expression.replace('\n', '').split('%init: ')
         # parse header and get event, uuid, time
-        g = self._header_pat_re.match(digest[0])
-        if g:
-            self._snapshot_event = int(g.group(1))
-            self._snapshot_uuid = str(g.group(2))
-            self._snapshot_time = float(g.group(3))
-        if not g:
-            g = self._header_pat_vr.match(digest[0])
-            if g:
-                self._snapshot_event = int(g.group(1))
-                self._snapshot_uuid = ''
-                self._snapshot_time = float(g.group(2))
-            if not g:
-                raise SnapshotParseError('File {} contains unparseable header:\n{}'.format(self._file_name, digest[0]))
+        self._snapshot_event, self._snapshot_uuid, self._snapshot_time = self._parse_header(digest[0], self._file_name)
 
         # parse the complexes into instances of KappaComplexes, get their abundance, cross-check their size
         for entry in digest[1:]:
@@ -128,6 +134,8 @@ class KappaSnapshot(KappaMultiAgentGraph):
             pass    # empty dictionaries evaluate to False; no idents means no checking
         elif len(self._identifier_complex_map) != self._total_mass:
             raise RuntimeError('Mismatch! Found {} identifiers, but {} total agent mass'.format(len(self._identifier_complex_map), self._total_mass))
+        # index the species by size and by abundance
+        self._build_species_index()
         # canonicalize the kappa expression: tokens
         self._kappa_expression = '\n'.join(['%init: ' + str(float(tk.get_token_operation())) + ' ' + tk.get_token_name()
                                             for tk in self._tokens.values()])
@@ -136,6 +144,95 @@ class KappaSnapshot(KappaMultiAgentGraph):
         self._kappa_expression += '\n'.join(['%init: ' + str(self._complexes[cx]) + ' ' + str(cx)
                                              for cx in self._complexes.keys()])
 
+    @classmethod
+    def _parse_header(cls, header: str, file_name: str) -> Tuple[int, str, float]:
+        """Returns the event, UUID (empty if absent), and time, declared in a snapshot header stripped of newlines."""
+        g = cls._header_pat_re.match(header)
+        if g:
+            return int(g.group(1)), str(g.group(2)), float(g.group(3))
+        g = cls._header_pat_vr.match(header)
+        if g:
+            return int(g.group(1)), '', float(g.group(2))
+        raise SnapshotParseError('File {} contains unparseable header:\n{}'.format(file_name, header))
+
+    @classmethod
+    def read_header(cls, snapshot_file: Union[pathlib.Path, str]) -> Tuple[int, str, float]:
+        """Returns the event, UUID (empty if absent), and time of a snapshot file, reading only its header; the
+        complexes are not parsed. Useful to index a long series of snapshots by time.
+        >>> from KaSaAn.core import KappaSnapshot
+        >>> KappaSnapshot.read_header('models/kite_snap.ka')
+        (1, '000000000', 1.0)"""
+        header_lines = []
+        with open(snapshot_file, 'r') as kf:
+            for line in kf:
+                if line.startswith('%init: '):
+                    break
+                header_lines.append(line.replace('\n', ''))
+        return cls._parse_header(''.join(header_lines), str(snapshot_file))
+
+    @classmethod
+    def read_largest_complexes(cls, snapshot_file: Union[pathlib.Path, str], raw_expression: Optional[str] = None
+                               ) -> Tuple[float, List[Tuple[KappaComplex, int]]]:
+        """Returns the time of a snapshot file, and a list of its largest complexes with their abundance, as
+        `get_largest_complexes` would, but without parsing the rest: only the declared size of each complex is read,
+        and only the lines of the largest size are parsed. For a gelled mixture, where the giant component is one line
+        among many, this is far cheaper than creating the `KappaSnapshot`. As with the constructor, the contents of the
+        file can be given as `raw_expression`, if already read.
+        >>> from KaSaAn.core import KappaSnapshot
+        >>> KappaSnapshot.read_largest_complexes('models/kite_snap.ka')[1][0][0].get_size_of_complex()
+        7"""
+        if raw_expression is None:
+            with open(snapshot_file, 'r') as kf:
+                raw_expression = kf.read()
+        digest: List[str] = raw_expression.replace('\n', '').split('%init: ')
+        _, _, snapshot_time = cls._parse_header(digest[0], str(snapshot_file))
+        max_size = 0
+        largest_entries: List[str] = []
+        for entry in digest[1:]:
+            g = cls._line_size_re.match(entry)
+            if not g:
+                continue    # token lines
+            size = int(g.group(2))
+            if size > max_size:
+                max_size = size
+                largest_entries = [entry]
+            elif size == max_size:
+                largest_entries.append(entry)
+        largest_complexes: Dict[KappaComplex, int] = {}
+        for entry in largest_entries:
+            g = cls._line_complex_re.match(entry)
+            if not g:
+                raise SnapshotAgentParseError(
+                    'Abundance, length, & complex not found in file {}, line said:\n{}'.format(snapshot_file, entry))
+            species = KappaComplex(g.group(3))
+            if not max_size == species.get_size_of_complex():
+                raise ValueError('Size mismatch: snapshot {} declares {}, I counted {} for species {}'.format(
+                    snapshot_file, max_size, species.get_size_of_complex(), species))
+            largest_complexes[species] = int(g.group(1))
+        return snapshot_time, list(largest_complexes.items())
+
+    def _build_species_index(self) -> None:
+        """Buckets the complexes by size and by abundance, keeping snapshot order within each bucket, and pre-sorts the
+        distinct keys, the complexes by mass, and the cumulative weights per size used for percentile queries."""
+        self._size_buckets = {}
+        self._abundance_buckets = {}
+        for cx, cx_ab in self._complexes.items():
+            self._size_buckets.setdefault(cx.get_size_of_complex(), []).append(cx)
+            self._abundance_buckets.setdefault(cx_ab, []).append(cx)
+        self._sorted_sizes = sorted(self._size_buckets.keys())
+        self._sorted_abundances = sorted(self._abundance_buckets.keys())
+        self._complexes_by_mass = sorted(self._complexes.keys(),
+                                         key=lambda cx: cx.get_size_of_complex() * self._complexes[cx], reverse=True)
+        self._cumulative_size_weights = {'species': [], 'abundance': [], 'mass': []}
+        running = {'species': 0, 'abundance': 0, 'mass': 0}
+        for size in self._sorted_sizes:
+            bucket_abundance = sum(self._complexes[cx] for cx in self._size_buckets[size])
+            running['species'] += len(self._size_buckets[size])
+            running['abundance'] += bucket_abundance
+            running['mass'] += bucket_abundance * size
+            for weight, total in running.items():
+                self._cumulative_size_weights[weight].append(total)
+
     def get_snapshot_file_name(self) -> str:
         """Returns a string with the name of the file this snapshot came from."""
         return self._file_name
@@ -182,17 +279,103 @@ class KappaSnapshot(KappaMultiAgentGraph):
         """Returns an integer with the total mass of the snapshot, measured in number of agents."""
         return self._total_mass
 
+    def build_agent_index(self) -> None:
+        """Builds, in one pass over the snapshot, an inverted index of agent signatures: for each agent type and site,
+        the internal state and bond class (`.` free, `_` bound, `#` unspecified) found there map to the complexes
+        carrying it, and within each complex, to the positions of the agents that do; the multiplicity of a signature in
+        a complex is the size of that set. Once built, `get_abundance_of_agent`, `get_complexes_with_agent`, and the
+        pattern methods consult the index instead of walking every agent of every complex. Rebuilding is harmless."""
+        self._agent_index = {}
+        self._agent_type_index = {}
+        self._agent_index_complexes = self.get_all_complexes()
+        for cx_ix, cx in enumerate(self._agent_index_complexes):
+            for ag_ix, agent in enumerate(cx.get_all_agents()):
+                agent_name = agent.get_agent_name()
+                self._agent_type_index.setdefault(agent_name, {}).setdefault(cx_ix, set()).add(ag_ix)
+                for port in agent.get_agent_ports():
+                    bond_state = port.get_port_current_bond()
+                    bond_class = bond_state if bond_state in ['.', '#'] else '_'
+                    site_entries = self._agent_index.setdefault((agent_name, port.get_port_name()), {})
+                    signature_entries = site_entries.setdefault((port.get_port_current_state(), bond_class), {})
+                    signature_entries.setdefault(cx_ix, set()).add(ag_ix)
+
+    def _get_indexed_agent_candidates(self, query_agent: KappaAgent,
+                                      relax_bonds: bool = False) -> Tuple[Dict[int, Set[int]], bool]:
+        """Returns a dictionary of complex positions to the positions of agents therein that may satisfy the query
+        agent, taken from the agent index, and whether that is exact. Specific bond identifiers, typed bonds, and
+        counters are not indexed; the index then yields a superset, narrowed only to bound sites. With `relax_bonds`,
+        the query's specific bonds are read as the bound class `_`, as a pattern agent sees them."""
+        exact = not query_agent._agent_counters
+        candidates = {cx_ix: set(ag_set)
+                      for cx_ix, ag_set in self._agent_type_index.get(query_agent.get_agent_name(), {}).items()}
+        for q_port in query_agent.get_agent_ports():
+            q_state = q_port.get_port_current_state()
+            q_bond = q_port.get_port_current_bond()
+            if q_bond not in ['.', '_', '#']:
+                exact = exact and relax_bonds
+                q_bond = '_'
+            port_matches: Dict[int, Set[int]] = {}
+            site_entries = self._agent_index.get((query_agent.get_agent_name(), q_port.get_port_name()), {})
+            for (t_state, t_bond), signature_entries in site_entries.items():
+                if (q_state == '#' or q_state == t_state) and (q_bond == '#' or q_bond == t_bond):
+                    for cx_ix, ag_set in signature_entries.items():
+                        port_matches.setdefault(cx_ix, set()).update(ag_set)
+            candidates = {cx_ix: ag_set & port_matches[cx_ix]
+                          for cx_ix, ag_set in candidates.items() if cx_ix in port_matches}
+            candidates = {cx_ix: ag_set for cx_ix, ag_set in candidates.items() if ag_set}
+        return candidates, exact
+
+    def _get_candidate_complexes(self, query_complex: KappaComplex) -> List[KappaComplex]:
+        """Returns the complexes that could host the query complex, in snapshot order. Without an agent index, that is
+        all of them; with one, only those that carry every agent of the query, with bonds read as bound sites. For
+        each such complex, the matching positions of the query's first agent are the start-node candidates an embedding
+        would need, so complexes where any agent finds none are skipped whole."""
+        if self._agent_index is None:
+            return self.get_all_complexes()
+        candidate_ixs: Optional[Set[int]] = None
+        for q_agent in query_complex.get_all_agents():
+            agent_candidates, _ = self._get_indexed_agent_candidates(q_agent, relax_bonds=True)
+            candidate_ixs = set(agent_candidates) if candidate_ixs is None else candidate_ixs & set(agent_candidates)
+        return [self._agent_index_complexes[cx_ix] for cx_ix in sorted(candidate_ixs)]
+
     def get_abundance_of_agent(self, query_agent) -> int:
         """Returns an integer with the abundance of the given agent. Supports passing a string with the agent
-        expression, or an instance of a KappaAgent. Supports passing agents with signature, e.g. `Bob(site{state})`."""
+        expression, or an instance of a KappaAgent. Supports passing agents with signature, e.g. `Bob(site{state})`.
+        Uses the agent index, if built; see `build_agent_index`."""
         if not isinstance(query_agent, KappaAgent):
             query_agent = KappaAgent(query_agent)
         abundance = 0
+        if self._agent_index is not None:
+            candidates, exact = self._get_indexed_agent_candidates(query_agent)
+            for cx_ix, ag_set in candidates.items():
+                cx = self._agent_index_complexes[cx_ix]
+                if exact:
+                    intra_cx_ab = len(ag_set)
+                else:
+                    intra_cx_ab = sum(1 for ag_ix in ag_set if query_agent in cx.get_all_agents()[ag_ix])
+                abundance += intra_cx_ab * self._complexes[cx]
+            return abundance
         for cx, cx_ab in self.get_all_complexes_and_abundances():
             intra_cx_ab = cx.get_number_of_embeddings_of_agent(query_agent)
             abundance += intra_cx_ab * cx_ab
         return abundance
 
+    def get_complexes_with_agent(self, query_agent) -> List[KappaComplex]:
+        """Returns a list of `KappaComplexes` that contain at least one copy of the given agent, in snapshot order.
+        Supports passing a string with the agent expression, or an instance of a KappaAgent, with or without signature.
+        Uses the agent index, if built; see `build_agent_index`."""
+        if not isinstance(query_agent, KappaAgent):
+            query_agent = KappaAgent(query_agent)
+        if self._agent_index is None:
+            return [cx for cx in self.get_all_complexes() if cx.get_number_of_embeddings_of_agent(query_agent)]
+        candidates, exact = self._get_indexed_agent_candidates(query_agent)
+        result_complexes = []
+        for cx_ix in sorted(candidates):
+            cx = self._agent_index_complexes[cx_ix]
+            if exact or any(query_agent in cx.get_all_agents()[ag_ix] for ag_ix in candidates[cx_ix]):
+                result_complexes.append(cx)
+        return result_complexes
+
     def get_abundance_of_pattern(self, query_pattern, multi_thread: bool = False) -> Tuple[int, int]:
         """
 Returns the number of times the pattern appears in the query, both the raw embedding number as well as
@@ -217,102 +400,162 @@ markedly slower performance with multi-threading than without. Case-specific, yo
         if isinstance(query_pattern, KappaAgent):
             return tuple([self.get_abundance_of_agent(query_pattern)] * 2)
         elif isinstance(query_pattern, KappaComplex):
-            abundances_all = np.zeros(len(self.get_all_complexes()))
-            abundances_unique = np.zeros(len(self.get_all_complexes()))
+            candidate_complexes = self._get_candidate_complexes(query_pattern)
+            abundances_all = np.zeros(len(candidate_complexes), dtype=int)
+            abundances_unique = np.zeros(len(candidate_complexes), dtype=int)
+            # automorphisms of the query are computed once, here, rather than by each worker
+            query_pattern._automorphism_count_is_exact()
             if not multi_thread:
-                for ka_index, ka_details in enumerate(self.get_all_complexes_and_abundances()):
-                    map_all, map_unique = embed_and_map(query_pattern, ka_details[0])
-                    abundances_all[ka_index] += len(map_all) * ka_details[1]
-                    abundances_unique[ka_index] += len(map_unique) * ka_details[1]
+                for ka_index, ka_complex in enumerate(candidate_complexes):
+                    count_all, count_unique = count_embeddings(query_pattern, ka_complex)
+                    abundances_all[ka_index] += count_all * self._complexes[ka_complex]
+                    abundances_unique[ka_index] += count_unique * self._complexes[ka_complex]
             else:
-                map_inputs = zip([query_pattern] * len(self.get_all_complexes()), self.get_all_complexes())
-                maps_all = []
-                maps_unique = []
                 with cofu.ThreadPoolExecutor() as executor:
-                    jobs_submitted = {executor.submit(embed_and_map, *map_input): map_input for map_input in map_inputs}
+                    jobs_submitted = {executor.submit(count_embeddings, query_pattern, ka_complex): ka_index
+                                      for ka_index, ka_complex in enumerate(candidate_complexes)}
                     for job in cofu.as_completed(jobs_submitted):
-                        input_used = jobs_submitted[job]
+                        ka_index = jobs_submitted[job]
                         try:
-                            data = job.result()
+                            count_all, count_unique = job.result()
                         except Exception as exc:
-                            print('{} generated an exception: {}'.format(input_used, exc))
+                            print('{} generated an exception: {}'.format(candidate_complexes[ka_index], exc))
                         else:
-                            maps_all.append(data[0])
-                            maps_unique.append(data[1])
-                abundances_all = [len(item) for item in maps_all]
-                abundances_unique = [len(item) for item in maps_unique]
-                abundances_all *= np.array(self.get_all_abundances())
-                abundances_unique *= np.array(self.get_all_abundances())
+                            abundances_all[ka_index] = count_all
+                            abundances_unique[ka_index] = count_unique
+                candidate_abundances = np.array([self._complexes[ka_complex] for ka_complex in candidate_complexes],
+                                                dtype=int)
+                abundances_all *= candidate_abundances
+                abundances_unique *= candidate_abundances
             return np.sum(abundances_all, dtype=int), np.sum(abundances_unique, dtype=int)
         else:
             raise ValueError('Expected string, KappaAgent, or KappaComplex, got {}'.format(type(query_pattern)))
 
+    def iter_pattern_matches(self, query_pattern, unique: bool = False) -> Iterator[Tuple[KappaComplex, int, NetMap]]:
+        """Yields, one at a time, tuples of a complex from the snapshot, its abundance, and a mapping of the query
+        pattern into that complex. Mappings are produced lazily, complex by complex, via `iter_embeddings`; with
+        `unique`, only the automorphism-corrected mappings are yielded. Supports passing a string with the pattern's
+        expression, a KappaAgent, or a KappaComplex.
+        >>> from KaSaAn.core import KappaSnapshot
+        >>> my_snap = KappaSnapshot('models/kite_snap.ka')
+        >>> sum(abundance for _, abundance, _ in my_snap.iter_pattern_matches('A(a[1]), A(b[1])'))
+        12"""
+        if isinstance(query_pattern, KappaAgent):
+            query_pattern = KappaComplex(str(query_pattern))
+        elif not isinstance(query_pattern, KappaComplex):
+            try:
+                query_pattern = KappaComplex(query_pattern)
+            except ComplexParseError:
+                raise ValueError('Could not parse input <{}> as KappaAgent nor KappaComplex'.format(query_pattern))
+        for cx in self._get_candidate_complexes(query_pattern):
+            for mapping in iter_embeddings(query_pattern, cx, unique=unique):
+                yield cx, self._complexes[cx], mapping
+
+    def composition_matrix(self) -> Tuple[List[KappaAgent], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the agent types present, sorted, and four NumPy arrays, aligned with the snapshot's complexes (i.e.
+        in the order of `get_all_complexes`): an integer matrix of species by agent type, where each row counts the
+        agents of each type in that complex, and the vectors of abundance, size, and mass of each complex. Built once,
+        then cached. Aggregates become single vectorized operations, e.g. the whole-snapshot composition is
+        `matrix.T @ abundances`, and the mass carried per complex is `sizes * abundances`.
+        >>> from KaSaAn.core import KappaSnapshot
+        >>> my_snap = KappaSnapshot('models/dimerization_with_tokens_snap.ka')
+        >>> agent_types, matrix, abundances, sizes, masses = my_snap.composition_matrix()
+        >>> matrix.T @ abundances
+        array([500])"""
+        if self._composition_matrix is None:
+            agent_types = sorted(self.get_agent_types_present())
+            type_index = {agent_type: type_ix for type_ix, agent_type in enumerate(agent_types)}
+            matrix = np.zeros((len(self._complexes), len(agent_types)), dtype=int)
+            for cx_ix, cx in enumerate(self._complexes.keys()):
+                for agent_type, agent_count in cx.get_complex_composition().items():
+                    matrix[cx_ix, type_index[agent_type]] = agent_count
+            abundances = np.array(self.get_all_abundances(), dtype=int)
+            sizes = np.sum(matrix, axis=1, dtype=int)
+            self._composition_matrix = (agent_types, matrix, abundances, sizes, sizes * abundances)
+        return self._composition_matrix
+
     def get_composition(self) -> Dict[KappaAgent, int]:
         """Return a dictionary where the keys are `KappaAgents`, the types and their abundance in the snapshot. This is
         akin to the sum formula of the snapshot."""
-        agent_types = self.get_agent_types_present()
-        composition = dict(zip(agent_types, [0] * len(agent_types)))
-        for agent_type in agent_types:
-            for kappa_complex, abundance in self.get_all_complexes_and_abundances():
-                complex_composition = kappa_complex.get_complex_composition()
-                local_abundance = complex_composition[agent_type] if agent_type in complex_composition else 0
-                composition[agent_type] += abundance * local_abundance
-        return composition
+        agent_types, matrix, abundances, _, _ = self.composition_matrix()
+        return dict(zip(agent_types, (int(type_abundance) for type_abundance in matrix.T @ abundances)))
 
     def get_complexes_with_abundance(self, query_abundance: int) -> List[KappaComplex]:
         """Returns a list of `KappaComplexes` present in the snapshot at the queried abundance. For example, get all
         elements present in single copy."""
-        result_complexes = []
-        for complex_expression, complex_abundance in self._complexes.items():
-            if query_abundance == complex_abundance:
-                result_complexes.append(complex_expression)
-        return result_complexes
+        return list(self._abundance_buckets.get(query_abundance, []))
 
     def get_complexes_of_size(self, query_size: int) -> List[Tuple[KappaComplex, int]]:
         """Returns a list tuples, with complexes and their abundance, for complexes that are of the query size. For
         example, get all the dimers and their respective abundances."""
-        result_complexes = []
-        for comp, abun in self.get_all_complexes_and_abundances():
-            if query_size == comp.get_size_of_complex():
-                result_complexes.append((comp, abun))
-        return result_complexes
+        return [(cx, self._complexes[cx]) for cx in self._size_buckets.get(query_size, [])]
+
+    def get_complexes_in_size_range(self, min_size: int, max_size: int) -> List[Tuple[KappaComplex, int]]:
+        """Returns a list of tuples, with complexes and their abundance, for complexes whose size lies between the
+        bounds, inclusive. Sorted by increasing size; complexes of the same size are in snapshot order."""
+        first_ix = bisect.bisect_left(self._sorted_sizes, min_size)
+        last_ix = bisect.bisect_right(self._sorted_sizes, max_size)
+        return [(cx, self._complexes[cx])
+                for size in self._sorted_sizes[first_ix:last_ix] for cx in self._size_buckets[size]]
+
+    def get_top_complexes(self, k: int, by: str = 'size') -> List[Tuple[KappaComplex, int]]:
+        """Returns a list of tuples, with up to `k` complexes and their abundance, ranked by decreasing `size`, `mass`
+        (size times abundance), or `abundance`. Ties are broken by snapshot order."""
+        if by == 'mass':
+            return [(cx, self._complexes[cx]) for cx in self._complexes_by_mass[:k]]
+        elif by == 'size':
+            sorted_keys, buckets = self._sorted_sizes, self._size_buckets
+        elif by == 'abundance':
+            sorted_keys, buckets = self._sorted_abundances, self._abundance_buckets
+        else:
+            raise ValueError('Expected ranking by size, mass, or abundance; got <{}>'.format(by))
+        top_complexes = []
+        for key in reversed(sorted_keys):
+            if len(top_complexes) >= k:
+                break
+            top_complexes.extend(buckets[key][:k - len(top_complexes)])
+        return [(cx, self._complexes[cx]) for cx in top_complexes]
+
+    def get_size_at_percentile(self, percentile: float, weight: str = 'abundance') -> int:
+        """Returns the smallest complex size at or below which the requested percentage of the snapshot is found. What
+        is being counted is set by `weight`: complexes by `abundance`, agents by `mass`, or distinct `species`. E.g. the
+        50th percentile by mass is the size of complex a random agent is equally likely to be in, or in one smaller.
+        Raises a `ValueError` for snapshots without complexes, e.g. of only tokens, as they have no sizes."""
+        if not self._sorted_sizes:
+            raise ValueError('Snapshot {} has no complexes, so no size at percentile {}'.format(
+                self.get_snapshot_file_name(), percentile))
+        if not 0 <= percentile <= 100:
+            raise ValueError('Percentile must be between 0 and 100, got {}'.format(percentile))
+        if weight not in self._cumulative_size_weights:
+            raise ValueError('Expected weighting by species, abundance, or mass; got <{}>'.format(weight))
+        cumulative_weights = self._cumulative_size_weights[weight]
+        target = percentile / 100 * cumulative_weights[-1]
+        return self._sorted_sizes[bisect.bisect_left(cumulative_weights, target)]
 
     def get_largest_complexes(self) -> List[Tuple[KappaComplex, int]]:
         """Returns a list of KappaComplexes of the largest size, measured in number of constituting agents, along with
         their abundance in the snapshot."""
-        max_known_size = max(self._known_sizes)
-        return self.get_complexes_of_size(max_known_size)
+        return self.get_complexes_of_size(self._sorted_sizes[-1])
 
     def get_smallest_complexes(self) -> List[Tuple[KappaComplex, int]]:
         """Returns a list of KappaComplexes with the smallest complexes, measured in number of constituting agents,
         along with their abundance in the snapshot."""
-        min_known_size = min(self._known_sizes)
-        return self.get_complexes_of_size(min_known_size)
+        return self.get_complexes_of_size(self._sorted_sizes[0])
 
     def get_most_abundant_complexes(self) -> List[KappaComplex]:
         """Returns the list of complexes found to be the most abundant. These could be the monomers for example."""
-        max_abundance = max(self.get_all_abundances())
-        return self.get_complexes_with_abundance(max_abundance)
+        return self.get_complexes_with_abundance(self._sorted_abundances[-1])
 
     def get_least_abundant_complexes(self) -> List[KappaComplex]:
         """Returns the list of complexes found to be the least abundant. For example, this would be the giant component,
         or the set of largest entities."""
-        min_abundance = min(self.get_all_abundances())
-        return self.get_complexes_with_abundance(min_abundance)
+        return self.get_complexes_with_abundance(self._sorted_abundances[0])
 
     def get_size_distribution(self) -> Dict[int, int]:
         """Returns a dictionary where the key is the size of a complex and the value is the amount of complexes with
         that size. For example, `{1:3, 4:5}` indicates the mixture contains only three monomers and five tetramers.
         Dictionary is sorted by increasing complex size."""
-        size_dist = dict()
-        for complex_expression, complex_abundance in self.get_all_complexes_and_abundances():
-            current_size = complex_expression.get_size_of_complex()
-            if current_size in size_dist:
-                size_dist[current_size] += complex_abundance
-            else:
-                size_dist[current_size] = complex_abundance
-        sorted_dist = dict(sorted(size_dist.items(), key=lambda item: item[0]))
-        return sorted_dist
+        return {size: sum(self._complexes[cx] for cx in self._size_buckets[size]) for size in self._sorted_sizes}
 
     def get_all_tokens_and_values(self) -> Dict[str, float]:
         """Returns a dictionary with the tokens present in the snapshot in the form of `[name]:[value]`."""
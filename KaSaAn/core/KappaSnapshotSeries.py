@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Contains the `KappaSnapshotSeries` class, meant to represent the ordered set of snapshots of a simulation."""
+
+import bisect
+import pathlib
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple, Union
+
+from .KappaSnapshot import KappaSnapshot
+
+
+class KappaSnapshotSeries:
+    """Class for representing a series of Kappa snapshots, e.g. those a simulation wrote into a directory. On creation,
+    only the header of each snapshot is read, to index the series by time; snapshots are parsed on access, and the
+    most recently used ones are kept in memory, up to `cache_size` of them, so memory stays bounded however long the
+    series. Supports indexing by position, forward slicing and striding (which return series sharing the same cache),
+    iteration, and look-up by simulation time. The series is ordered by snapshot time, ties broken by name.
+    >>> from KaSaAn.core import KappaSnapshotSeries
+    >>> my_series = KappaSnapshotSeries('models/time_series', 'snap_*.ka', cache_size=2)
+    >>> len(my_series)
+    6
+    >>> my_series[-1].get_snapshot_event()
+    600
+    >>> [snap.get_snapshot_event() for snap in my_series[::2]]
+    [100, 300, 500]"""
+
+    def __init__(self, directory: Union[pathlib.Path, str] = '.', pattern: str = 'snap*.ka', cache_size: int = 8):
+        # type declarations
+        self._snapshot_names: List[str]
+        self._snapshot_times: List[float]
+        self._snapshot_events: List[int]
+        self._cache: 'OrderedDict[str, KappaSnapshot]'
+        self._cache_size: int
+        if cache_size < 0:
+            raise ValueError('Cache size must be zero or positive, got {}'.format(cache_size))
+        # core does not depend on functions at import time
+        from ..functions.find_snapshot_names import find_snapshot_names
+        snapshot_names = find_snapshot_names(target_directory=directory, name_pattern=pattern)
+        headers = [KappaSnapshot.read_header(snap_name) for snap_name in snapshot_names]
+        order = sorted(range(len(snapshot_names)), key=lambda ix: headers[ix][2])
+        self._snapshot_names = [snapshot_names[ix] for ix in order]
+        self._snapshot_times = [headers[ix][2] for ix in order]
+        self._snapshot_events = [headers[ix][0] for ix in order]
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+    def __len__(self) -> int:
+        return len(self._snapshot_names)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[KappaSnapshot, 'KappaSnapshotSeries']:
+        if isinstance(key, slice):
+            # sub-series stay in time order, which look-up by time relies on
+            if key.step is not None and key.step < 0:
+                raise ValueError('Series are ordered by time; slices must step forward, got step {}'.format(key.step))
+            return self._sub_series(range(len(self))[key])
+        return self._load(self._snapshot_names[key])
+
+    def __iter__(self) -> Iterator[KappaSnapshot]:
+        for snap_name in self._snapshot_names:
+            yield self._load(snap_name)
+
+    def __repr__(self) -> str:
+        return 'KappaSnapshotSeries of {} snapshots, times {} to {}'.format(
+            len(self), self._snapshot_times[0] if self else None, self._snapshot_times[-1] if self else None)
+
+    def _sub_series(self, positions: range) -> 'KappaSnapshotSeries':
+        """Returns a series of the snapshots at the given positions, sharing this series' cache."""
+        sub_series = KappaSnapshotSeries.__new__(KappaSnapshotSeries)
+        sub_series._snapshot_names = [self._snapshot_names[ix] for ix in positions]
+        sub_series._snapshot_times = [self._snapshot_times[ix] for ix in positions]
+        sub_series._snapshot_events = [self._snapshot_events[ix] for ix in positions]
+        sub_series._cache = self._cache
+        sub_series._cache_size = self._cache_size
+        return sub_series
+
+    def _load(self, snap_name: str) -> KappaSnapshot:
+        """Returns the parsed snapshot, from the cache if present; keeps the cache to its size, evicting the least
+        recently used snapshot."""
+        if snap_name in self._cache:
+            self._cache.move_to_end(snap_name)
+            return self._cache[snap_name]
+        snap = KappaSnapshot(snap_name)
+        if self._cache_size > 0:
+            self._cache[snap_name] = snap
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return snap
+
+    def get_snapshot_names(self) -> List[str]:
+        """Returns a list with the file names of the snapshots in the series, in series order."""
+        return list(self._snapshot_names)
+
+    def get_snapshot_times(self) -> List[float]:
+        """Returns a list with the times of the snapshots in the series, read from their headers."""
+        return list(self._snapshot_times)
+
+    def get_snapshot_events(self) -> List[int]:
+        """Returns a list with the event numbers of the snapshots in the series, read from their headers."""
+        return list(self._snapshot_events)
+
+    def get_index_nearest_to_time(self, query_time: float) -> int:
+        """Returns the position of the snapshot whose time is closest to the query time; ties go to the earlier."""
+        if not self._snapshot_times:
+            raise IndexError('Empty series has no snapshot near time {}'.format(query_time))
+        ix_after = bisect.bisect_left(self._snapshot_times, query_time)
+        if ix_after == 0:
+            return 0
+        if ix_after == len(self._snapshot_times):
+            return ix_after - 1
+        if query_time - self._snapshot_times[ix_after - 1] <= self._snapshot_times[ix_after] - query_time:
+            return ix_after - 1
+        return ix_after
+
+    def get_indexes_bracketing_time(self, query_time: float) -> Tuple[Optional[int], Optional[int]]:
+        """Returns the positions of the last snapshot at or before the query time, and of the first snapshot at or after
+        it; the same position twice if a snapshot was taken at that time, and `None` where no such snapshot exists."""
+        ix_before = bisect.bisect_right(self._snapshot_times, query_time) - 1
+        ix_after = bisect.bisect_left(self._snapshot_times, query_time)
+        return (ix_before if ix_before >= 0 else None,
+                ix_after if ix_after < len(self._snapshot_times) else None)
+
+    def get_snapshot_nearest_to_time(self, query_time: float) -> KappaSnapshot:
+        """Returns the snapshot whose time is closest to the query time."""
+        return self[self.get_index_nearest_to_time(query_time)]
+
+    def get_snapshots_bracketing_time(self, query_time: float) -> Tuple[Optional[KappaSnapshot],
+                                                                        Optional[KappaSnapshot]]:
+        """Returns the last snapshot at or before the query time, and the first at or after it, or `None` for those
+        that do not exist."""
+        ix_before, ix_after = self.get_indexes_bracketing_time(query_time)
+        return (self[ix_before] if ix_before is not None else None,
+                self[ix_after] if ix_after is not None else None)
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""Contains the `KappaTrace` class, a streaming reader of the trace files written by KaSim, e.g. <t.json>, along with
+the typed records of the steps, events, actions, and tests found in them."""
+
+import codecs
+import json
+import numpy as np
+import os
+import pathlib
+import re
+import warnings
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from .KappaError import TraceParseError
+
+
+class TraceAgent(NamedTuple):
+    """An agent instance: its unique identifier in the mixture, and the index of its type in the signature."""
+    id: int
+    type: int
+
+
+class TraceQuark(NamedTuple):
+    """A site of an agent instance, by the index of the site in its agent's signature."""
+    agent: TraceAgent
+    site: int
+
+
+class TraceAction(NamedTuple):
+    """A change to the mixture. The `kind` is one of the trace's action names, which determines the rest:
+    `Create`: target is the new agent, detail the tuple of its sites as (site, internal state or None);
+    `Mod_internal`: target is the quark, detail the new internal state;
+    `Bind`, `Bind_to`: target is one quark, detail the other;
+    `Free`: target is the quark, no detail;
+    `Remove`: target is the agent, no detail."""
+    kind: str
+    target: Union[TraceAgent, TraceQuark]
+    detail: Any = None
+
+
+class TraceTest(NamedTuple):
+    """A condition on the mixture checked by an event. The `kind` is one of the trace's test names: `Is_here` on an
+    agent; `Has_Internal` on a quark, with the internal state as detail; `Is_Free` and `Is_Bound` on a quark;
+    `Has_Binding_type` on a quark, with the (agent type, site) of the partner as detail; `Is_Bound_to` on a quark, with
+    the partner quark as detail."""
+    kind: str
+    target: Union[TraceAgent, TraceQuark]
+    detail: Any = None
+
+
+class TraceEvent(NamedTuple):
+    """What an event tested and did: the tests, grouped per agent of the rule; the actions; the quarks whose partner was
+    freed as a side effect, with their binding state before, and the quarks freed by those side effects; and the tests
+    of connectivity."""
+    tests: List[List[TraceTest]]
+    actions: List[TraceAction]
+    side_effects_src: List[Tuple[TraceQuark, Any]]
+    side_effects_dst: List[TraceQuark]
+    connectivity_tests: List[TraceTest]
+
+
+class TraceInfo(NamedTuple):
+    """When a step happened: the story identifier, the simulation time, the event number, and any profiling data."""
+    story_id: int
+    time: float
+    event: int
+    profiling: Any
+
+
+class TraceSubs(NamedTuple):
+    """Step substituting one agent identifier for another."""
+    source: int
+    target: int
+
+
+class TraceRule(NamedTuple):
+    """Step applying a rule, by its index among the model's elementary rules."""
+    rule_id: int
+    event: TraceEvent
+    info: TraceInfo
+
+
+class TracePert(NamedTuple):
+    """Step applying a perturbation, e.g. a `%mod`."""
+    name: str
+    event: TraceEvent
+    info: TraceInfo
+
+
+class TraceInit(NamedTuple):
+    """Step creating part of the initial mixture, e.g. an `%init`."""
+    actions: List[TraceAction]
+
+
+class TraceObs(NamedTuple):
+    """Step recording that an observable, e.g. a tracked pattern, was seen."""
+    name: str
+    tests: List[List[TraceTest]]
+    info: TraceInfo
+
+
+class TraceDummy(NamedTuple):
+    """Step carrying only a message."""
+    message: str
+
+
+class TraceCheckpoint(NamedTuple):
+    """A position in a trace from which reading can resume: the number of steps before it, the byte offset of its step,
+    and the event number and simulation time reached just before that step."""
+    step: int
+    offset: int
+    event: int
+    time: float
+
+
+class _JsonStream:
+    """Buffered reader of a JSON document, from a binary file, that decodes one value at a time with `raw_decode`, and
+    keeps track of the byte offset of its position in the file. Only the unconsumed part of the buffer is kept."""
+
+    _whitespace_re = re.compile(r'\s*')
+    _separator_re = re.compile(r'[\s,]*')
+
+    def __init__(self, binary_file: BinaryIO, offset: int, chunk_size: int):
+        self._file = binary_file
+        self._file.seek(offset)
+        self._offset = offset
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._position = 0
+        self._exhausted = False
+
+    def _fill(self) -> bool:
+        """Reads more of the file into the buffer, at least as much as is already buffered, so long values are read in
+        a number of steps logarithmic in their length; returns False if at the end of the file."""
+        if self._exhausted:
+            return False
+        self._buffer = self._buffer[self._position:]
+        self._position = 0
+        chunk = self._file.read(max(self._chunk_size, len(self._buffer)))
+        self._buffer += self._decoder.decode(chunk, final=not chunk)
+        self._exhausted = not chunk
+        return True
+
+    def _advance(self, position: int) -> None:
+        """Moves to the given position of the buffer, counting the bytes passed."""
+        passed = self._buffer[self._position:position]
+        self._offset += len(passed) if passed.isascii() else len(passed.encode('utf-8'))
+        self._position = position
+
+    def offset(self) -> int:
+        """Returns the byte offset, in the file, of the current position."""
+        return self._offset
+
+    def skip(self, separators: bool = False) -> None:
+        """Moves past whitespace, and, if requested, also commas."""
+        pattern = self._separator_re if separators else self._whitespace_re
+        while True:
+            self._advance(pattern.match(self._buffer, self._position).end())
+            if self._position < len(self._buffer) or not self._fill():
+                return
+
+    def peek(self) -> Optional[str]:
+        """Returns the character at the current position, or None at the end of the file."""
+        while self._position >= len(self._buffer):
+            if not self._fill():
+                return None
+        return self._buffer[self._position]
+
+    def take(self, expected: str) -> None:
+        """Moves past the expected character; raises a `TraceParseError` if another is found."""
+        found = self.peek()
+        if found != expected:
+            raise TraceParseError('Expected <{}> at byte {}, found <{}>'.format(expected, self._offset, found))
+        self._advance(self._position + 1)
+
+    def decode(self) -> Any:
+        """Decodes the JSON value at the current position, reading more of the file as needed, and moves past it."""
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError as err:
+                if self._fill():
+                    continue
+                raise TraceParseError('Could not decode a value at byte {}: {}'.format(self._offset, err))
+            # a value that runs to the end of the buffer may have been cut short, e.g. a number
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._advance(end)
+            return value
+
+
+class KappaTrace:
+    """Class for reading the trace files written by KaSim. On creation, only the header is read: the UUID, the `dict`
+    that describes the compact encoding of the steps, and the `model`. Steps are then decoded one at a time, as typed
+    records, e.g. `TraceRule`, so memory stays bounded however long the trace. Each iteration re-reads the file from its
+    first step, unless started from a checkpoint: with an index of byte offsets, built once by `build_index` and kept
+    in a sidecar file, reading can resume near any event or time, see `get_checkpoint`.
+    >>> from KaSaAn.core import KappaTrace
+    >>> my_trace = KappaTrace('models/trace_viz/t.json')
+    >>> my_trace.get_agent_names()
+    ['A', 'B', 'C']
+    >>> first_rule = next(step for step in my_trace if type(step).__name__ == 'TraceRule')
+    >>> my_trace.get_rule_name(first_rule.rule_id), first_rule.event.actions[0]
+    ('/', TraceAction(kind='Create', target=TraceAgent(id=200, type=1), detail=((0, None), (1, None))))"""
+
+    def __init__(self, trace_file: Union[pathlib.Path, str], chunk_size: int = 1 << 20):
+        # type declarations
+        self._file_name: str
+        self._chunk_size: int
+        self._uuid: Optional[str]
+        self._dict: Dict[str, Any]
+        self._model: Dict[str, Any]
+        self._first_step_offset: Optional[int] = None
+        self._index: Optional[Dict[str, np.ndarray]] = None
+        self._file_name = str(trace_file)
+        self._chunk_size = chunk_size
+        # read the header, up to the opening of the list of steps
+        header: Dict[str, Any] = {}
+        with open(self._file_name, 'rb') as tf:
+            stream = _JsonStream(tf, 0, chunk_size)
+            stream.skip()
+            stream.take('{')
+            while True:
+                stream.skip(separators=True)
+                if stream.peek() == '}':
+                    break
+                key = stream.decode()
+                stream.skip()
+                stream.take(':')
+                stream.skip()
+                if key == 'trace':
+                    stream.take('[')
+                    self._first_step_offset = stream.offset()
+                    break
+                header[key] = stream.decode()
+        if 'dict' not in header:
+            raise TraceParseError('No <dict> found before the steps of trace {}'.format(self._file_name))
+        self._uuid = header.get('uuid')
+        self._dict = header['dict']
+        self._model = header.get('model', {})
+        # positions of the fields of the compact encoding
+        self._agent_ix = (self._dict['agent']['id'], self._dict['agent']['type'])
+        self._quark_ix = (self._dict['quark']['agent'], self._dict['quark']['site'])
+        self._binding_type_ix = (self._dict['binding_type']['type'], self._dict['binding_type']['site'])
+        self._event_ix = tuple(self._dict['event'][field] for field in
+                               ['tests', 'actions', 'side_effect_src', 'side_effect_dst', 'connectivity_tests'])
+        self._info_ix = tuple(self._dict['simulation_info'][field] for field in ['id', 'time', 'event', 'profiling'])
+        self._step_names: List[str] = self._dict['step']
+        self._action_names: List[str] = self._dict['actions']
+        self._test_names: List[str] = self._dict['test']
+        self._binding_state_names: List[str] = self._dict['binding_state']
+
+    def __iter__(self) -> Iterator[Union[TraceSubs, TraceRule, TracePert, TraceInit, TraceObs, TraceDummy]]:
+        return self.iter_steps()
+
+    def __repr__(self) -> str:
+        return 'KappaTrace("{}")'.format(self._file_name)
+
+    def get_trace_file_name(self) -> str:
+        """Returns the name of the trace file."""
+        return self._file_name
+
+    def get_trace_uuid(self) -> Optional[str]:
+        """Returns the UUID of the simulation that wrote the trace."""
+        return self._uuid
+
+    def get_dict(self) -> Dict[str, Any]:
+        """Returns the raw `dict` of the trace, describing the compact encoding of its steps."""
+        return self._dict
+
+    def get_model(self) -> Dict[str, Any]:
+        """Returns the raw `model` of the trace, as compiled by KaSim: signatures, rules, observables, etc."""
+        return self._model
+
+    def get_signatures(self) -> List[Dict[str, Any]]:
+        """Returns the raw agent signatures of the model; agent types in steps are indexes into this list."""
+        return self._model['update']['signatures']
+
+    def get_agent_names(self) -> List[str]:
+        """Returns the names of the agent types, in the order of their index."""
+        return [signature['name'] for signature in self.get_signatures()]
+
+    def get_agent_name(self, agent_type: int) -> str:
+        """Returns the name of an agent type, given its index."""
+        return self.get_signatures()[agent_type]['name']
+
+    def get_site_name(self, agent_type: int, site: int) -> str:
+        """Returns the name of a site, given the index of its agent type, and its index in the signature."""
+        return self.get_signatures()[agent_type]['decl'][site]['name']
+
+    def get_internal_state_name(self, agent_type: int, site: int, internal_state: int) -> str:
+        """Returns the name of an internal state, given the indexes of its agent type, site, and state."""
+        return self.get_signatures()[agent_type]['decl'][site]['decl'][0][internal_state]['name']
+
+    def _syntactic_rule_name(self, syntactic_rule: int) -> str:
+        """Returns the label of a rule of the model, numbered from one; unlabeled rules are named `rule_<number>`."""
+        rule_label = self._model['ast_rules'][syntactic_rule - 1][0]
+        return rule_label if rule_label is not None else 'rule_{}'.format(syntactic_rule)
+
+    def get_rule_name(self, rule_id: int) -> str:
+        """Returns the name of the rule, or its label, that an elementary rule of a `TraceRule` step comes from; rules
+        without a label are named after their number in the model, as `rule_<number>`, numbered from one."""
+        return self._syntactic_rule_name(self._model['elementary_rules'][rule_id]['syntactic_rule'])
+
+    def get_rule_names(self) -> List[str]:
+        """Returns the names of the rules, or their labels, in the order of the model's rules; see `get_rule_name`."""
+        return [self._syntactic_rule_name(ix + 1) for ix in range(len(self._model['ast_rules']))]
+
+    def iter_raw_steps(self, start_offset: Optional[int] = None) -> Iterator[Tuple[int, list]]:
+        """Yields each step, as its raw JSON list, preceded by its byte offset in the file. Starts at the first step, or
+        at the given byte offset, which must be that of a step, e.g. one yielded before. A trace that ends before the
+        list of steps is closed, e.g. one still being written, yields its complete steps, then warns."""
+        if self._first_step_offset is None:
+            return
+        with open(self._file_name, 'rb') as tf:
+            stream = _JsonStream(tf, self._first_step_offset if start_offset is None else start_offset,
+                                 self._chunk_size)
+            while True:
+                stream.skip(separators=True)
+                next_char = stream.peek()
+                if next_char == ']':
+                    return
+                if next_char is None:
+                    warnings.warn('Trace {} ended before its list of steps was closed'.format(self._file_name))
+                    return
+                step_offset = stream.offset()
+                try:
+                    step = stream.decode()
+                except TraceParseError:
+                    warnings.warn('Trace {} ended within a step, at byte {}'.format(self._file_name, step_offset))
+                    return
+                yield step_offset, step
+
+    def iter_steps(self, start_offset: Optional[int] = None
+                   ) -> Iterator[Union[TraceSubs, TraceRule, TracePert, TraceInit, TraceObs, TraceDummy]]:
+        """Yields each step as a typed record, see `iter_raw_steps` for the optional starting offset."""
+        for _, raw_step in self.iter_raw_steps(start_offset):
+            yield self.decode_step(raw_step)
+
+    def iter_rule_firings(self, start_offset: Optional[int] = None) -> Iterator[Tuple[int, int, float]]:
+        """Yields, for each rule step, its elementary rule, event number, and time, without decoding its tests and
+        actions; see `iter_raw_steps` for the optional starting offset."""
+        rule_code = self._step_names.index('Rule')
+        event_ix, time_ix = self._info_ix[2], self._info_ix[1]
+        for _, raw_step in self.iter_raw_steps(start_offset):
+            if raw_step[0] == rule_code:
+                yield raw_step[1], raw_step[3][event_ix], raw_step[3][time_ix]
+
+    def _get_step_info(self, raw_step: list) -> Optional[list]:
+        """Returns the raw simulation info of a step, for those kinds of step that have one."""
+        if self._step_names[raw_step[0]] in ('Rule', 'Pert', 'Obs'):
+            return raw_step[3]
+        return None
+
+    def _default_index_file(self) -> str:
+        return self._file_name + '.idx.npz'
+
+    def build_index(self, every: int = 10000, index_file: Optional[Union[pathlib.Path, str]] = None) -> None:
+        """Reads the whole trace once, recording a checkpoint every so many steps: the step number, the byte offset of
+        the step, and the event number and time reached before it. The checkpoints are saved to a sidecar file, by
+        default the trace's name followed by `.idx.npz`, and used by `get_checkpoint`. Steps before the first timed one,
+        e.g. those of the initial mixture, are at event 0 and time minus infinity."""
+        if every < 1:
+            raise ValueError('Checkpoints must be at least one step apart, got {}'.format(every))
+        trace_size = os.path.getsize(self._file_name)
+        event_ix, time_ix = self._info_ix[2], self._info_ix[1]
+        checkpoints: List[Tuple[int, int, int, float]] = []
+        current_event, current_time = 0, float('-inf')
+        for step_number, (step_offset, raw_step) in enumerate(self.iter_raw_steps()):
+            if step_number % every == 0:
+                checkpoints.append((step_number, step_offset, current_event, current_time))
+            raw_info = self._get_step_info(raw_step)
+            if raw_info is not None:
+                current_event, current_time = raw_info[event_ix], raw_info[time_ix]
+        steps, offsets, events, times = zip(*checkpoints) if checkpoints else ([], [], [], [])
+        self._index = {'steps': np.array(steps, dtype=np.int64), 'offsets': np.array(offsets, dtype=np.int64),
+                       'events': np.array(events, dtype=np.int64), 'times': np.array(times, dtype=float)}
+        with open(self._default_index_file() if index_file is None else index_file, 'wb') as idx_file:
+            np.savez(idx_file, **self._index, every=every, trace_size=trace_size, uuid=str(self._uuid))
+
+    def load_index(self, index_file: Optional[Union[pathlib.Path, str]] = None) -> bool:
+        """Loads the checkpoints saved by `build_index`; returns whether an index was found that belongs to this trace:
+        same UUID, and a trace at least as large as when indexed, so an index of a trace still being written remains
+        valid for the steps it covers."""
+        index_file = self._default_index_file() if index_file is None else index_file
+        if not os.path.exists(index_file):
+            return False
+        with np.load(index_file) as archive:
+            if str(archive['uuid']) != str(self._uuid) or int(archive['trace_size']) > os.path.getsize(self._file_name):
+                return False
+            self._index = {key: archive[key] for key in ['steps', 'offsets', 'events', 'times']}
+        return True
+
+    def get_checkpoint(self, time: Optional[float] = None, event: Optional[int] = None) -> TraceCheckpoint:
+        """Returns the last checkpoint at or before the given simulation time, or event number, from which
+        `iter_steps(checkpoint.offset)` replays the trace onwards; reaching the state at that time then takes at most
+        the number of steps between checkpoints. Loads the sidecar index if needed; without one, returns the start of
+        the trace."""
+        if (time is None) == (event is None):
+            raise ValueError('Expected exactly one of time or event')
+        if self._index is None and not self.load_index():
+            return TraceCheckpoint(0, self._first_step_offset, 0, float('-inf'))
+        keys = self._index['times'] if event is None else self._index['events']
+        checkpoint_ix = max(int(np.searchsorted(keys, time if event is None else event, side='right')) - 1, 0)
+        return TraceCheckpoint(int(self._index['steps'][checkpoint_ix]), int(self._index['offsets'][checkpoint_ix]),
+                               int(self._index['events'][checkpoint_ix]), float(self._index['times'][checkpoint_ix]))
+
+    def decode_step(self, raw_step: list) -> Union[TraceSubs, TraceRule, TracePert, TraceInit, TraceObs, TraceDummy]:
+        """Decodes a raw step, as read from the trace, into its typed record."""
+        step_kind = self._step_names[raw_step[0]]
+        if step_kind == 'Rule':
+            return TraceRule(raw_step[1], self._decode_event(raw_step[2]), self._decode_info(raw_step[3]))
+        elif step_kind == 'Init':
+            return TraceInit([self._decode_action(raw_action) for raw_action in raw_step[1]])
+        elif step_kind == 'Obs':
+            return TraceObs(raw_step[1], [[self._decode_test(raw_test) for raw_test in agent_tests]
+                                          for agent_tests in raw_step[2]], self._decode_info(raw_step[3]))
+        elif step_kind == 'Pert':
+            return TracePert(raw_step[1], self._decode_event(raw_step[2]), self._decode_info(raw_step[3]))
+        elif step_kind == 'Subs':
+            return TraceSubs(raw_step[1], raw_step[2])
+        elif step_kind == 'Dummy':
+            return TraceDummy(raw_step[1])
+        raise TraceParseError('Unknown step kind <{}> in trace {}'.format(step_kind, self._file_name))
+
+    def _decode_agent(self, raw_agent: list) -> TraceAgent:
+        return TraceAgent(raw_agent[self._agent_ix[0]], raw_agent[self._agent_ix[1]])
+
+    def _decode_quark(self, raw_quark: list) -> TraceQuark:
+        return TraceQuark(self._decode_agent(raw_quark[self._quark_ix[0]]), raw_quark[self._quark_ix[1]])
+
+    def _decode_binding_state(self, raw_state: Any) -> Any:
+        """Binding states are either a bare name, or a name with the binding type or the quark it refers to."""
+        if isinstance(raw_state, int):
+            return self._binding_state_names[raw_state]
+        if isinstance(raw_state, list) and raw_state and isinstance(raw_state[0], int):
+            state_name = self._binding_state_names[raw_state[0]]
+            if state_name == 'BOUND_TYPE':
+                return state_name, (raw_state[1][self._binding_type_ix[0]], raw_state[1][self._binding_type_ix[1]])
+            elif state_name == 'BOUND_to':
+                return state_name, self._decode_quark(raw_state[1])
+            return state_name
+        return raw_state
+
+    def _decode_action(self, raw_action: list) -> TraceAction:
+        kind = self._action_names[raw_action[0]]
+        if kind == 'Create':
+            return TraceAction(kind, self._decode_agent(raw_action[1]),
+                               tuple((site, internal) for site, internal in raw_action[2]))
+        elif kind == 'Mod_internal':
+            return TraceAction(kind, self._decode_quark(raw_action[1]), raw_action[2])
+        elif kind == 'Bind' or kind == 'Bind_to':
+            return TraceAction(kind, self._decode_quark(raw_action[1]), self._decode_quark(raw_action[2]))
+        elif kind == 'Free':
+            return TraceAction(kind, self._decode_quark(raw_action[1]))
+        elif kind == 'Remove':
+            return TraceAction(kind, self._decode_agent(raw_action[1]))
+        raise TraceParseError('Unknown action <{}> in trace {}'.format(kind, self._file_name))
+
+    def _decode_test(self, raw_test: list) -> TraceTest:
+        kind = self._test_names[raw_test[0]]
+        if kind == 'Is_here':
+            return TraceTest(kind, self._decode_agent(raw_test[1]))
+        elif kind == 'Has_Internal':
+            return TraceTest(kind, self._decode_quark(raw_test[1]), raw_test[2])
+        elif kind == 'Is_Free' or kind == 'Is_Bound':
+            return TraceTest(kind, self._decode_quark(raw_test[1]))
+        elif kind == 'Has_Binding_type':
+            return TraceTest(kind, self._decode_quark(raw_test[1]),
+                             (raw_test[2][self._binding_type_ix[0]], raw_test[2][self._binding_type_ix[1]]))
+        elif kind == 'Is_Bound_to':
+            return TraceTest(kind, self._decode_quark(raw_test[1]), self._decode_quark(raw_test[2]))
+        raise TraceParseError('Unknown test <{}> in trace {}'.format(kind, self._file_name))
+
+    def _decode_event(self, raw_event: list) -> TraceEvent:
+        tests_ix, actions_ix, src_ix, dst_ix, connectivity_ix = self._event_ix
+        return TraceEvent(
+            [[self._decode_test(raw_test) for raw_test in agent_tests] for agent_tests in raw_event[tests_ix]],
+            [self._decode_action(raw_action) for raw_action in raw_event[actions_ix]],
+            [(self._decode_quark(raw_quark), self._decode_binding_state(raw_state))
+             for raw_quark, raw_state in raw_event[src_ix]],
+            [self._decode_quark(raw_quark) for raw_quark in raw_event[dst_ix]],
+            [self._decode_test(raw_test) for raw_test in raw_event[connectivity_ix]])
+
+    def _decode_info(self, raw_info: Optional[list]) -> Optional[TraceInfo]:
+        if raw_info is None:
+            return None
+        return TraceInfo(*(raw_info[field_ix] for field_ix in self._info_ix))
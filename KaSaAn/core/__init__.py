@@ -3,15 +3,18 @@
 """This is the core API. These sub-modules contain the classes used to analyze Kappa expressions."""
 
 from .KappaSnapshot import KappaSnapshot
-from .KappaComplex import KappaComplex, NetMap, embed_and_map
+from .KappaSnapshotSeries import KappaSnapshotSeries
+from .KappaComplex import KappaComplex, NetMap, embed_and_map, iter_embeddings, count_embeddings
 from .KappaBond import KappaBond
 from .KappaAgent import KappaAgent, KappaToken
 from .KappaSite import KappaPort, KappaCounter
 from .KappaContactMap import KappaContactMap
 from .KappaRule import KappaRule
+from .KappaTrace import KappaTrace
+from .KappaMixture import KappaMixture
 
-__all__ = ['KappaSnapshot',
-           'KappaComplex', 'NetMap', 'embed_and_map',
+__all__ = ['KappaSnapshot', 'KappaSnapshotSeries',
+           'KappaComplex', 'NetMap', 'embed_and_map', 'iter_embeddings', 'count_embeddings',
            'KappaBond', 'KappaAgent', 'KappaToken',
            'KappaCounter', 'KappaPort',
-           'KappaContactMap']
+           'KappaContactMap', 'KappaTrace', 'KappaMixture']
@@ -4,12 +4,26 @@
  sub-module)."""
 
 from .agent_color_assignment import colorize_observables, sanity_check_agent_colors
-from .catalytic_potential import get_potential_of_folder
+from .catalytic_potential import get_potential_of_folder, get_colocalization_of_snapshot, get_colocalization_of_folder, \
+    collect_potentials_of_folder, potentials_from_results
 from .find_snapshot_names import find_snapshot_names
 from .numerical_sort import numerical_sort
-from .observable_plotter import observable_file_reader, observable_list_axis_annotator
-from .observable_coplotter import observable_coplot_axis_annotator, _multi_data_axis_annotator
+from .observable_downsampler import downsample_methods, downsample_series, lttb_downsample, minmax_downsample
+from .observable_ensemble import reduce_observable_ensemble, write_ensemble_summary, read_ensemble_summary, \
+    ensemble_summary_axis_annotator
+from .observable_plotter import observable_file_reader, observable_list_axis_annotator, observable_file_legend, \
+    observable_columns_needed, observable_file_time_span
+from .observable_coplotter import observable_coplot_axis_annotator, _multi_data_axis_annotator, align_replicates, \
+    common_time_grid
+from .rule_activity import rule_activity_of_trace
+from .snapshot_prefetch import prefetch_snapshot_files
+from .snapshot_results_store import load_cached_results, store_results, parse_shard, select_shard, \
+    write_partial_results, merge_partial_results
+from .snapshot_summarizer import summarize_snapshot, summarize_snapshots, write_summary
 from .snapshot_visualizer_patchwork import render_snapshot_as_patchwork
 from .snapshot_visualizer_network import render_snapshot_as_plain_graph
 from .snapshot_visualizer_subcomponent import render_complexes_as_plain_graph
-from .trace_movie_maker import movie_from_snapshots
+from .trace_movie_maker import movie_from_snapshots, movie_from_snapshots_streaming, movie_from_snapshots_parallel, \
+    movie_from_trace
+from .trace_query import parse_trace_query, run_trace_query
+from .trace_replay import iter_trace_samples, scan_trace
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
+import json
+import numpy as np
 import warnings
-from typing import List, Tuple
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 from ..core import KappaSnapshot, KappaAgent
 from .find_snapshot_names import find_snapshot_names
+from .numerical_sort import numerical_sort
+from .snapshot_prefetch import prefetch_snapshot_files
+from .snapshot_results_store import load_cached_results, select_shard, store_results
 
 
 def _get_potential_of_snapshot(snapshot, enzyme, substrate) -> int:
@@ -24,7 +30,16 @@ def _get_potential_of_snapshot(snapshot, enzyme, substrate) -> int:
     if substrate not in snapshot.get_agent_types_present():
         warnings.warn(
             'Agent name <' + substrate.get_agent_name() + '> + not in <' + snapshot.get_snapshot_file_name() + '>')
-    # Iterate over each complex and calculate its catalytic potential, q
+    # Bare agent types are read off the composition matrix, as one vectorized product
+    agent_types, matrix, abundances, _, _ = snapshot.composition_matrix()
+    if not enzyme.get_agent_signature() and not substrate.get_agent_signature():
+        type_index = {agent_type.get_agent_name(): type_ix for type_ix, agent_type in enumerate(agent_types)}
+        if enzyme.get_agent_name() not in type_index or substrate.get_agent_name() not in type_index:
+            return 0
+        e = matrix[:, type_index[enzyme.get_agent_name()]]
+        s = matrix[:, type_index[substrate.get_agent_name()]]
+        return int(np.sum(e * s * abundances))
+    # Otherwise, iterate over each complex and calculate its catalytic potential, q
     cat_pot = 0
     for mol_spec, ab in snapshot.get_all_complexes_and_abundances():
         e = mol_spec.get_number_of_embeddings_of_agent(enzyme)
@@ -33,9 +48,64 @@ def _get_potential_of_snapshot(snapshot, enzyme, substrate) -> int:
     return cat_pot
 
 
-def get_potential_of_folder(base_directory: str, enzyme: KappaAgent, substrate: KappaAgent,
-                            verbosity: bool, snap_name_pattern: str) -> List[Tuple[int, float]]:
-    """See file under `KaSaAn.scripts` for usage."""
+def get_colocalization_of_snapshot(snapshot, patterns: Optional[List[KappaAgent]] = None
+                                   ) -> Tuple[List[KappaAgent], np.ndarray]:
+    """Generalizes the catalytic potential to all pairs at once. With C the matrix of species by agent (the count of
+    each agent in each species) and a the vector of species abundances, the co-localization matrix is C.T diag(a) C:
+    entry (i, j) is the catalytic potential of agent i as enzyme and agent j as substrate. Agents are the agent types
+    of the snapshot, or the given single-agent patterns, e.g. `Bob(s{ph})`. Returns the agents, and the matrix."""
+    if not type(snapshot) is KappaSnapshot:
+        snapshot = KappaSnapshot(snapshot)
+    if patterns is None:
+        agents, matrix, abundances, _, _ = snapshot.composition_matrix()
+    else:
+        agents = [pattern if type(pattern) is KappaAgent else KappaAgent(pattern) for pattern in patterns]
+        abundances = np.array(snapshot.get_all_abundances(), dtype=int)
+        matrix = np.array([[mol_spec.get_number_of_embeddings_of_agent(agent) for agent in agents]
+                           for mol_spec in snapshot.get_all_complexes()], dtype=int).reshape(-1, len(agents))
+    return agents, matrix.T @ (matrix * abundances[:, np.newaxis])
+
+
+def get_colocalization_of_folder(base_directory: str, verbosity: bool, snap_name_pattern: str,
+                                 patterns: Optional[List[KappaAgent]] = None
+                                 ) -> Tuple[List[KappaAgent], List[float], np.ndarray]:
+    """Co-localization matrices, see `get_colocalization_of_snapshot`, for each snapshot in a folder. Returns the
+    agents, the snapshot times, and an array of snapshots by agents by agents. Without patterns, the agents are the
+    union of the agent types seen across the series, sorted; types absent from a snapshot contribute zeros."""
+    snap_names = find_snapshot_names(base_directory, name_pattern=snap_name_pattern)
+    snap_num = len(snap_names)
+    if verbosity:
+        print('Found {} snapshots in {}'.format(snap_num, base_directory))
+    snap_times = []
+    snap_matrices = []
+    for snap_index, (snap_name, snap_text) in enumerate(prefetch_snapshot_files(snap_names)):
+        if verbosity:
+            print('Now parsing file <{}>, {} of {}, {:.2%}'.format(
+                snap_name, snap_index, snap_num, snap_index/snap_num))
+        snap = KappaSnapshot(snap_name, snap_text)
+        snap_times.append(snap.get_snapshot_time())
+        snap_matrices.append(get_colocalization_of_snapshot(snap, patterns))
+    # align the per-snapshot agent lists onto their union
+    if patterns is None:
+        all_agents = sorted(set(agent for agents, _ in snap_matrices for agent in agents))
+    else:
+        all_agents = [pattern if type(pattern) is KappaAgent else KappaAgent(pattern) for pattern in patterns]
+    agent_index = {agent: agent_ix for agent_ix, agent in enumerate(all_agents)}
+    colocalization = np.zeros((snap_num, len(all_agents), len(all_agents)), dtype=int)
+    for snap_index, (agents, matrix) in enumerate(snap_matrices):
+        ixs = [agent_index[agent] for agent in agents]
+        colocalization[snap_index][np.ix_(ixs, ixs)] = matrix
+    return all_agents, snap_times, colocalization
+
+
+def collect_potentials_of_folder(base_directory: str, enzyme: KappaAgent, substrate: KappaAgent,
+                                 verbosity: bool, snap_name_pattern: str,
+                                 cache_file: Optional[Union[str, Path]] = None,
+                                 shard: Optional[Tuple[int, int]] = None) -> Dict[str, List[float]]:
+    """Collect stage of `get_potential_of_folder`: returns a dictionary of snapshot names to their catalytic potential
+    and time, in snapshot order. With a `cache_file`, per-snapshot results are kept in that results store, and only new
+    or modified snapshots are parsed. With a `shard`, as `(index, number)`, only the snapshots of that shard are
+    analyzed, see `select_shard`; the result can be saved as partial results, see `write_partial_results`."""
     # Get the file names of snapshots in specified directory
     snap_names = find_snapshot_names(base_directory, name_pattern=snap_name_pattern)
     snap_num = len(snap_names)
@@ -43,14 +113,53 @@ def get_potential_of_folder(base_directory: str, enzyme: KappaAgent, substrate:
         print('Found {} snapshots in {}'.format(snap_num, base_directory))
     if snap_num < 2:
         warnings.warn('Found less than two snapshots.')
-    # Iterate over the files and calculate each's catalytic potential
-    cat_pot_dist = []
-    for snap_index, snap_name in enumerate(snap_names):
+    if shard is not None:
+        snap_names = select_shard(snap_names, *shard)
+        snap_num = len(snap_names)
+        if verbosity:
+            print('Shard {}/{} has {} snapshots'.format(shard[0], shard[1], snap_num))
+    # Skip the files whose potential is already known
+    if cache_file is not None:
+        cached_potentials, names_to_parse, file_keys = load_cached_results(
+            cache_file, snap_names, 'catalytic_potential', _potential_parameters(enzyme, substrate))
+        if verbosity:
+            print('Found {} of {} snapshots in results store {}'.format(len(cached_potentials), snap_num, cache_file))
+    else:
+        cached_potentials, names_to_parse = {}, snap_names
+    # Iterate over the files, read ahead in the background, and calculate each's catalytic potential
+    new_potentials = {}
+    for snap_index, (snap_name, snap_text) in enumerate(prefetch_snapshot_files(names_to_parse)):
         if verbosity:
             print('Now parsing file <{}>, {} of {}, {:.2%}'.format(
-                snap_name, snap_index, snap_num, snap_index/snap_num))
-        snap = KappaSnapshot(snap_name)
+                snap_name, snap_index, len(names_to_parse), snap_index/len(names_to_parse)))
+        snap = KappaSnapshot(snap_name, snap_text)
         q = _get_potential_of_snapshot(snap, enzyme, substrate)
         t = snap.get_snapshot_time()
-        cat_pot_dist.append([q, t])
-    return cat_pot_dist
+        new_potentials[snap_name] = [q, t]
+    if cache_file is not None and new_potentials:
+        store_results(cache_file, new_potentials, 'catalytic_potential', _potential_parameters(enzyme, substrate),
+                      file_keys)
+    return {snap_name: cached_potentials[snap_name] if snap_name in cached_potentials else new_potentials[snap_name]
+            for snap_name in snap_names}
+
+
+def _potential_parameters(enzyme: KappaAgent, substrate: KappaAgent) -> str:
+    """Returns the parameters of a catalytic potential analysis, as used to key stored and partial results."""
+    return json.dumps([str(enzyme), str(substrate)])
+
+
+def potentials_from_results(potentials: Dict[str, List[float]]) -> List[Tuple[int, float]]:
+    """Build stage of `get_potential_of_folder`: returns the catalytic potentials and times as a list, ordered by
+    snapshot name as `find_snapshot_names` does; e.g. to combine the merged partial results of several shards."""
+    return [potentials[snap_name] for snap_name in sorted(potentials.keys(), key=numerical_sort)]
+
+
+def get_potential_of_folder(base_directory: str, enzyme: KappaAgent, substrate: KappaAgent,
+                            verbosity: bool, snap_name_pattern: str,
+                            cache_file: Optional[Union[str, Path]] = None,
+                            shard: Optional[Tuple[int, int]] = None) -> List[Tuple[int, float]]:
+    """See file under `KaSaAn.scripts` for usage. With a `cache_file`, per-snapshot results are kept in that results
+    store, and only new or modified snapshots are parsed. With a `shard`, only the snapshots of that shard are analyzed,
+    see `collect_potentials_of_folder`."""
+    return potentials_from_results(collect_potentials_of_folder(
+        base_directory, enzyme, substrate, verbosity, snap_name_pattern, cache_file, shard))
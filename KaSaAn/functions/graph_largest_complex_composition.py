@@ -1,18 +1,25 @@
 #! /usr/bin/env python3
 
 import concurrent.futures as cofu
+import json
 import matplotlib as mpl
 import matplotlib.figure as mpf
 import matplotlib.patches as mppa
 import matplotlib.pyplot as plt
 import numpy
+import os
 import warnings
 from operator import itemgetter
-from typing import Dict, List, Tuple, Set, Union
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Set, Union
 
 from KaSaAn.core import KappaAgent
+from KaSaAn.core.KappaError import AgentParseError
 
 from ..functions.agent_color_assignment import colorize_observables
+from ..functions.snapshot_prefetch import prefetch_snapshot_files
+from ..functions.snapshot_results_store import load_cached_results, store_results
+from ..functions.trace_replay import iter_trace_samples
 from ..core import KappaComplex, KappaSnapshot
 
 
@@ -63,15 +70,16 @@ def _make_figure(s_times, p_matrix, observable_set: Set[KappaComplex],
     return fig
 
 
-def process_snapshot_helper(snapshot_name: str, patterns_requested: Set[Union[KappaAgent, KappaComplex]] = None) -> Tuple[float, Dict[Union[KappaAgent, KappaComplex], int]]:
-    """Helper function to process snapshots and extract an arbitrary compositon."""
-    snap = KappaSnapshot(snapshot_name)
-    big_o_mers = snap.get_largest_complexes()
+def process_snapshot_helper(snapshot_name: str, patterns_requested: Set[Union[KappaAgent, KappaComplex]] = None,
+                            raw_expression: Optional[str] = None) -> Tuple[float, Dict[Union[KappaAgent, KappaComplex], int]]:
+    """Helper function to process snapshots and extract an arbitrary compositon. Only the largest complexes are
+    parsed, see `KappaSnapshot.read_largest_complexes`, from the file or from its already-read contents."""
+    snap_time, big_o_mers = KappaSnapshot.read_largest_complexes(snapshot_name, raw_expression)
     # obtain the composition of the largest complex per snapshot, skipping those
     # snapshots where there is ambiguity
     if len(big_o_mers) > 1:
         warnings.warn('Snapshot {} had more than one class of largest complex; omitting it.'.format(
-            snap.get_snapshot_file_name()))
+            os.path.split(snapshot_name)[1]))
         return None
     lc_complex, _ = big_o_mers[0]
     # filter out agents if requested
@@ -82,50 +90,177 @@ def process_snapshot_helper(snapshot_name: str, patterns_requested: Set[Union[Ka
         lc_composition = filtered_composition
     else:
         lc_composition = lc_complex.get_complex_composition()
-    return snap.get_snapshot_time(), lc_composition
+    return snap_time, lc_composition
+
+
+def _summarize_snapshot(snapshot_name: str, pattern_expressions: Optional[List[str]] = None,
+                        raw_expression: Optional[str] = None) -> Optional[Tuple[float, Dict[str, int]]]:
+    """Worker for the process pool: parses the snapshot and returns only its time and the composition of its largest
+    complex, keyed by the string expressions of the agent types or requested patterns, which pickle compactly."""
+    if pattern_expressions:
+        patterns_requested = set()
+        for expression in pattern_expressions:
+            try:
+                patterns_requested.add(KappaAgent(expression))
+            except AgentParseError:
+                patterns_requested.add(KappaComplex(expression))
+    else:
+        patterns_requested = None
+    job_results = process_snapshot_helper(snapshot_name, patterns_requested, raw_expression)
+    if job_results is None:
+        return None
+    return job_results[0], {str(pattern): abundance for pattern, abundance in job_results[1].items()}
+
+
+def _print_progress(done: int, total: int, snap_name: str) -> None:
+    """Overwrites the current terminal line with the fraction of snapshots processed."""
+    print('\rProcessed {} of {} snapshots, {:.2%}; last was {}'.format(
+        done, total, done / total, snap_name), end='\n' if done == total else '', flush=True)
+
+
+def _pattern_expressions(patterns_requested: Optional[Dict] = None) -> Optional[List[str]]:
+    """Returns the sorted string expressions of the requested patterns, as passed to workers and used to key stored
+    results; `None` if no patterns were requested, for the composition by agent type."""
+    return sorted(str(p) for p in patterns_requested.keys()) if patterns_requested else None
+
+
+def collect_snapshot_summaries(
+        snapshot_names: List[str],
+        patterns_requested: Dict = None,
+        thread_number: int = 1,
+        cache_file: Optional[Union[str, Path]] = None) -> Dict[str, Optional[Tuple[float, Dict[str, int]]]]:
+    """Collect stage of `snapshot_list_to_plot_matrix`: parses the snapshots and returns a dictionary of snapshot names
+    to the time and the composition of the largest complex, keyed by string expressions (or `None` for snapshots with
+    several classes of largest complex). With a `thread_number` above one, snapshots are parsed by that many worker
+    processes, with at most twice as many snapshots in flight; results are gathered as they complete. Either way, files
+    are read ahead in the background, see `prefetch_snapshot_files`, and workers are handed their contents; snapshots
+    that can not be read, or parsed, are reported and skipped. With a `cache_file`, per-snapshot results are kept in
+    that results store, and only new or modified snapshots are parsed. The result is JSON-serializable, so it can be
+    saved as partial results, see `write_partial_results`."""
+    pattern_expressions = _pattern_expressions(patterns_requested)
+    # only snapshots without a valid cached summary need parsing
+    summaries: Dict[str, Optional[Tuple[float, Dict[str, int]]]] = {}
+    if cache_file is not None:
+        cache_parameters = json.dumps(pattern_expressions)
+        summaries, names_to_parse, file_keys = load_cached_results(
+            cache_file, snapshot_names, 'largest_complex_composition', cache_parameters)
+        if summaries:
+            print('Found {} of {} snapshots in results store {}'.format(
+                len(summaries), len(snapshot_names), cache_file))
+    else:
+        names_to_parse = snapshot_names
+    new_summaries: Dict[str, Optional[Tuple[float, Dict[str, int]]]] = {}
+
+    # iterate over the snapshots
+    snap_num = len(names_to_parse)
+    if thread_number > 1:
+        with cofu.ProcessPoolExecutor(max_workers=thread_number) as executor:
+            names_pending = prefetch_snapshot_files(names_to_parse, depth=2 * thread_number, yield_errors=True)
+            jobs_in_flight = {}
+            done_number = 0
+            while True:
+                # keep the pool fed, but bound the number of submitted-but-unfinished snapshots
+                for snap_name, snap_text in names_pending:
+                    if isinstance(snap_text, Exception):
+                        # e.g. removed since it was listed; skipped, like a snapshot that does not parse
+                        done_number += 1
+                        print('\n{} generated an exception: {}'.format(snap_name, snap_text))
+                        _print_progress(done_number, snap_num, snap_name)
+                        continue
+                    jobs_in_flight[executor.submit(_summarize_snapshot, snap_name, pattern_expressions,
+                                                   snap_text)] = snap_name
+                    if len(jobs_in_flight) >= 2 * thread_number:
+                        break
+                if not jobs_in_flight:
+                    break
+                jobs_done, _ = cofu.wait(jobs_in_flight, return_when=cofu.FIRST_COMPLETED)
+                for job in jobs_done:
+                    snap_name = jobs_in_flight.pop(job)
+                    done_number += 1
+                    try:
+                        new_summaries[snap_name] = job.result()
+                    except Exception as exc:
+                        print('\n{} generated an exception: {}'.format(snap_name, exc))
+                    _print_progress(done_number, snap_num, snap_name)
+    else:
+        for snap_index, (snap_name, snap_text) in enumerate(prefetch_snapshot_files(names_to_parse,
+                                                                                    yield_errors=True)):
+            try:
+                if isinstance(snap_text, Exception):
+                    raise snap_text
+                new_summaries[snap_name] = _summarize_snapshot(snap_name, pattern_expressions, snap_text)
+            except Exception as exc:
+                print('\n{} generated an exception: {}'.format(snap_name, exc))
+            _print_progress(snap_index + 1, snap_num, snap_name)
+    if cache_file is not None and new_summaries:
+        store_results(cache_file, new_summaries, 'largest_complex_composition', cache_parameters, file_keys)
+    summaries.update(new_summaries)
+    return summaries
+
+
+def collect_trace_summaries(
+        trace_file: Union[str, Path],
+        patterns_requested: Dict = None,
+        every_event: Optional[int] = None,
+        every_time: Optional[float] = None) -> Dict[str, Optional[Tuple[float, Dict[str, int]]]]:
+    """Counterpart of `collect_snapshot_summaries` for a KaSim trace: replays it, see `iter_trace_samples`, and
+    summarizes the largest complex of the mixture every so many events or units of time, or after every event. Only the
+    largest complexes are written out for each sample. Summaries are keyed by the trace name and sample number, and can
+    be handed to `summaries_to_plot_matrix`."""
+    pattern_expressions = _pattern_expressions(patterns_requested)
+    summaries: Dict[str, Optional[Tuple[float, Dict[str, int]]]] = {}
+    for sample_index, (sample_time, mixture) in enumerate(iter_trace_samples(trace_file, every_event, every_time)):
+        sample_name = '{}@{}'.format(Path(trace_file).name, sample_index)
+        if mixture.get_number_of_agents() == 0:
+            summaries[sample_name] = None
+            continue
+        summaries[sample_name] = _summarize_snapshot(
+            sample_name, pattern_expressions, mixture.to_snapshot_text(largest_only=True, snapshot_time=sample_time))
+        print('\rProcessed {} samples; last was event {}'.format(sample_index + 1, mixture.get_mixture_event()),
+              end='', flush=True)
+    print()
+    return summaries
 
 
 def snapshot_list_to_plot_matrix(
         snapshot_names: List[str],
         patterns_requested: Dict = None,
         thread_number: int = 1,
-        stack_order: str = list(_stacked_plot_methods.keys())[0]) -> Tuple[
+        stack_order: str = list(_stacked_plot_methods.keys())[0],
+        cache_file: Optional[Union[str, Path]] = None) -> Tuple[
             List[float],
             numpy.ndarray,
             List[Union[KappaAgent, KappaComplex, Union[KappaAgent, KappaComplex]]]]:
-    """See file under `KaSaAn.scripts` for usage."""
+    """See file under `KaSaAn.scripts` for usage. Runs the collect stage, `collect_snapshot_summaries`, then the build
+    stage, `summaries_to_plot_matrix`; see those for the meaning of `thread_number` and `cache_file`."""
+    summaries = collect_snapshot_summaries(snapshot_names, patterns_requested, thread_number, cache_file)
+    return summaries_to_plot_matrix(summaries, patterns_requested, stack_order)
 
+
+def summaries_to_plot_matrix(
+        summaries: Dict[str, Optional[Tuple[float, Dict[str, int]]]],
+        patterns_requested: Dict = None,
+        stack_order: str = list(_stacked_plot_methods.keys())[0]) -> Tuple[
+            List[float],
+            numpy.ndarray,
+            List[Union[KappaAgent, KappaComplex, Union[KappaAgent, KappaComplex]]]]:
+    """Build stage of `snapshot_list_to_plot_matrix`: from the per-snapshot summaries, e.g. those collected by
+    `collect_snapshot_summaries` or merged from the partial results of several shards, returns the snapshot times, the
+    matrix of pattern abundances, and the patterns, ordered per `stack_order`."""
     if stack_order not in _stacked_plot_methods.keys():
         UserWarning('Unrecognized order <{}> requested, defaulting to {}.'.format(stack_order, list(_stacked_plot_methods.keys())[0]))
 
-    lc_compositions = []
-    snap_times = []
     holding_struct = {}
+    # summaries have string keys; map them back to the requested patterns, or to agent types
     if patterns_requested:
-        pattern_keys: Set[Union[KappaAgent, KappaComplex]] = patterns_requested.keys()
+        pattern_lookup: Dict[str, Union[KappaAgent, KappaComplex]] = {str(p): p for p in patterns_requested.keys()}
     else:
-        pattern_keys = None
-    # iterate over the snapshots
-    if thread_number > 1:
-        with cofu.ThreadPoolExecutor(max_workers=thread_number) as executor:
-            inputs_jobs = ((snap_name, pattern_keys) for snap_name in snapshot_names)
-            jobs_submitted = {executor.submit(process_snapshot_helper, *inputs_job): inputs_job
-                              for inputs_job in inputs_jobs}
-            for job in cofu.as_completed(jobs_submitted):
-                input_used = jobs_submitted[job]
-                try:
-                    job_results = job.result()
-                except Exception as exc:
-                    print('{} generated an exception: {}'.format(input_used, exc))
-                else:
-                    if job_results is not None:
-                        holding_struct[job_results[0]] = job_results[1]
-    else:
-        for snap_name in snapshot_names:
-            print('Processing {}, {} of {}'.format(snap_name, snapshot_names.index(snap_name) + 1, len(snapshot_names)))
-            job_results = process_snapshot_helper(snap_name, pattern_keys)
-            if job_results is not None:
-                holding_struct[job_results[0]] = job_results[1]
+        pattern_lookup = {}
+    for summary in summaries.values():
+        if summary is not None:
+            holding_struct[summary[0]] = {pattern_lookup[key] if key in pattern_lookup else KappaAgent(key): value
+                                          for key, value in summary[1].items()}
+
     # sort by snapshot time, split dictionary into two iterables
     snap_times, lc_compositions = zip(*sorted(holding_struct.items(), key=itemgetter(0)))
 
@@ -1,74 +1,165 @@
 #! /usr/bin/env python3
 
 import ast
+import concurrent.futures as cofu
 import glob
 import warnings
 import matplotlib.axes as mpa
 import numpy as np
-from typing import List, Tuple
-from .observable_plotter import observable_file_reader
+from typing import List, Optional, Tuple
+from .observable_plotter import observable_file_reader, observable_file_legend, observable_columns_needed
+from .observable_downsampler import axis_pixel_width, downsample_series
 from .numerical_sort import numerical_sort
 
 
 def _find_data_files(pattern: str) -> List[str]:
-    """Find files that match the pattern."""
-    file_list = glob.glob(pattern)
+    """Find files that match the pattern, except the caches written by `observable_file_reader`."""
+    file_list = [file_name for file_name in glob.glob(pattern) if not file_name.endswith(('.cache.npy', '.cache.json'))]
     if not file_list:
         raise ValueError('No files found matching: ' + str(pattern))
     sorted_file_list = sorted(file_list, key=numerical_sort)
     return sorted_file_list
 
 
+def _read_coplot_file(file_name: str, use_cache: bool, variable_index: int, variable_name: str,
+                      variable_expr: str) -> Tuple[List[str], np.ndarray, int]:
+    """Reads the time column and those of the requested variable, and returns the legend, the data, and the index of
+    the variable among the columns read, which is the same for every file. At module level, so worker processes can
+    call it."""
+    full_legend = observable_file_legend(file_name)
+    columns = observable_columns_needed(full_legend, [variable_index] if variable_index else None,
+                                        [variable_name] if variable_name else None,
+                                        [variable_expr] if variable_expr else None)
+    legend_data, numeric_data = observable_file_reader(file_name, use_cache, columns=columns)
+    coplot_index = legend_data.index(full_legend[variable_index - 1]) + 1 if variable_index else variable_index
+    return legend_data, numeric_data, coplot_index
+
+
+def _coplot_series(legend_data: List[str], numeric_data: np.ndarray, coplot_index: int, coplot_name: str,
+                   coplot_expression: str) -> Tuple[np.ndarray, str]:
+    """Returns the values of the requested variable, or expression, and its name. Columns are taken from the last
+    axis of the data, so this works for the table of one file, and for replicates aligned on a time grid."""
+    if coplot_index:
+        var_index = coplot_index - 1
+        return numeric_data[..., var_index], legend_data[var_index]
+    elif coplot_name:
+        try:
+            var_index = legend_data.index(coplot_name)
+        except ValueError as ve:
+            raise ValueError('Requested variable name not found in variable list; available options are:\n' +
+                             ' | '.join(legend_data)) from ve
+        return numeric_data[..., var_index], coplot_name
+    elif coplot_expression:
+        # to render an algebraic expression, we create an abstract syntax tree,
+        #  then replace the tokens that are strings found in the legend with
+        #  the name of the data array, with proper indexing; finally
+        #  the new tree can be executed (with fixed linenos & indents).
+        # TokenTransformer is declared here so it can include in its scope
+        #  the legend_data values; this avoids more extensive subclassing
+        class TokenTransformer(ast.NodeTransformer):
+            """Swap column names for the indexed-array."""
+            def visit_Constant(self, node, obs_list=legend_data):
+                """Transform node if it's a string found in the legend data."""
+                if isinstance(node.value, str):
+                    if node.value in obs_list:
+                        return ast.copy_location(
+                            ast.Subscript(
+                                value=ast.Name(id='numeric_data', ctx=ast.Load()),
+                                slice=ast.Tuple(elts=[ast.Constant(value=Ellipsis),
+                                                      ast.Constant(value=obs_list.index(node.value))],
+                                                ctx=ast.Load()),
+                                ctx=ast.Load()), node)
+                    else:
+                        raise ValueError('Error: <{}> not found in observables: {}'.format(node.value, obs_list))
+                else:
+                    return node
+        my_ast = ast.parse(coplot_expression, mode='eval')
+        TokenTransformer().visit(my_ast)
+        return eval(compile(ast.fix_missing_locations(my_ast), '<string>', 'eval')), coplot_expression
+    else:
+        raise ValueError('Function requires a variable index, a variable name, or an expression of variables.')
+
+
+def common_time_grid(file_data_list: List[Tuple[List[str], np.ndarray, str]], point_number: int) -> np.ndarray:
+    """Returns `point_number` evenly spaced times, from the earliest to the latest time found in the files."""
+    start = min(numeric_data[0, 0] for _, numeric_data, _ in file_data_list)
+    end = max(numeric_data[-1, 0] for _, numeric_data, _ in file_data_list)
+    return np.linspace(start, end, point_number)
+
+
+def align_replicates(file_data_list: List[Tuple[List[str], np.ndarray, str]], time_grid: np.ndarray,
+                     interpolation: str = 'step') -> Tuple[List[str], np.ndarray]:
+    """Resamples each file's data, with time as their first column, onto the same times, and returns the names of the
+    observables, those of the first file, and a three-dimensional array, indexed by replicate, time point, and
+    observable; time is not included. With `step` interpolation, the value at a grid time is the last one recorded at
+    or before it, as KaSim holds values between outputs; with `linear`, it is interpolated between the outputs around
+    it. Grid times before a file's first output, or after its last, are `NaN` for that replicate. Each replicate is
+    resampled in one vectorized step, for all its observables."""
+    if interpolation not in ('step', 'linear'):
+        raise ValueError('Unknown interpolation <{}>; options are step, linear'.format(interpolation))
+    legend_names = file_data_list[0][0][1:]
+    aligned = np.full((len(file_data_list), len(time_grid), len(legend_names)), np.nan)
+    for replicate, (legend_data, numeric_data, file_name) in enumerate(file_data_list):
+        try:
+            columns = [legend_data.index(name) for name in legend_names]
+        except ValueError as ve:
+            raise ValueError('File {} lacks observables of the first file: {}'.format(file_name, legend_names)) from ve
+        times, values = numeric_data[:, 0], numeric_data[:, columns]
+        in_range = (time_grid >= times[0]) & (time_grid <= times[-1])
+        before = np.clip(np.searchsorted(times, time_grid, side='right') - 1, 0, len(times) - 1)
+        if interpolation == 'step' or len(times) == 1:
+            resampled = values[before]
+        else:
+            before = np.minimum(before, len(times) - 2)
+            span = times[before + 1] - times[before]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                weight = np.where(span > 0, (time_grid - times[before]) / span, 1.0)[:, None]
+            resampled = values[before] * (1 - weight) + values[before + 1] * weight
+        aligned[replicate, in_range] = resampled[in_range]
+    return legend_names, aligned
+
+
+def _ensemble_axis_annotator(co_plot_axis: mpa.Axes, time_points: np.ndarray, mean_values: np.ndarray,
+                             quantile_bands: List[Tuple[float, np.ndarray, np.ndarray]], title: str,
+                             replicate_number: int, diff_toggle: bool = False, log_x: bool = False,
+                             log_y: bool = False, omit_legend: bool = False) -> mpa.Axes:
+    """Annotate the provided axis with the ensemble mean, and shaded bands between each quantile and its complement,
+    the outermost lightest."""
+    mean_line, = co_plot_axis.plot(time_points, mean_values, label='mean of {} replicates'.format(replicate_number))
+    for band_ix, (quantile, low_values, high_values) in enumerate(sorted(quantile_bands, key=lambda band: band[0])):
+        co_plot_axis.fill_between(time_points, low_values, high_values, color=mean_line.get_color(),
+                                  alpha=0.5 / (len(quantile_bands) - band_ix + 1), linewidth=0,
+                                  label='{:g} to {:g} quantiles'.format(quantile, 1 - quantile))
+    co_plot_axis.set_xlabel('Time')
+    if diff_toggle:
+        co_plot_axis.set_ylabel(r'$\frac{\Delta \mathrm{x}}{\Delta t}$', rotation='horizontal')
+    else:
+        co_plot_axis.set_ylabel('Value')
+    co_plot_axis.set_title(title)
+    if not omit_legend:
+        co_plot_axis.legend()
+    if log_x:
+        co_plot_axis.set_xscale('log')
+    if log_y:
+        co_plot_axis.set_yscale('log')
+    return co_plot_axis
+
+
 def _multi_data_axis_annotator(co_plot_axis: mpa.Axes, file_data_list: List[Tuple[List[str], np.array, str]],
                                coplot_index: int, coplot_name: str, coplot_expression: str,
                                diff_toggle: bool = False, log_x: bool = False, log_y: bool = False,
-                               omit_legend: bool = False) -> mpa.Axes:
-    """Annotate the provided axis."""
+                               omit_legend: bool = False, downsample: str = 'minmax',
+                               x_limits: Optional[Tuple[Optional[float], Optional[float]]] = None) -> mpa.Axes:
+    """Annotate the provided axis. Long series are reduced for the axis's width, and the `x_limits` it will be set
+    to, if any, see `downsample_series`."""
     artist_list = []
+    pixel_width = axis_pixel_width(co_plot_axis)
     # Define things to plot
     for file_data in file_data_list:
         legend_data, numeric_data, file_name = file_data
-        if coplot_index:
-            var_index = coplot_index - 1
-            data_y = numeric_data[:, var_index]
-            legend_label = legend_data[var_index]
-        elif coplot_name:
-            try:
-                var_index = legend_data.index(coplot_name)
-            except ValueError as ve:
-                raise ValueError('Requested variable name not found in variable list; available options are:\n' +
-                                 ' | '.join(legend_data)) from ve
-            data_y = numeric_data[:, var_index]
-            legend_label = file_name
-        elif coplot_expression:
-            # to render an algebraic expression, we create an abstract syntax tree,
-            #  then replace the tokens that are strings found in the legend with
-            #  the name of the data array, with proper indexing; finally
-            #  the new tree can be executed (with fixed linenos & indents).
-            # TokenTransformer is declared here so it can include in its scope
-            #  the legend_data values; this avoids more extensive subclassing
-            class TokenTransformer(ast.NodeTransformer):
-                """Swap column names for the indexed-array."""
-                def visit_Constant(self, node, obs_list=legend_data):
-                    """Transform node if it's a string found in the legend data."""
-                    if isinstance(node.value, str):
-                        if node.value in obs_list:
-                            return ast.copy_location(
-                                ast.Subscript(
-                                    value=ast.Name(id='numeric_data', ctx=ast.Load()),
-                                    slice=ast.Tuple(elts=[ast.Slice(), ast.Constant(value=obs_list.index(node.value))],
-                                                    ctx=ast.Load()),
-                                    ctx=ast.Load()), node)
-                        else:
-                            raise ValueError('Error: <{}> not found in observables: {}'.format(node.value, obs_list))
-                    else:
-                        return node
-            my_ast = ast.parse(coplot_expression, mode='eval')
-            TokenTransformer().visit(my_ast)
-            data_y = eval(compile(ast.fix_missing_locations(my_ast), '<string>', 'eval'))
-            legend_label = file_name
-        else:
-            raise ValueError('Function requires a variable index, a variable name, or an expression of variables.')
+        data_y, variable_label = _coplot_series(legend_data, numeric_data, coplot_index, coplot_name,
+                                                coplot_expression)
+        legend_label = variable_label if coplot_index else file_name
         # an entry was defined; now to process it if differential was requested
         data_x = numeric_data[:, 0]
         if diff_toggle:
@@ -80,6 +171,10 @@ def _multi_data_axis_annotator(co_plot_axis: mpa.Axes, file_data_list: List[Tupl
             data_x = data_x[1:]
         # finally, plot the entry
         plot_draw_style = 'steps-post' if len(data_x) < 1000 else 'default'
+        data_x, data_y = downsample_series(data_x, data_y, pixel_width, downsample, log_x, plot_draw_style,
+                                           cache_owner=numeric_data,
+                                           cache_key=(coplot_index, coplot_name, coplot_expression, diff_toggle),
+                                           x_limits=x_limits)
         artist_list.extend(co_plot_axis.plot(data_x, data_y, label=legend_label, drawstyle=plot_draw_style))
     co_plot_axis.set_xlabel('Time')
     # if plotting a time differential, adjust Y-axis label
@@ -117,20 +212,64 @@ def observable_coplot_axis_annotator(target_axis: mpa.Axes, file_pattern: str,
                                      variable_index: int, variable_name: str, variable_expr: str,
                                      differential_toggle: bool = False,
                                      log_axis_x: bool = False, log_axis_y: bool = False,
-                                     no_legend: bool = False) -> mpa.Axes:
-    """See file under `KaSaAn.scripts` for usage."""
+                                     no_legend: bool = False, use_cache: bool = False,
+                                     downsample: str = 'minmax',
+                                     x_limits: Optional[Tuple[Optional[float], Optional[float]]] = None,
+                                     process_number: int = 1, grid_points: Optional[int] = None,
+                                     interpolation: str = 'step',
+                                     band_quantiles: Tuple[float, ...] = (0.05, 0.25)) -> mpa.Axes:
+    """See file under `KaSaAn.scripts` for usage. With `use_cache`, files are read through their binary cache, see
+    `observable_file_reader`. Series are reduced for the axis's width, and the `x_limits` it will be set to, if any,
+    with the `downsample` method, see `downsample_series`. With a `process_number` above one, files are read by that
+    many worker processes. With `grid_points`, replicates are instead resampled onto that many common time points,
+    see `align_replicates`, and the axis shows their mean, with bands between each of the `band_quantiles` and its
+    complement, e.g. the 5th and 95th percentiles."""
+    if not variable_index and not variable_name and not variable_expr:
+        raise ValueError('Function requires the index of a variable,'
+                         ' a name for one, or an expression of variables found in the observable file.')
+    if any(not 0 < quantile < 0.5 for quantile in band_quantiles):
+        raise ValueError('Band quantiles must be between 0 and 0.5, got {}'.format(band_quantiles))
     file_names = _find_data_files(file_pattern)
+    # only the time column and those of the requested variable are read
+    file_number = len(file_names)
+    read_arguments = [file_names, [use_cache] * file_number, [variable_index] * file_number,
+                      [variable_name] * file_number, [variable_expr] * file_number]
+    if process_number > 1:
+        with cofu.ProcessPoolExecutor(max_workers=process_number) as executor:
+            file_contents = list(executor.map(_read_coplot_file, *read_arguments))
+    else:
+        file_contents = list(map(_read_coplot_file, *read_arguments))
     file_data_list = []
-    for file_name in file_names:
-        legend_data, numeric_data = observable_file_reader(file_name)
+    coplot_index = variable_index
+    for file_name, (legend_data, numeric_data, coplot_index) in zip(file_names, file_contents):
         if numeric_data.shape[0] <= 1:
             warnings.warn('Only one time point in file ' + file_name)
         file_data_list.append((legend_data, numeric_data, file_name))
-    if not variable_index and not variable_name and not variable_expr:
-        raise ValueError('Function requires the index of a variable,'
-                         ' a name for one, or an expression of variables found in the observable file.')
+    if grid_points:
+        if variable_index is not None and coplot_index == 1:
+            raise ValueError('Variable 1 is time, which the time grid replaces; choose an observable, from index 2.')
+        time_grid = common_time_grid(file_data_list, grid_points)
+        legend_names, aligned = align_replicates(file_data_list, time_grid, interpolation)
+        # the aligned observables exclude time, so indexes shift by one
+        ensemble_values, variable_label = _coplot_series(legend_names, aligned,
+                                                         coplot_index - 1 if coplot_index is not None else None,
+                                                         variable_name, variable_expr)
+        if differential_toggle:
+            ensemble_values = np.diff(ensemble_values, axis=1) / np.diff(time_grid)
+            time_grid = time_grid[1:]
+        with warnings.catch_warnings():
+            # time points outside the range of every replicate have no values
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            mean_values = np.nanmean(ensemble_values, axis=0)
+            quantile_bands = [(quantile, *np.nanquantile(ensemble_values, [quantile, 1 - quantile], axis=0))
+                              for quantile in band_quantiles]
+        _ensemble_axis_annotator(co_plot_axis=target_axis, time_points=time_grid, mean_values=mean_values,
+                                 quantile_bands=quantile_bands, title=variable_label,
+                                 replicate_number=file_number, diff_toggle=differential_toggle,
+                                 log_x=log_axis_x, log_y=log_axis_y, omit_legend=no_legend)
+        return target_axis
     _multi_data_axis_annotator(co_plot_axis=target_axis, file_data_list=file_data_list,
-                               coplot_index=variable_index, coplot_name=variable_name, coplot_expression=variable_expr,
+                               coplot_index=coplot_index, coplot_name=variable_name, coplot_expression=variable_expr,
                                diff_toggle=differential_toggle, log_x=log_axis_x, log_y=log_axis_y,
-                               omit_legend=no_legend)
+                               omit_legend=no_legend, downsample=downsample, x_limits=x_limits)
     return target_axis
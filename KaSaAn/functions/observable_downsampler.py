@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Reduce long time series to about as many points as the axis that shows them has pixels, before handing them to
+MatPlotLib, so that plotting millions of rows stays fast and vector figures stay small, without visibly changing the
+plot. Two methods are offered: per-pixel min/max, which keeps the extremes of each pixel column, and the
+Largest-Triangle-Three-Buckets (LTTB) method of Steinarsson, which keeps the points that best preserve the line's
+shape."""
+
+import matplotlib.axes as mpa
+import numpy as np
+import weakref
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# series shorter than this many points per pixel are plotted as they are
+_points_per_pixel_threshold = 4
+# finest resolution, in bins, of the min/max levels kept for repeated renders
+_finest_level_bins = 1 << 15
+# min/max levels of series, by bin count, keyed by the identity of the array that holds them, and a key given by the
+# caller
+_level_cache: Dict[Tuple[int, Hashable], Dict[int, Tuple[np.ndarray, np.ndarray]]] = {}
+
+downsample_methods = ['minmax', 'lttb', 'none']
+
+
+def axis_pixel_width(axis: mpa.Axes) -> int:
+    """Returns the width, in pixels, of the axis's drawing area, at the figure's resolution."""
+    return max(1, int(round(axis.get_window_extent().width)))
+
+
+def _bin_positions(x_data: np.ndarray, bin_number: int, log_x: bool,
+                   x_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """Returns the bin of each point, for equal-width bins over the x range, in display space: logarithmic if `log_x`,
+    with non-positive values counted in the first bin."""
+    positions = x_data.astype(float)
+    if log_x:
+        positive = positions > 0
+        floor = positions[positive].min() if positive.any() else 1.0
+        positions = np.log10(np.where(positive, positions, floor))
+    low, high = x_range if x_range is not None else (positions[0], positions[-1])
+    if not high > low:
+        return np.zeros(len(positions), dtype=np.int64)
+    return np.clip(((positions - low) / (high - low) * bin_number).astype(np.int64), 0, bin_number - 1)
+
+
+def _display_range(x_data: np.ndarray, log_x: bool) -> Tuple[float, float]:
+    """Returns the first and last x values, in display space, see `_bin_positions`."""
+    if not log_x:
+        return float(x_data[0]), float(x_data[-1])
+    positive = x_data[x_data > 0]
+    if len(positive) == 0:
+        return 0.0, 0.0
+    return float(np.log10(positive[0])), float(np.log10(positive[-1]))
+
+
+def minmax_downsample(x_data: np.ndarray, y_data: np.ndarray, bin_number: int, log_x: bool = False,
+                      x_range: Optional[Tuple[float, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Splits the x range into `bin_number` equal bins, e.g. one per pixel, and keeps, of the points in each bin, the
+    first, the last, and those with the smallest and largest y value, in their original order. Extremes are thus drawn
+    as they are; and as the first and last points of each bin are kept, a value held across bins, as drawn with
+    `steps-post`, is held over the same span. The x values must be sorted, as times are."""
+    if len(x_data) <= 4 * bin_number:
+        return x_data, y_data
+    return _minmax_bins(x_data, y_data, bin_number, log_x, x_range)
+
+
+def _minmax_bins(x_data: np.ndarray, y_data: np.ndarray, bin_number: int, log_x: bool,
+                 x_range: Optional[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Min/max reduction of `minmax_downsample`, done however few the points."""
+    point_number = len(x_data)
+    bins = _bin_positions(x_data, bin_number, log_x, x_range)
+    starts = np.flatnonzero(np.diff(bins, prepend=-1))
+    ends = np.append(starts[1:], point_number) - 1
+    segment_lengths = np.diff(np.append(starts, point_number))
+    indexes = np.arange(point_number)
+    # missing values can not be extremes; a bin of only missing values keeps its first point
+    y_for_min = np.where(np.isnan(y_data), np.inf, y_data)
+    y_for_max = np.where(np.isnan(y_data), -np.inf, y_data)
+    bin_min = np.repeat(np.minimum.reduceat(y_for_min, starts), segment_lengths)
+    bin_max = np.repeat(np.maximum.reduceat(y_for_max, starts), segment_lengths)
+    min_at = np.minimum.reduceat(np.where(y_for_min == bin_min, indexes, point_number), starts)
+    max_at = np.minimum.reduceat(np.where(y_for_max == bin_max, indexes, point_number), starts)
+    kept = np.unique(np.concatenate([starts, ends, min_at, max_at]))
+    return x_data[kept], y_data[kept]
+
+
+def lttb_downsample(x_data: np.ndarray, y_data: np.ndarray, point_number: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keeps `point_number` points, with the Largest-Triangle-Three-Buckets method: the first and last points, and one
+    per bucket of equal number of points in between, the one forming the largest triangle with the point kept in the
+    previous bucket and the average of the next bucket. Meant for lines; the points of the next bucket are averaged
+    with cumulative sums, so only the choice within each bucket is done in turn."""
+    total_number = len(x_data)
+    if point_number >= total_number or point_number < 3:
+        return x_data, y_data
+    edges = np.linspace(1, total_number - 1, point_number - 1).astype(np.int64)
+    x_sums = np.concatenate([[0.0], np.cumsum(x_data, dtype=float)])
+    y_sums = np.concatenate([[0.0], np.cumsum(np.nan_to_num(y_data), dtype=float)])
+    # average of each bucket, then the last point as the bucket after the last
+    bucket_sizes = np.maximum(np.diff(edges), 1)
+    x_averages = np.append((x_sums[edges[1:]] - x_sums[edges[:-1]]) / bucket_sizes, x_data[-1])
+    y_averages = np.append((y_sums[edges[1:]] - y_sums[edges[:-1]]) / bucket_sizes, y_data[-1])
+    kept = np.empty(point_number, dtype=np.int64)
+    kept[0], kept[-1] = 0, total_number - 1
+    previous = 0
+    for bucket in range(point_number - 2):
+        start, end = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        x_previous, y_previous = x_data[previous], y_data[previous]
+        areas = np.abs((x_previous - x_averages[bucket + 1]) * (y_data[start:end] - y_previous) -
+                       (x_previous - x_data[start:end]) * (y_averages[bucket + 1] - y_previous))
+        previous = start + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        kept[bucket + 1] = previous
+    return x_data[kept], y_data[kept]
+
+
+def _pixels_over_series(x_data: np.ndarray, pixel_width: int, log_x: bool,
+                        x_limits: Tuple[Optional[float], Optional[float]]) -> int:
+    """Returns how many pixels the whole series would span, if only the part between the limits fits in the axis."""
+    low, high = _display_range(x_data, log_x)
+    limit_low, limit_high = [limit if limit is None or not log_x else (np.log10(limit) if limit > 0 else None)
+                             for limit in x_limits]
+    view_low = low if limit_low is None else max(low, limit_low)
+    view_high = high if limit_high is None else min(high, limit_high)
+    if not view_high > view_low or not high > low:
+        return pixel_width
+    return int(np.ceil(pixel_width * (high - low) / (view_high - view_low)))
+
+
+def _cached_minmax_level(levels: Dict[int, Tuple[np.ndarray, np.ndarray]], x_data: np.ndarray, y_data: np.ndarray,
+                         bin_number: int, log_x: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns a min/max reduction of the series whose bins nest in `bin_number` bins over the same range, i.e. whose
+    bin count is a multiple of it, so that reducing it again to `bin_number` bins keeps the same points as reducing
+    the series itself. A cached level is used if one fits; else the series is reduced to `bin_number` times the
+    largest power of two that stays within the finest resolution, and that level is cached, so it also serves later
+    renders at this width, or at this width doubled."""
+    fitting = [level_bins for level_bins in levels if level_bins % bin_number == 0]
+    if fitting:
+        return levels[min(fitting)]
+    level_bins = bin_number
+    while 2 * level_bins <= _finest_level_bins and 8 * level_bins < len(x_data):
+        level_bins *= 2
+    levels[level_bins] = minmax_downsample(x_data, y_data, level_bins, log_x, _display_range(x_data, log_x))
+    return levels[level_bins]
+
+
+def downsample_series(x_data: np.ndarray, y_data: np.ndarray, pixel_width: int, method: str = 'minmax',
+                      log_x: bool = False, drawstyle: str = 'default', cache_owner: Any = None,
+                      cache_key: Hashable = None, x_limits: Optional[Tuple[Optional[float], Optional[float]]] = None
+                      ) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the series reduced for an axis `pixel_width` pixels wide, if it has more than a few points per pixel,
+    else unchanged; also unchanged if its x values are not sorted. The `minmax` method keeps the extremes of each
+    pixel; `lttb` keeps two points per pixel that preserve the line's shape, and applies only to lines: series drawn
+    with `steps-post` always use min/max, which preserves held values. With a `cache_owner`, e.g. the array the series
+    was taken from, and a `cache_key` that tells series of that owner apart, min/max reductions at finer resolutions
+    are kept as long as the owner is, so that rendering the series again, at a width whose bins nest in those of a
+    kept reduction, starts from it instead of from every point, with the same result. If the axis will only show part
+    of the series, between the `x_limits`, the pixels are counted over the whole series, so the part shown keeps its
+    resolution; as min/max keeps the extremes of the part not shown, the y range of the axis is unchanged."""
+    if x_limits is not None and len(x_data) > 0:
+        pixel_width = _pixels_over_series(x_data, pixel_width, log_x, x_limits)
+    if method == 'none' or len(x_data) <= _points_per_pixel_threshold * pixel_width:
+        return x_data, y_data
+    if np.any(np.diff(x_data) < 0):
+        return x_data, y_data
+    if method == 'lttb' and not drawstyle.startswith('steps'):
+        return lttb_downsample(x_data, y_data, 2 * pixel_width)
+    if method not in ('minmax', 'lttb'):
+        raise ValueError('Unknown downsampling method <{}>; options are {}'.format(method, downsample_methods))
+    if cache_owner is None:
+        return minmax_downsample(x_data, y_data, pixel_width, log_x)
+    full_key = (id(cache_owner), (cache_key, log_x))
+    if full_key not in _level_cache:
+        _level_cache[full_key] = {}
+        weakref.finalize(cache_owner, _level_cache.pop, full_key, None)
+    level_x, level_y = _cached_minmax_level(_level_cache[full_key], x_data, y_data, pixel_width, log_x)
+    # a level may have few points per bin; it is reduced regardless, as the series would have been
+    return _minmax_bins(level_x, level_y, pixel_width, log_x, _display_range(x_data, log_x))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Reduce many replicate observable files, e.g. one <data.csv> per simulation, into ensemble statistics on a fixed
+time grid: per observable and time point, the number of replicates, the mean and standard deviation, the extremes, and
+approximate quantiles. Replicates are read one at a time, and every accumulator has a size set by the grid, the number
+of observables, and the size of the quantile sketches, so memory use does not grow with the number of replicates. The
+summary is saved as a NumPy archive, which `kappa_observable_coplotter` can render."""
+
+import matplotlib.axes as mpa
+import numpy as np
+import warnings
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from .observable_coplotter import align_replicates, _ensemble_axis_annotator
+from .observable_plotter import observable_file_reader, observable_file_time_span
+
+default_quantiles = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+def reduce_observable_ensemble(file_names: Sequence[Union[str, Path]], grid_points: int = 1000,
+                               interpolation: str = 'step', variables: Optional[List[str]] = None,
+                               sketch_size: int = 100, quantiles: Sequence[float] = default_quantiles,
+                               use_cache: bool = False, seed: Optional[int] = None,
+                               verbose: bool = False) -> Dict[str, np.ndarray]:
+    """Streams the files, resampling each onto `grid_points` evenly spaced times spanning all of them, see
+    `align_replicates`, and returns the ensemble summary as a dictionary of arrays: `legend`, the time column's name
+    then those of the observables, all or the requested `variables`; `time`, the grid; `replicates`, the number of
+    files; then, indexed by time point and observable, `count`, the replicates with a value there, `mean` and `std`,
+    accumulated with Welford's algorithm, `min` and `max`; and `quantile_values`, indexed by the `quantiles` first.
+    Quantiles are taken from a reservoir sample of `sketch_size` values per time point and observable, which is exact
+    for ensembles up to that size, and an unbiased sample of the replicates beyond it. The grid is set beforehand from
+    the first and last times of each file, which are read without parsing the rest."""
+    if not file_names:
+        raise ValueError('No replicate files given.')
+    if sketch_size < 1:
+        raise ValueError('Quantile sketches need at least one value, got {}'.format(sketch_size))
+    time_spans = np.array([observable_file_time_span(file_name) for file_name in file_names])
+    time_grid = np.linspace(time_spans[:, 0].min(), time_spans[:, 1].max(), grid_points)
+    rng = np.random.default_rng(seed)
+    legend: Optional[List[str]] = None
+    for file_ix, file_name in enumerate(file_names):
+        legend_data, numeric_data = observable_file_reader(file_name, use_cache, columns=variables)
+        aligned_names, aligned = align_replicates([(legend_data, numeric_data, str(file_name))], time_grid,
+                                                  interpolation)
+        if legend is None:
+            legend = legend_data[:1] + aligned_names
+            shape = (grid_points, len(aligned_names))
+            counts = np.zeros(shape, dtype=np.int64)
+            means, sum_squares = np.zeros(shape), np.zeros(shape)
+            minima, maxima = np.full(shape, np.nan), np.full(shape, np.nan)
+            reservoir = np.full((sketch_size,) + shape, np.nan)
+        try:
+            values = aligned[0][:, [aligned_names.index(name) for name in legend[1:]]]
+        except ValueError as ve:
+            raise ValueError('File {} lacks observables of the first file: {}'.format(file_name, legend[1:])) from ve
+        present = ~np.isnan(values)
+        counts += present
+        delta = np.where(present, values - means, 0.0)
+        means += delta / np.maximum(counts, 1)
+        sum_squares += np.where(present, delta * (values - means), 0.0)
+        minima, maxima = np.fmin(minima, values), np.fmax(maxima, values)
+        # reservoir sampling: the n-th value of a cell takes a random slot with probability sketch_size / n
+        slots = np.where(counts <= sketch_size, counts - 1, rng.integers(0, np.maximum(counts, 1)))
+        replace = present & (slots < sketch_size)
+        time_ix, observable_ix = np.nonzero(replace)
+        reservoir[slots[replace], time_ix, observable_ix] = values[replace]
+        if verbose:
+            print('Reduced replicate {} of {}: {}'.format(file_ix + 1, len(file_names), file_name))
+    with warnings.catch_warnings():
+        # time points no replicate reaches have no values
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        quantile_values = np.nanquantile(reservoir, quantiles, axis=0)
+        stds = np.sqrt(sum_squares / counts)
+    return {'legend': np.array(legend), 'time': time_grid, 'replicates': np.array(len(file_names)),
+            'count': counts, 'mean': np.where(counts > 0, means, np.nan), 'std': stds, 'min': minima,
+            'max': maxima, 'quantiles': np.array(quantiles, dtype=float), 'quantile_values': quantile_values}
+
+
+def write_ensemble_summary(summary: Dict[str, np.ndarray], output_file: Union[str, Path]) -> None:
+    """Saves the summary returned by `reduce_observable_ensemble` as a compressed NumPy archive."""
+    np.savez_compressed(output_file, **summary)
+
+
+def read_ensemble_summary(summary_file: Union[str, Path]) -> Dict[str, np.ndarray]:
+    """Loads a summary saved by `write_ensemble_summary`."""
+    with np.load(summary_file) as archive:
+        if 'quantile_values' not in archive:
+            raise ValueError('File {} is not an ensemble summary'.format(summary_file))
+        return {key: archive[key] for key in archive.files}
+
+
+def ensemble_summary_axis_annotator(target_axis: mpa.Axes, summary_file: Union[str, Path],
+                                    variable_index: int, variable_name: str,
+                                    log_axis_x: bool = False, log_axis_y: bool = False, no_legend: bool = False,
+                                    band_quantiles: Tuple[float, ...] = (0.05, 0.25)) -> mpa.Axes:
+    """Plots, from a summary saved by `write_ensemble_summary`, the mean of one observable, chosen by its index in the
+    legend, time being the first, or by its name, with bands between each of the `band_quantiles` and its complement;
+    these must be among the quantiles kept in the summary."""
+    summary = read_ensemble_summary(summary_file)
+    legend = [str(name) for name in summary['legend']]
+    if variable_index:
+        if variable_index not in range(2, len(legend) + 1):
+            raise ValueError('Variable {} not in observables; valid range is [2;{}]'.format(
+                variable_index, len(legend)))
+        variable_name = legend[variable_index - 1]
+    elif not variable_name:
+        raise ValueError('Ensemble summaries hold statistics of single observables; a variable index or name is'
+                         ' required, as those of an expression can not be derived from them.')
+    if variable_name not in legend[1:]:
+        raise ValueError('{} not found in observables; entries are:\n{}'.format(variable_name, ', '.join(legend[1:])))
+    column = legend.index(variable_name) - 1
+    kept_quantiles = summary['quantiles']
+    quantile_bands = []
+    for quantile in band_quantiles:
+        band_ix = [np.flatnonzero(np.isclose(kept_quantiles, level)) for level in (quantile, 1 - quantile)]
+        if any(len(level_ix) == 0 for level_ix in band_ix):
+            raise ValueError('Quantiles {:g} and {:g} not both in summary; kept quantiles are {}'.format(
+                quantile, 1 - quantile, ', '.join('{:g}'.format(level) for level in kept_quantiles)))
+        quantile_bands.append((quantile, summary['quantile_values'][band_ix[0][0], :, column],
+                               summary['quantile_values'][band_ix[1][0], :, column]))
+    _ensemble_axis_annotator(co_plot_axis=target_axis, time_points=summary['time'],
+                             mean_values=summary['mean'][:, column], quantile_bands=quantile_bands,
+                             title=variable_name, replicate_number=int(summary['replicates']),
+                             log_x=log_axis_x, log_y=log_axis_y, omit_legend=no_legend)
+    return target_axis
@@ -1,32 +1,205 @@
 #!/usr/bin/env python3
 
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import List, Optional, TextIO, Tuple, Union
 import ast
 import csv
+import json
 import matplotlib.axes as mpa
 import numpy as np
+import os
+import warnings
+from .observable_downsampler import axis_pixel_width, downsample_series
 
 
-def observable_file_reader(file_name: Union[str, Path] = 'data.csv') -> Tuple[list, np.ndarray]:
-    """Function parses a kappa output file, e.g. <data.csv>, and returns the legend and numeric data."""
-    # read the header, skipping UUID and command recipe, extract legend entries
+def _cache_files(file_name: Union[str, Path]) -> Tuple[Path, Path]:
+    """Returns the names of the sidecar cache of an observable file: the array, and the legend with the source's
+    modification time and size."""
+    return Path(str(file_name) + '.cache.npy'), Path(str(file_name) + '.cache.json')
+
+
+def _read_observable_cache(file_name: Union[str, Path]) -> Optional[Tuple[list, np.ndarray]]:
+    """Returns the legend and memory-mapped data of the cache of an observable file, or `None` if there is no cache,
+    or it is older than the file."""
+    array_file, legend_file = _cache_files(file_name)
+    if not array_file.exists() or not legend_file.exists():
+        return None
+    with open(legend_file, 'r') as lf:
+        cache_info = json.load(lf)
+    file_stat = Path(file_name).stat()
+    if cache_info['mtime_ns'] != file_stat.st_mtime_ns or cache_info['size'] != file_stat.st_size:
+        return None
+    return cache_info['legend'], np.load(array_file, mmap_mode='r')
+
+
+def _write_observable_cache(file_name: Union[str, Path], leg_data: list, num_data: np.ndarray,
+                            file_stat: os.stat_result) -> None:
+    """Saves the sidecar cache of an observable file, recording the modification time and size the file had before it
+    was read, so that a file modified while it was read gets a cache that is already out of date. Files are written
+    under temporary names, then renamed, so that a reader never finds a partial cache."""
+    array_file, legend_file = _cache_files(file_name)
+    with open(str(array_file) + '.tmp', 'wb') as af:
+        np.save(af, num_data)
+    os.replace(str(array_file) + '.tmp', array_file)
+    with open(str(legend_file) + '.tmp', 'w') as lf:
+        json.dump({'legend': leg_data, 'mtime_ns': file_stat.st_mtime_ns, 'size': file_stat.st_size}, lf)
+    os.replace(str(legend_file) + '.tmp', legend_file)
+
+
+def _parse_numeric_block(data_file: TextIO, column_number: int, file_name: Union[str, Path], chunk_rows: int,
+                         column_indexes: Optional[List[int]] = None) -> np.ndarray:
+    """Parses comma-separated rows of numbers, from the current position of the file, with `np.loadtxt`, `chunk_rows`
+    rows at a time, so that a parse error can be placed in the file. Blank lines are skipped. With `column_indexes`,
+    zero-based, only those columns are converted and kept."""
+    kept_number = column_number if column_indexes is None else len(column_indexes)
+    chunks = []
+    row_number = 0
+    while True:
+        try:
+            with warnings.catch_warnings():
+                # the read after the last row finds no data
+                warnings.simplefilter('ignore', UserWarning)
+                values = np.loadtxt(data_file, dtype=float, delimiter=',', usecols=column_indexes, ndmin=2,
+                                    max_rows=chunk_rows)
+        except ValueError as ve:
+            raise ValueError('Could not parse numbers in file {}, after row {}: {}'.format(
+                file_name, row_number, ve)) from ve
+        if values.shape[0] == 0:
+            break
+        if values.shape[1] != kept_number:
+            raise ValueError('Expected {} columns in file {}, after row {}'.format(
+                column_number, file_name, row_number))
+        chunks.append(values)
+        row_number += values.shape[0]
+        if values.shape[0] < chunk_rows:
+            break
+    if not chunks:
+        return np.empty((0, kept_number), dtype=float)
+    return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+def _read_legend_line(csv_file: TextIO) -> list:
+    """Reads the three header lines of a kappa output file, skipping command recipe and UUID; returns the legend."""
+    _ = csv_file.readline()     # recipe line
+    _ = csv_file.readline()     # UUID line
+    leg_data = next(csv.reader([csv_file.readline()], dialect='excel'))
+    return [entry.replace("'", "").replace('"', '') for entry in leg_data]
+
+
+def observable_file_legend(file_name: Union[str, Path] = 'data.csv') -> list:
+    """Returns the legend of a kappa output file, e.g. <data.csv>, reading only its header; or the column names of an
+    `.npz` table."""
+    if Path(file_name).suffix == '.npz':
+        with np.load(file_name) as archive:
+            return [str(column) for column in archive['columns']]
     with open(file_name, 'r', newline='') as csv_file:
-        legend_reader = csv.reader(csv_file, dialect='excel')
-        _ = next(legend_reader)         # recipe line
-        _ = next(legend_reader)         # UUID line
-        leg_data = next(legend_reader)  # legend line
-    num_data = np.loadtxt(file_name, delimiter=',', skiprows=3)
-    leg_data = [entry.replace("'", "").replace('"', '') for entry in leg_data]
+        return _read_legend_line(csv_file)
+
+
+def observable_file_time_span(file_name: Union[str, Path] = 'data.csv') -> Tuple[float, float]:
+    """Returns the first and last times of a kappa output file, reading only its header, first row, and the end of the
+    file; or those of an `.npz` table."""
+    if Path(file_name).suffix == '.npz':
+        with np.load(file_name) as archive:
+            return float(archive['data'][0, 0]), float(archive['data'][-1, 0])
+    with open(file_name, 'rb') as data_file:
+        for _ in range(3):
+            data_file.readline()
+        first_line = data_file.readline()
+        while first_line and not first_line.strip():
+            first_line = data_file.readline()
+        data_file.seek(0, os.SEEK_END)
+        file_size = data_file.tell()
+        tail_size = 1 << 12
+        while True:
+            data_file.seek(max(0, file_size - tail_size))
+            tail_lines = data_file.read().split(b'\n')
+            last_lines = [line for line in tail_lines[1:] if line.strip()]
+            if last_lines or tail_size >= file_size:
+                break
+            tail_size *= 2
+    last_line = last_lines[-1] if last_lines else first_line
+    return float(first_line.split(b',')[0]), float(last_line.split(b',')[0])
+
+
+def _resolve_columns(leg_data: list, columns: List[Union[int, str]], file_name: Union[str, Path]) -> List[int]:
+    """Returns the zero-based positions, in file order, of the requested columns, given by name or by one-based index,
+    as with `-vi`; the time column is always included."""
+    positions = {0}
+    for column in columns:
+        if isinstance(column, str):
+            if column not in leg_data:
+                raise ValueError('{} not found in observables of {}; entries are:\n{}'.format(
+                    column, file_name, ', '.join(leg_data)))
+            positions.add(leg_data.index(column))
+        else:
+            if column not in range(1, len(leg_data) + 1):
+                raise ValueError('Variable {} not in observables; valid range is [1;{}]'.format(column, len(leg_data)))
+            positions.add(column - 1)
+    return sorted(positions)
+
+
+def observable_file_reader(file_name: Union[str, Path] = 'data.csv', use_cache: bool = False,
+                           chunk_rows: int = 1 << 18,
+                           columns: Optional[List[Union[int, str]]] = None) -> Tuple[list, np.ndarray]:
+    """Function parses a kappa output file, e.g. <data.csv>, and returns the legend and numeric data. Also reads the
+    `.npz` tables written by `write_summary`, see `KaSaAn.functions.snapshot_summarizer`. The file is read once: the
+    three header lines, then the numbers, `chunk_rows` rows at a time, with `np.loadtxt`. With `columns`, names or
+    one-based indexes, only those columns and the time column are converted and returned, in file order, along with
+    their legend; see `observable_columns_needed`. With `use_cache`, the data are also saved next to the file, as
+    `<file>.cache.npy` and `<file>.cache.json`, and later calls memory-map them instead of parsing the file again, as
+    long as the file is not modified; the cache holds every column, from which those requested are taken."""
+    if Path(file_name).suffix == '.npz':
+        with np.load(file_name) as archive:
+            leg_data, num_data = [str(column) for column in archive['columns']], archive['data']
+    else:
+        cached_data = _read_observable_cache(file_name) if use_cache else None
+        if cached_data is not None:
+            leg_data, num_data = cached_data
+        else:
+            with open(file_name, 'r', newline='') as csv_file:
+                file_stat = os.fstat(csv_file.fileno())
+                leg_data = _read_legend_line(csv_file)
+                # a cache must hold every column, so selection waits until it is written
+                column_indexes = _resolve_columns(leg_data, columns, file_name) if columns and not use_cache else None
+                num_data = _parse_numeric_block(csv_file, len(leg_data), file_name, chunk_rows, column_indexes)
+            if use_cache:
+                _write_observable_cache(file_name, leg_data, num_data, file_stat)
+            if column_indexes is not None:
+                return [leg_data[ix] for ix in column_indexes], num_data
+    if columns:
+        column_indexes = _resolve_columns(leg_data, columns, file_name)
+        return [leg_data[ix] for ix in column_indexes], np.asarray(num_data[:, column_indexes])
     return leg_data, num_data
 
 
+def observable_columns_needed(leg_data: list, vars_indexes: Optional[List[int]] = None,
+                              vars_names: Optional[List[str]] = None,
+                              vars_exprs: Optional[List[str]] = None) -> Optional[List[str]]:
+    """Returns the names of the columns that `observable_list_axis_annotator` needs to plot the given variables, for
+    the legend of a file: those given by index or name, and those named in the algebraic expressions, found through
+    their syntax trees; `None` if no variable was given, as then every column is plotted."""
+    if not vars_indexes and not vars_names and not vars_exprs:
+        return None
+    needed = [leg_data[ix] for ix in _resolve_columns(leg_data, list(vars_indexes or []), 'the file')[1:]]
+    needed.extend(vars_names or [])
+    for alg_expression in vars_exprs or []:
+        for node in ast.walk(ast.parse(alg_expression, mode='eval')):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in leg_data:
+                needed.append(node.value)
+    return list(dict.fromkeys(needed))
+
+
 def observable_list_axis_annotator(obs_axis: mpa.Axes, data: Tuple[list, np.ndarray],
                                    vars_indexes: Optional[List[int]], vars_names: Optional[List[str]], vars_exprs: Optional[List[str]],
                                    axis_x_log: bool = False, axis_y_log: bool = False,
-                                   diff_toggle: bool = False, add_legend: bool = True) -> mpa.Axes:
+                                   diff_toggle: bool = False, add_legend: bool = True,
+                                   downsample: str = 'minmax',
+                                   x_limits: Optional[Tuple[Optional[float], Optional[float]]] = None) -> mpa.Axes:
     """Function plots a parsed kappa output file, e.g. <data.csv>, and returns a matplotlib figure object. See file
-     under `KaSaAn.scripts` for further usage."""
+     under `KaSaAn.scripts` for further usage. Series with many more points than the axis has pixels are reduced first,
+     with the `downsample` method, for the `x_limits` the axis will be set to, if any, see `downsample_series`; `none`
+     plots every point."""
     leg_data, num_data = data
     data_to_plot = []
     legend_to_plot = []
@@ -91,6 +264,7 @@ def observable_list_axis_annotator(obs_axis: mpa.Axes, data: Tuple[list, np.ndar
         if np.any(d_t == 0.0):
             raise ValueError('Time difference of zero found in input data.')
     # plot
+    pixel_width = axis_pixel_width(obs_axis)
     for ix, this_var in enumerate(legend_to_plot):
         y_data = data_to_plot[ix]
         if diff_toggle:
@@ -100,7 +274,9 @@ def observable_list_axis_annotator(obs_axis: mpa.Axes, data: Tuple[list, np.ndar
             plot_drawstyle = 'steps-post'
         else:
             plot_drawstyle = 'default'
-        obs_axis.plot(x_data, y_data, label=this_var, drawstyle=plot_drawstyle)
+        x_plot, y_plot = downsample_series(x_data, y_data, pixel_width, downsample, axis_x_log, plot_drawstyle,
+                                           cache_owner=num_data, cache_key=(this_var, diff_toggle), x_limits=x_limits)
+        obs_axis.plot(x_plot, y_plot, label=this_var, drawstyle=plot_drawstyle)
     # add condition for case when external legend control is desired
     if add_legend:
         obs_axis.legend()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Tabulate the activity of each rule of a model from a KaSim trace: how many times it fired, and the intervals between
+its firings, in bins of simulation time. The trace is read once, and the accumulators have a fixed size, so memory use
+does not grow with the length of the trace. The table can be saved like `data.csv`, see `write_summary`, and plotted
+with the observable plotters."""
+
+import numpy as np
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from ..core import KappaTrace
+
+
+def _merge_bin_pairs(firings: np.ndarray, interval_counts: np.ndarray, means: np.ndarray,
+                     sum_squares: np.ndarray) -> None:
+    """Halves the time resolution, in place: each pair of adjacent bins is merged into the first half of the arrays,
+    combining the interval means and sums of squared deviations as per Chan et al., and the second half is zeroed."""
+    half = firings.shape[1] // 2
+    count_a, count_b = interval_counts[:, 0::2], interval_counts[:, 1::2]
+    mean_a, mean_b = means[:, 0::2], means[:, 1::2]
+    merged_count = count_a + count_b
+    safe_count = np.maximum(merged_count, 1)
+    merged_mean = (count_a * mean_a + count_b * mean_b) / safe_count
+    merged_sum_squares = sum_squares[:, 0::2] + sum_squares[:, 1::2] + \
+        (mean_b - mean_a) ** 2 * count_a * count_b / safe_count
+    firings[:, :half] = firings[:, 0::2] + firings[:, 1::2]
+    interval_counts[:, :half], means[:, :half], sum_squares[:, :half] = merged_count, merged_mean, merged_sum_squares
+    for accumulator in (firings, interval_counts, means, sum_squares):
+        accumulator[:, half:] = 0
+
+
+def rule_activity_of_trace(trace_file: Union[str, Path], bin_number: int = 100) -> Tuple[List[str], np.ndarray]:
+    """Reads the rule steps of a trace, and returns the column names and a two-dimensional array with one row per bin
+    of simulation time. Columns are the start time of the bin, `[T]`; the number of events in it, `events`, and the
+    mean and standard deviation of the time between consecutive events that end in it, `interval_mean` and
+    `interval_std`; then the same for each rule, as `firings(r)`, `interval_mean(r)`, and `interval_std(r)`, where an
+    interval is the time since the previous firing of that rule. Bins start at time zero and are of equal width; as
+    the final time is not known in advance, the width starts at the time of the first event, and doubles, merging
+    adjacent bins, whenever an event falls past the last bin, so that about half of the `bin_number` bins, or more, are
+    in use. Interval statistics are accumulated with Welford's algorithm; they are `NaN` in bins without intervals."""
+    if bin_number < 2:
+        raise ValueError('At least two bins are needed, got {}'.format(bin_number))
+    bin_number += bin_number % 2
+    trace = KappaTrace(trace_file)
+    rule_names = trace.get_rule_names()
+    rule_rows = [elementary_rule['syntactic_rule'] - 1 for elementary_rule in trace.get_model()['elementary_rules']]
+    # the last row accumulates every event, whichever rule fired
+    row_number = len(rule_names) + 1
+    firings = np.zeros((row_number, bin_number), dtype=np.int64)
+    interval_counts = np.zeros((row_number, bin_number), dtype=np.int64)
+    means = np.zeros((row_number, bin_number), dtype=float)
+    sum_squares = np.zeros((row_number, bin_number), dtype=float)
+    last_firing = [None] * row_number
+    bin_width = 0.0
+    last_bin = 0
+    for rule_id, _, event_time in trace.iter_rule_firings():
+        if bin_width == 0.0 and event_time > 0:
+            bin_width = event_time
+        while bin_width > 0 and event_time >= bin_width * bin_number:
+            _merge_bin_pairs(firings, interval_counts, means, sum_squares)
+            bin_width *= 2
+            last_bin //= 2
+        bin_ix = int(event_time // bin_width) if bin_width > 0 else 0
+        last_bin = max(last_bin, bin_ix)
+        for row in (rule_rows[rule_id], row_number - 1):
+            firings[row, bin_ix] += 1
+            if last_firing[row] is not None:
+                interval = event_time - last_firing[row]
+                interval_counts[row, bin_ix] += 1
+                delta = interval - means[row, bin_ix]
+                means[row, bin_ix] += delta / interval_counts[row, bin_ix]
+                sum_squares[row, bin_ix] += delta * (interval - means[row, bin_ix])
+            last_firing[row] = event_time
+    # only bins up to the last event are reported
+    used_bins = slice(0, last_bin + 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        interval_means = np.where(interval_counts > 0, means, np.nan)[:, used_bins]
+        interval_stds = np.sqrt(sum_squares / interval_counts)[:, used_bins]
+    column_names = ['[T]', 'events', 'interval_mean', 'interval_std']
+    columns = [np.arange(last_bin + 1) * bin_width, firings[-1, used_bins], interval_means[-1], interval_stds[-1]]
+    for row, rule_name in enumerate(rule_names):
+        column_names.extend('{}({})'.format(measure, rule_name) for measure in
+                            ['firings', 'interval_mean', 'interval_std'])
+        columns.extend([firings[row, used_bins], interval_means[row], interval_stds[row]])
+    return column_names, np.column_stack(columns).astype(float)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Read snapshot files ahead of the code that parses them, so that on slow or network filesystems the latency of each
+read overlaps with the parsing of earlier snapshots, rather than stalling it."""
+
+import asyncio
+import itertools
+import queue
+import threading
+from collections import deque
+from typing import Deque, Iterator, List, Tuple, Union
+
+# marks the end of the series in the hand-off queue
+_end_of_series = object()
+
+
+def _read_text(snapshot_name: str) -> str:
+    """Returns the contents of a snapshot file."""
+    with open(snapshot_name, 'r') as kf:
+        return kf.read()
+
+
+async def _prefetch_into(snapshot_names: List[str], hand_off: queue.Queue, depth: int,
+                         stop: threading.Event) -> None:
+    """Reads up to `depth` files concurrently, each in a worker thread, and puts their contents into the hand-off queue
+    in series order; a failed read is handed off as its exception. Waits while the queue is full, and ends early if the
+    consumer stops."""
+    names_pending = iter(snapshot_names)
+    reads_in_flight: Deque[Tuple[str, asyncio.Future]] = deque()
+    for snapshot_name in itertools.islice(names_pending, depth):
+        reads_in_flight.append((snapshot_name, asyncio.ensure_future(asyncio.to_thread(_read_text, snapshot_name))))
+    while reads_in_flight and not stop.is_set():
+        snapshot_name, read_job = reads_in_flight.popleft()
+        try:
+            contents: Union[str, Exception] = await read_job
+        except Exception as exc:
+            contents = exc
+        for next_name in itertools.islice(names_pending, 1):
+            reads_in_flight.append((next_name, asyncio.ensure_future(asyncio.to_thread(_read_text, next_name))))
+        await asyncio.to_thread(hand_off.put, (snapshot_name, contents))
+    for _, read_job in reads_in_flight:
+        read_job.cancel()
+    await asyncio.to_thread(hand_off.put, _end_of_series)
+
+
+def prefetch_snapshot_files(snapshot_names: List[str], depth: int = 4,
+                            yield_errors: bool = False) -> Iterator[Tuple[str, Union[str, Exception]]]:
+    """Yields, in order, each snapshot name with the contents of its file, e.g. to create the snapshot with
+    `KappaSnapshot(snapshot_name, raw_expression)`. An asyncio event loop, on a background thread, keeps up to `depth`
+    files being read, and up to `depth` more read but not yet consumed, so at most about twice `depth` files are held
+    in memory. A file that can not be read raises its error when its turn comes, which ends the series; with
+    `yield_errors`, its error is yielded in place of its contents instead, and the series goes on. With a `depth` of
+    zero, files are read on demand, without a background thread."""
+    if depth < 1:
+        for snapshot_name in snapshot_names:
+            try:
+                contents: Union[str, Exception] = _read_text(snapshot_name)
+            except Exception as exc:
+                if not yield_errors:
+                    raise
+                contents = exc
+            yield snapshot_name, contents
+        return
+    hand_off: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    loader = threading.Thread(target=asyncio.run, args=(_prefetch_into(snapshot_names, hand_off, depth, stop),),
+                              daemon=True)
+    loader.start()
+    try:
+        while True:
+            item = hand_off.get()
+            if item is _end_of_series:
+                break
+            snapshot_name, contents = item
+            if isinstance(contents, Exception) and not yield_errors:
+                raise contents
+            yield snapshot_name, contents
+    finally:
+        # if the consumer stopped early, unblock the loader so its thread can finish
+        stop.set()
+        while loader.is_alive():
+            try:
+                hand_off.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        loader.join()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""A local store of per-snapshot analysis results, backed by SQLite, so series analyses only parse snapshots that are
+new or changed since the last run. Rows are keyed by the snapshot's resolved path, its modification time and size, and
+the name and parameters of the analysis; payloads are stored as JSON. For analyses split over several machines, series
+can be partitioned into shards, whose partial results files are merged afterwards."""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+def _open_results_store(cache_file: Union[str, Path]) -> sqlite3.Connection:
+    """Opens, creating if needed, the results store at the given file."""
+    connection = sqlite3.connect(str(cache_file))
+    connection.execute('CREATE TABLE IF NOT EXISTS snapshot_results ('
+                       ' path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,'
+                       ' analysis TEXT NOT NULL, parameters TEXT NOT NULL, payload TEXT NOT NULL,'
+                       ' PRIMARY KEY (path, analysis, parameters))')
+    return connection
+
+
+def _file_key(snapshot_name: Union[str, Path]) -> Tuple[str, int, int]:
+    """Returns the resolved path, modification time in nanoseconds, and size in bytes, of a snapshot file."""
+    file_path = Path(snapshot_name).resolve()
+    file_stat = file_path.stat()
+    return str(file_path), file_stat.st_mtime_ns, file_stat.st_size
+
+
+def load_cached_results(cache_file: Union[str, Path], snapshot_names: List[str], analysis: str,
+                        parameters: str) -> Tuple[Dict[str, Any], List[str], Dict[str, Tuple[str, int, int]]]:
+    """Returns a dictionary of snapshot names to their cached results for the given analysis and parameters, the list
+    of snapshot names, in their original order, that have no valid cached result: never analyzed, or modified since
+    (different modification time or size), and the keys of the latter, taken now, before they are parsed, to be
+    handed to `store_results`. A file modified while it is analyzed is thus stored under its earlier key, and analyzed
+    again on the next run. Files removed since they were listed are listed as not cached, but have no key, so the
+    analysis reports them when it fails to read them, and nothing is stored for them."""
+    cached_results: Dict[str, Any] = {}
+    names_missing: List[str] = []
+    file_keys: Dict[str, Tuple[str, int, int]] = {}
+    with _open_results_store(cache_file) as connection:
+        for snap_name in snapshot_names:
+            try:
+                file_key = _file_key(snap_name)
+            except FileNotFoundError:
+                names_missing.append(snap_name)
+                continue
+            file_path, mtime_ns, size = file_key
+            row = connection.execute(
+                'SELECT payload FROM snapshot_results'
+                ' WHERE path = ? AND analysis = ? AND parameters = ? AND mtime_ns = ? AND size = ?',
+                (file_path, analysis, parameters, mtime_ns, size)).fetchone()
+            if row is None:
+                names_missing.append(snap_name)
+                file_keys[snap_name] = file_key
+            else:
+                cached_results[snap_name] = json.loads(row[0])
+    connection.close()
+    return cached_results, names_missing, file_keys
+
+
+def store_results(cache_file: Union[str, Path], results: Dict[str, Any], analysis: str, parameters: str,
+                  file_keys: Dict[str, Tuple[str, int, int]]) -> None:
+    """Saves, replacing any previous entry, the results of an analysis with the given parameters, as a dictionary of
+    snapshot names to JSON-serializable payloads, each under the key its file had before it was parsed, as returned by
+    `load_cached_results`; results without a key are not saved."""
+    with _open_results_store(cache_file) as connection:
+        for snap_name, payload in results.items():
+            if snap_name not in file_keys:
+                continue
+            file_path, mtime_ns, size = file_keys[snap_name]
+            connection.execute('INSERT OR REPLACE INTO snapshot_results VALUES (?, ?, ?, ?, ?, ?)',
+                               (file_path, mtime_ns, size, analysis, parameters, json.dumps(payload)))
+    connection.close()
+
+
+def parse_shard(shard_spec: str) -> Tuple[int, int]:
+    """Parses a shard specification of the form `i/N`, the zero-based index of this shard, and the number of shards;
+    e.g. `0/4` through `3/4` split a series four ways. Usable as an `argparse` type."""
+    try:
+        shard_index, shard_number = (int(part) for part in shard_spec.split('/'))
+    except ValueError:
+        raise ValueError('Expected a shard as <index/number>, e.g. <0/4>; got <{}>'.format(shard_spec))
+    if not 0 <= shard_index < shard_number:
+        raise ValueError('Shard index must be zero or positive, and less than the shard number; got <{}>'.format(
+            shard_spec))
+    return shard_index, shard_number
+
+
+def select_shard(snapshot_names: List[str], shard_index: int, shard_number: int) -> List[str]:
+    """Returns the snapshot names that belong to a shard: every `shard_number`-th name, starting at `shard_index`. The
+    partition depends only on the list, so independent processes that discover the same snapshots agree on it without
+    coordination; dealing names out in turn also spreads the larger, late snapshots evenly over the shards."""
+    return snapshot_names[shard_index::shard_number]
+
+
+def write_partial_results(partial_file: Union[str, Path], results: Dict[str, Any], analysis: str, parameters: str,
+                          shard_index: int, shard_number: int) -> None:
+    """Saves the results of one shard of an analysis, as a dictionary of snapshot names to JSON-serializable payloads,
+    into a JSON file that records the analysis, its parameters, and the shard; see `merge_partial_results`."""
+    with open(partial_file, 'w') as out_file:
+        json.dump({'analysis': analysis, 'parameters': parameters, 'shard': [shard_index, shard_number],
+                   'results': results}, out_file)
+
+
+def merge_partial_results(partial_files: List[Union[str, Path]], analysis: str,
+                          parameters: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
+    """Combines the partial results files of a sharded analysis, see `write_partial_results`, into one dictionary of
+    snapshot names to payloads; also returns the parameters the shards were run with. Raises a `ValueError` if the files
+    come from another analysis, from runs with different parameters (or different from those given), or do not cover
+    every shard exactly once."""
+    if not partial_files:
+        raise ValueError('No partial results files to merge')
+    merged_results: Dict[str, Any] = {}
+    shards_seen: Dict[int, str] = {}
+    shard_number = None
+    for partial_file in partial_files:
+        with open(partial_file, 'r') as in_file:
+            partial = json.load(in_file)
+        if partial['analysis'] != analysis:
+            raise ValueError('Partial results file <{}> is of analysis <{}>, expected <{}>'.format(
+                partial_file, partial['analysis'], analysis))
+        if parameters is None:
+            parameters = partial['parameters']
+        elif partial['parameters'] != parameters:
+            raise ValueError('Partial results file <{}> has parameters <{}>, expected <{}>'.format(
+                partial_file, partial['parameters'], parameters))
+        this_index, this_number = partial['shard']
+        if shard_number is None:
+            shard_number = this_number
+        elif this_number != shard_number:
+            raise ValueError('Partial results file <{}> is shard {}/{}, expected {} shards'.format(
+                partial_file, this_index, this_number, shard_number))
+        if this_index in shards_seen:
+            raise ValueError('Shard {}/{} found in both <{}> and <{}>'.format(
+                this_index, shard_number, shards_seen[this_index], partial_file))
+        shards_seen[this_index] = str(partial_file)
+        merged_results.update(partial['results'])
+    shards_missing = sorted(set(range(shard_number)) - set(shards_seen))
+    if shards_missing:
+        raise ValueError('Missing partial results for shards {} of {}'.format(shards_missing, shard_number))
+    return merged_results, parameters
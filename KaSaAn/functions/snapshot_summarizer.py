@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Summarize a series of snapshots into a table with one row per snapshot, parsing each snapshot once. The table can be
+saved as a CSV laid out like KaSim's `data.csv`, or as a NumPy `.npz`; the observable plotters read either."""
+
+import concurrent.futures as cofu
+import csv
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from ..core import KappaSnapshot
+from .graph_largest_complex_composition import _print_progress
+
+
+# columns present for every snapshot, in table order; time first, as in KaSim's output files
+_fixed_columns = ['[T]', 'event', 'total_mass', 'species', 'complexes', 'largest_size',
+                  'size_mean', 'size_variance', 'size_mass_mean']
+
+
+def summarize_snapshot(snapshot_name: str, pattern_expressions: Optional[List[str]] = None) -> Dict[str, float]:
+    """Parses a snapshot and returns a dictionary of column names to values: time, event, total mass, number of
+    distinct species, number of complexes, size of the largest complex, mean and variance of complex size (counting
+    complexes), and the mass-weighted mean size (the size of complex an average agent is in); the abundance of each
+    agent type, as `|A()|`; the value of each token, as `|tok|`; and the number of embeddings of each requested
+    pattern, also as `|pattern|`, which matches how Kappa counts occurrences. A snapshot without complexes, e.g. of
+    tokens only, has a largest size of zero, and `NaN` size statistics."""
+    snap = KappaSnapshot(snapshot_name)
+    agent_types, matrix, abundances, sizes, masses = snap.composition_matrix()
+    total_mass = int(masses.sum())
+    complex_number = int(abundances.sum())
+    summary = {
+        '[T]': snap.get_snapshot_time(),
+        'event': snap.get_snapshot_event(),
+        'total_mass': total_mass,
+        'species': len(abundances),
+        'complexes': complex_number,
+        'largest_size': 0,
+        'size_mean': np.nan,
+        'size_variance': np.nan,
+        'size_mass_mean': np.nan}
+    if complex_number > 0:
+        size_mean = total_mass / complex_number
+        summary.update({
+            'largest_size': int(sizes.max()),
+            'size_mean': size_mean,
+            'size_variance': float(np.sum(abundances * (sizes - size_mean) ** 2) / complex_number),
+            'size_mass_mean': float(np.sum(masses * sizes) / total_mass)})
+    for agent_type, type_abundance in zip(agent_types, matrix.T @ abundances):
+        summary['|{}|'.format(agent_type)] = int(type_abundance)
+    for token_name, token_value in snap.get_all_tokens_and_values().items():
+        summary['|{}|'.format(token_name)] = token_value
+    for expression in pattern_expressions or []:
+        summary['|{}|'.format(expression)] = snap.get_abundance_of_pattern(expression)[0]
+    return summary
+
+
+def summarize_snapshots(snapshot_names: List[str], pattern_expressions: Optional[List[str]] = None,
+                        process_number: int = 1, verbose: bool = True) -> Tuple[List[str], np.ndarray]:
+    """Summarizes each snapshot, see `summarize_snapshot`, and returns the column names and a two-dimensional array
+    with one row per snapshot, sorted by time. Columns are the fixed metrics, then agent types, sorted, then tokens,
+    sorted, then the requested patterns, in order. An agent type absent from a snapshot counts as zero, while a token
+    absent from one is `NaN`. With a `process_number` above one, snapshots are parsed by that many worker processes,
+    with at most twice as many snapshots in flight."""
+    summaries: List[Dict[str, float]] = []
+    snap_num = len(snapshot_names)
+    if process_number > 1:
+        with cofu.ProcessPoolExecutor(max_workers=process_number) as executor:
+            names_pending = iter(snapshot_names)
+            jobs_in_flight = {}
+            done_number = 0
+            while True:
+                for snap_name in names_pending:
+                    jobs_in_flight[executor.submit(summarize_snapshot, snap_name, pattern_expressions)] = snap_name
+                    if len(jobs_in_flight) >= 2 * process_number:
+                        break
+                if not jobs_in_flight:
+                    break
+                jobs_done, _ = cofu.wait(jobs_in_flight, return_when=cofu.FIRST_COMPLETED)
+                for job in jobs_done:
+                    snap_name = jobs_in_flight.pop(job)
+                    done_number += 1
+                    summaries.append(job.result())
+                    if verbose:
+                        _print_progress(done_number, snap_num, snap_name)
+    else:
+        for snap_index, snap_name in enumerate(snapshot_names):
+            summaries.append(summarize_snapshot(snap_name, pattern_expressions))
+            if verbose:
+                _print_progress(snap_index + 1, snap_num, snap_name)
+    summaries.sort(key=lambda summary: (summary['[T]'], summary['event']))
+    # agent types carry parentheses, token names can not; patterns are kept last, in the order requested
+    pattern_columns = ['|{}|'.format(expression) for expression in pattern_expressions or []]
+    dynamic_columns = set().union(*(summary.keys() for summary in summaries))
+    dynamic_columns -= set(_fixed_columns) | set(pattern_columns)
+    type_columns = sorted(column for column in dynamic_columns if '(' in column)
+    token_columns = sorted(column for column in dynamic_columns if '(' not in column)
+    column_names = _fixed_columns + type_columns + token_columns + pattern_columns
+    table = np.zeros((len(summaries), len(column_names)), dtype=float)
+    for row_ix, summary in enumerate(summaries):
+        for col_ix, column in enumerate(column_names):
+            table[row_ix, col_ix] = summary.get(column, np.nan if column in token_columns else 0)
+    return column_names, table
+
+
+def write_summary(column_names: List[str], table: np.ndarray, output_file: Union[str, Path],
+                  recipe: str = '', uuid: str = '') -> None:
+    """Saves the summary table. With an `.npz` suffix, as a NumPy archive holding the `columns` names and the `data`
+    table; otherwise as a CSV with the layout of KaSim's `data.csv`: a recipe line, a UUID line, the quoted legend,
+    then the rows. Either can be read with `observable_file_reader`, hence plotted like observables."""
+    if Path(output_file).suffix == '.npz':
+        np.savez(output_file, columns=np.array(column_names), data=table)
+        return
+    with open(output_file, 'w', newline='') as csv_file:
+        csv_file.write('# Output of {}\n'.format(recipe))
+        csv_file.write('# "uuid" : "{}"\n'.format(uuid))
+        csv.writer(csv_file, dialect='excel', quoting=csv.QUOTE_ALL).writerow(column_names)
+        np.savetxt(csv_file, table, delimiter=',', fmt='%.17g')
@@ -18,10 +18,12 @@ from KaSaAn.functions import sanity_check_agent_colors, colorize_observables
 def process_snapshot(snapshot: KappaSnapshot) -> List[dict]:
     """Extract relevant information from a snapshot: size, abundance, & compositions"""
     data = []
-    for kappa_complex, abundance in snapshot.get_all_complexes_and_abundances():
-        size = kappa_complex.get_size_of_complex()
-        composition = kappa_complex.get_complex_composition()
-        data.append({'size': size, 'count': abundance, 'mass': size * abundance, 'composition': composition})
+    agent_types, matrix, abundances, sizes, masses = snapshot.composition_matrix()
+    for cx_ix in range(len(abundances)):
+        composition = {agent_types[type_ix]: int(matrix[cx_ix, type_ix])
+                       for type_ix in sorted(matrix[cx_ix].nonzero()[0], key=lambda ix: matrix[cx_ix, ix])}
+        data.append({'size': int(sizes[cx_ix]), 'count': int(abundances[cx_ix]), 'mass': int(masses[cx_ix]),
+                     'composition': composition})
     if len(data) < 1:
         warnings.warn('Empty snapshot <<' + str(snapshot) + '>>')
     return data
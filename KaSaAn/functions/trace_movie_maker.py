@@ -1,17 +1,32 @@
 #!/usr/bin/env python3
 
+import concurrent.futures as cofu
+import itertools
+import matplotlib as mpl
 import matplotlib.animation as mpa
+import matplotlib.axes as mpx
+import matplotlib.figure as mpf
 import matplotlib.pyplot as plt
+import numpy as np
+import re
+from collections import deque
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.collections import PatchCollection
-from typing import List, Tuple, Set
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple, Set, Union
 
-from .find_snapshot_names import find_snapshot_names
+from .snapshot_prefetch import prefetch_snapshot_files
+from .trace_replay import iter_trace_samples, scan_trace
 from .snapshot_visualizer_patchwork import process_snapshot, snapshot_composition_simple, colorize_observables, \
     snapshot_legend_simple
-from ..core import KappaSnapshot, KappaAgent
+from ..core import KappaSnapshot, KappaSnapshotSeries, KappaAgent, KappaComplex
 
 
-def _define_agent_list_and_max_mass(snap_list: List[KappaSnapshot]) -> Tuple[Set[KappaAgent], int]:
+# agent names, optionally preceded by an identifier, in a complex's expression
+_agent_name_re = re.compile(r'(?:^|[\s,])(?:x\d+:)?(' + KappaComplex._agent_name_pat + r')\(')
+
+
+def _define_agent_list_and_max_mass(snap_list: Iterable[KappaSnapshot]) -> Tuple[Set[KappaAgent], int]:
     """Define consistent coloring scheme & maximum mass."""
     max_mass = 0
     agent_set = set()
@@ -23,54 +38,69 @@ def _define_agent_list_and_max_mass(snap_list: List[KappaSnapshot]) -> Tuple[Set
     return agent_set, max_mass
 
 
+def _compact_frame(snap: KappaSnapshot) -> Tuple[float, int, List[dict]]:
+    """Reduce a snapshot to what a frame needs: its time, its mass, and the per-species data to draw."""
+    return snap.get_snapshot_time(), snap.get_total_mass(), process_snapshot(snap)
+
+
 def movie_from_snapshots(directory: str, pattern: str, vis_mode: str, fig_width: int, xy_ratio: float,
                          dont_scale_mass: bool, legend_cols: int, frame_int: int, verbose: bool) -> mpa.ArtistAnimation:
     """Make a movie out of snapshots. See file under `KaSaAn.scripts` for usage."""
-    # Find the snapshots in the directory; determine agent set; colorize it
-    snapshots: List[KappaSnapshot] = []
-    snapshot_names = find_snapshot_names(target_directory=directory, name_pattern=pattern)
+    # Find the snapshots in the directory; reduce each to its frame data, keeping a single parsed snapshot at a time,
+    # while the next files are read in the background; determine agent set; colorize it
+    snapshots = KappaSnapshotSeries(directory=directory, pattern=pattern, cache_size=0)
     if verbose:
-        print('Found {} snapshots in directory {}'.format(len(snapshot_names), directory))
-    for snapshot_index, snapshot_name in enumerate(snapshot_names):
+        print('Found {} snapshots in directory {}'.format(len(snapshots), directory))
+    frames: List[Tuple[float, int, List[dict]]] = []
+    my_agent_list: Set[KappaAgent] = set()
+    my_max_mass = 0
+    for snapshot_index, (snapshot_name, snapshot_text) in enumerate(
+            prefetch_snapshot_files(snapshots.get_snapshot_names())):
+        snap = KappaSnapshot(snapshot_name, snapshot_text)
         if verbose:
-            print('Reading {}, {} of {}'.format(snapshot_name, snapshot_index + 1, len(snapshot_names)))
-        snapshots.append(KappaSnapshot(snapshot_name))
-    my_agent_list, my_max_mass = _define_agent_list_and_max_mass(snapshots)
+            print('Read {}, {} of {}'.format(snap.get_snapshot_file_name(), snapshot_index + 1, len(snapshots)))
+        snap_agents, snap_mass = _define_agent_list_and_max_mass([snap])
+        my_agent_list.update(snap_agents)
+        my_max_mass = max(my_max_mass, snap_mass)
+        frames.append(_compact_frame(snap))
     if verbose:
         print('Snapshot series contains {} agents in total.'.format(len(my_agent_list)))
     color_scheme = colorize_observables(my_agent_list)
 
-    # Define figure & sizes
+    fig, data_ax, x_res, y_res = _make_canvas(color_scheme, fig_width, xy_ratio, legend_cols)
+
+    # Define the animation, i.e. the left axis
+    artist_list = []
+    final_time = frames[-1][0]
+    for frame in frames:
+        artist_list.append(_draw_frame(data_ax, frame, color_scheme, vis_mode, x_res, y_res,
+                                       my_max_mass if not dont_scale_mass else None, final_time))
+
+    # Make movie out of list
+    if verbose:
+        print('Collecting rectangles into an animation...')
+    ani = mpa.ArtistAnimation(fig=fig, artists=artist_list, interval=frame_int, repeat_delay=2000)
+
+    return ani
+
+
+def _make_canvas(color_scheme: Dict[KappaAgent, Any], fig_width: int, xy_ratio: float,
+                 legend_cols: int, detached: bool = False) -> Tuple[mpf.Figure, mpx.Axes, float, float]:
+    """Define figure & sizes, and draw the legend; returns the figure, the axis for the data, and its resolution. A
+    `detached` figure is not managed by pyplot, and draws to an in-memory Agg canvas."""
     x_res = 1000
     y_res = x_res * xy_ratio
-    fig = plt.figure(figsize=[fig_width, fig_width/2])
+    if detached:
+        fig = mpf.Figure(figsize=[fig_width, fig_width/2])
+        FigureCanvasAgg(fig)
+    else:
+        fig = plt.figure(figsize=[fig_width, fig_width/2])
     data_ax = fig.add_subplot(121, aspect=1)
     legend_ax = fig.add_subplot(122)
     data_ax.set_xlim(left=0, right=x_res)
     data_ax.set_ylim(bottom=0, top=y_res)
     data_ax.axis('off')
 
-    # Define the animation, i.e. the left axis
-    artist_list = []
-    final_time = snapshots[-1].get_snapshot_time()
-    for snap in snapshots:
-        ars = []
-        snap_scale = snap.get_total_mass() / my_max_mass if not dont_scale_mass else 1
-        if verbose:
-            print('Normalizing snapshot ' + snap.get_snapshot_file_name())
-        data = process_snapshot(snap)
-        rectangles, _ = snapshot_composition_simple(data=data, color_scheme=color_scheme, vis_mode=vis_mode,
-                                                    x_res=x_res * snap_scale, y_res=y_res * snap_scale)
-        for r in rectangles:
-            ar = data_ax.add_patch(r)
-            ars.append(ar)
-        ars.append(data_ax.text(0, y_res,
-                                'Time ' + str(snap.get_snapshot_time()) + ' ; final time ' + str(final_time),
-                                horizontalalignment='left', verticalalignment='bottom'))
-        ars.append(data_ax.text(x_res, y_res, 'Mass present ' + str(snap.get_total_mass()),
-                                horizontalalignment='right', verticalalignment='bottom'))
-        artist_list.append(ars)
-
     # Define the legend, i.e. the right axis
     # This legend will have legend_cols number of columns for writing the agents. This helps with scaling for systems
     # with a large number of agents. The limits of this section are determined based on the number of agents to draw.
@@ -81,10 +111,180 @@ def movie_from_snapshots(directory: str, pattern: str, vis_mode: str, fig_width:
     legend_ax.set_xlim(left=0, right=legend_cols)
     legend_ax.set_ylim(top=1, bottom=-divmod(len(color_scheme), legend_cols)[0] - 1)
     legend_ax.axis('off')
+    return fig, data_ax, x_res, y_res
 
-    # Make movie out of list
+
+def _draw_frame(data_ax: mpx.Axes, frame: Tuple[float, int, List[dict]], color_scheme: Dict[KappaAgent, Any],
+                vis_mode: str, x_res: float, y_res: float, max_mass: Optional[int],
+                final_time: float) -> List[mpl.artist.Artist]:
+    """Add to the axis the artists of one frame, scaled by the maximum mass unless that is `None`; returns them."""
+    snap_time, snap_mass, data = frame
+    ars = []
+    snap_scale = snap_mass / max_mass if max_mass is not None else 1
+    rectangles, _ = snapshot_composition_simple(data=data, color_scheme=color_scheme, vis_mode=vis_mode,
+                                                x_res=x_res * snap_scale, y_res=y_res * snap_scale)
+    for r in rectangles:
+        ar = data_ax.add_patch(r)
+        ars.append(ar)
+    ars.append(data_ax.text(0, y_res,
+                            'Time ' + str(snap_time) + ' ; final time ' + str(final_time),
+                            horizontalalignment='left', verticalalignment='bottom'))
+    ars.append(data_ax.text(x_res, y_res, 'Mass present ' + str(snap_mass),
+                            horizontalalignment='right', verticalalignment='bottom'))
+    return ars
+
+
+def _scan_agents_and_mass(snapshot_name: str, raw_expression: Optional[str] = None) -> Tuple[Set[KappaAgent], int]:
+    """Lightweight scan of a snapshot: reads the agent names and the declared sizes and abundances of its complexes,
+    without parsing agents, to obtain the agent types present and the total mass. Reads the file, unless its contents
+    are given."""
+    if raw_expression is None:
+        with open(snapshot_name, 'r') as kf:
+            raw_expression = kf.read()
+    entries = raw_expression.replace('\n', '').split('%init: ')[1:]
+    agent_names = set()
+    total_mass = 0
+    for entry in entries:
+        g = KappaSnapshot._line_complex_re.match(entry)
+        if g:
+            total_mass += int(g.group(1)) * int(g.group(2))
+            agent_names.update(_agent_name_re.findall(g.group(3)))
+    return {KappaAgent(agent_name + '()') for agent_name in agent_names}, total_mass
+
+
+def _scan_series(snapshots: KappaSnapshotSeries, verbose: bool) -> Tuple[Dict[KappaAgent, Any], int]:
+    """Cheap first pass over a series: colorize the agents present, and find the maximum mass."""
+    my_agent_list: Set[KappaAgent] = set()
+    my_max_mass = 0
+    for snapshot_name, snapshot_text in prefetch_snapshot_files(snapshots.get_snapshot_names()):
+        snap_agents, snap_mass = _scan_agents_and_mass(snapshot_name, snapshot_text)
+        my_agent_list.update(snap_agents)
+        my_max_mass = max(my_max_mass, snap_mass)
     if verbose:
-        print('Collecting rectangles into an animation...')
-    ani = mpa.ArtistAnimation(fig=fig, artists=artist_list, interval=frame_int, repeat_delay=2000)
+        print('Snapshot series contains {} agents in total.'.format(len(my_agent_list)))
+    return colorize_observables(my_agent_list), my_max_mass
 
-    return ani
+
+def movie_from_snapshots_streaming(directory: str, pattern: str, output_file: Union[str, Path],
+                                   writer: mpa.AbstractMovieWriter, vis_mode: str, fig_width: int, xy_ratio: float,
+                                   dont_scale_mass: bool, legend_cols: int, verbose: bool) -> None:
+    """Make a movie out of snapshots, writing it to file one frame at a time. A first, cheap pass over the snapshots
+    determines the agent set and the maximum mass; a second parses each snapshot, draws its frame, hands it to the
+    writer, and discards both, so that at most one snapshot and one frame are held in memory, besides the few files
+    being read ahead, see `prefetch_snapshot_files`. See file under `KaSaAn.scripts` for usage."""
+    snapshots = KappaSnapshotSeries(directory=directory, pattern=pattern, cache_size=0)
+    if verbose:
+        print('Found {} snapshots in directory {}'.format(len(snapshots), directory))
+    color_scheme, my_max_mass = _scan_series(snapshots, verbose)
+    fig, data_ax, x_res, y_res = _make_canvas(color_scheme, fig_width, xy_ratio, legend_cols)
+    final_time = snapshots.get_snapshot_times()[-1]
+    with writer.saving(fig, str(output_file), dpi=fig.dpi):
+        for snapshot_index, (snapshot_name, snapshot_text) in enumerate(
+                prefetch_snapshot_files(snapshots.get_snapshot_names())):
+            snap = KappaSnapshot(snapshot_name, snapshot_text)
+            if verbose:
+                print('Rendering {}, {} of {}'.format(snap.get_snapshot_file_name(), snapshot_index + 1,
+                                                      len(snapshots)))
+            frame_artists = _draw_frame(data_ax, _compact_frame(snap), color_scheme, vis_mode, x_res, y_res,
+                                        my_max_mass if not dont_scale_mass else None, final_time)
+            writer.grab_frame()
+            for artist in frame_artists:
+                artist.remove()
+    plt.close(fig)
+
+
+def movie_from_trace(trace_file: Union[str, Path], output_file: Union[str, Path], writer: mpa.AbstractMovieWriter,
+                     vis_mode: str, fig_width: int, xy_ratio: float, dont_scale_mass: bool, legend_cols: int,
+                     every_event: Optional[int], every_time: Optional[float], verbose: bool) -> None:
+    """Make a movie directly from a KaSim trace, replaying it into a `KappaMixture` and drawing a frame every so many
+    events or units of time, see `iter_trace_samples`. As with `movie_from_snapshots_streaming`, a first, cheap pass
+    over the trace finds the agent types and the maximum mass, and frames are written as they are drawn, so only the
+    mixture and one frame are held in memory. See file under `KaSaAn.scripts` for usage."""
+    agent_names, my_max_mass, final_time = scan_trace(trace_file)
+    if verbose:
+        print('Trace contains {} agents in total, and at most {} agents at once.'.format(len(agent_names), my_max_mass))
+    color_scheme = colorize_observables({KappaAgent(agent_name + '()') for agent_name in agent_names})
+    fig, data_ax, x_res, y_res = _make_canvas(color_scheme, fig_width, xy_ratio, legend_cols)
+    with writer.saving(fig, str(output_file), dpi=fig.dpi):
+        for frame_index, (sample_time, mixture) in enumerate(iter_trace_samples(trace_file, every_event, every_time)):
+            snap = mixture.to_snapshot(snapshot_time=sample_time)
+            if verbose:
+                print('Rendering frame {}, event {}'.format(frame_index + 1, mixture.get_mixture_event()))
+            frame_artists = _draw_frame(data_ax, _compact_frame(snap), color_scheme, vis_mode, x_res, y_res,
+                                        my_max_mass if not dont_scale_mass else None, final_time)
+            writer.grab_frame()
+            for artist in frame_artists:
+                artist.remove()
+    plt.close(fig)
+
+
+# per-process state of the frame-rendering workers: canvas, and what every frame shares
+_frame_worker_state: Dict[str, Any] = {}
+
+
+def _init_frame_worker(color_scheme: Dict[KappaAgent, Any], vis_mode: str, fig_width: int, xy_ratio: float,
+                       legend_cols: int, max_mass: Optional[int], final_time: float, rc_params: Dict[str, Any]) -> None:
+    """Set up, once per worker process, the canvas and legend on which frames are rendered."""
+    mpl.rcParams.update(rc_params)
+    fig, data_ax, x_res, y_res = _make_canvas(color_scheme, fig_width, xy_ratio, legend_cols, detached=True)
+    _frame_worker_state.update(fig=fig, data_ax=data_ax, x_res=x_res, y_res=y_res, color_scheme=color_scheme,
+                               vis_mode=vis_mode, max_mass=max_mass, final_time=final_time)
+
+
+def _render_frame_to_buffer(snapshot_name: str, raw_expression: Optional[str] = None) -> np.ndarray:
+    """Parse a snapshot, from its file or its given contents, draw its frame on this worker's canvas, and return the
+    rendered RGBA pixels."""
+    state = _frame_worker_state
+    snap = KappaSnapshot(snapshot_name, raw_expression)
+    frame_artists = _draw_frame(state['data_ax'], _compact_frame(snap), state['color_scheme'],
+                                state['vis_mode'], state['x_res'], state['y_res'], state['max_mass'],
+                                state['final_time'])
+    state['fig'].canvas.draw()
+    pixels = np.array(state['fig'].canvas.buffer_rgba())
+    for artist in frame_artists:
+        artist.remove()
+    return pixels
+
+
+def movie_from_snapshots_parallel(directory: str, pattern: str, output_file: Union[str, Path],
+                                  writer: mpa.AbstractMovieWriter, vis_mode: str, fig_width: int, xy_ratio: float,
+                                  dont_scale_mass: bool, legend_cols: int, process_number: int, verbose: bool) -> None:
+    """Make a movie out of snapshots, rendering frames in a pool of worker processes. As with
+    `movie_from_snapshots_streaming`, a cheap first pass determines the agent set and maximum mass, which all workers
+    share; workers are then handed the contents of the snapshot files, read ahead in the background, which they parse
+    and render into pixel buffers, handed to the writer in series order. At most twice as many frames as workers are in
+    flight. See file under `KaSaAn.scripts` for usage."""
+    snapshots = KappaSnapshotSeries(directory=directory, pattern=pattern, cache_size=0)
+    if verbose:
+        print('Found {} snapshots in directory {}'.format(len(snapshots), directory))
+    color_scheme, my_max_mass = _scan_series(snapshots, verbose)
+    rc_params = {'font.size': mpl.rcParams['font.size'], 'figure.dpi': mpl.rcParams['figure.dpi']}
+    init_args = (color_scheme, vis_mode, fig_width, xy_ratio, legend_cols,
+                 my_max_mass if not dont_scale_mass else None, snapshots.get_snapshot_times()[-1], rc_params)
+    # the assembly figure only shows, edge to edge, the frames rendered by the workers
+    fig = plt.figure(figsize=[fig_width, fig_width/2])
+    image_ax = fig.add_axes((0, 0, 1, 1))
+    image_ax.axis('off')
+    frame_image = None
+    snapshot_names = snapshots.get_snapshot_names()
+    with cofu.ProcessPoolExecutor(max_workers=process_number, initializer=_init_frame_worker,
+                                  initargs=init_args) as executor, writer.saving(fig, str(output_file), dpi=fig.dpi):
+        names_pending = prefetch_snapshot_files(snapshot_names, depth=2 * process_number)
+        jobs_in_order: Deque[cofu.Future] = deque()
+        for snapshot_name, snapshot_text in itertools.islice(names_pending, 2 * process_number):
+            jobs_in_order.append(executor.submit(_render_frame_to_buffer, snapshot_name, snapshot_text))
+        frame_index = 0
+        while jobs_in_order:
+            pixels = jobs_in_order.popleft().result()
+            for snapshot_name, snapshot_text in itertools.islice(names_pending, 1):
+                jobs_in_order.append(executor.submit(_render_frame_to_buffer, snapshot_name, snapshot_text))
+            frame_index += 1
+            if verbose:
+                print('Writing frame of {}, {} of {}'.format(snapshot_names[frame_index - 1], frame_index,
+                                                             len(snapshot_names)))
+            if frame_image is None:
+                frame_image = image_ax.imshow(pixels, interpolation='none')
+            else:
+                frame_image.set_data(pixels)
+            writer.grab_frame()
+    plt.close(fig)
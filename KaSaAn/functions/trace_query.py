@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Evaluate queries, written in a subset of the Kappa trace query language, over a KaSim trace. The trace is read once,
+its actions replayed into a `KappaMixture`, and each matching event's results written as they are found.
+
+A query has the form:
+``` {.text}
+query 'output.csv'
+match e [every <number> seconds|events] [when <condition> [and <condition> ...]]
+return <expression>[, <expression> ...]
+```
+where `e` names the matched event. Without `every`, each event is a candidate; with it, the first candidate at or past
+each multiple of the period (in simulated time, or in events) matches. Conditions compare a measure of the event to a
+value, e.g. `rule[e] = 'A.B'` or `time[e] >= 100`, with any of `=`, `!=`, `<`, `<=`, `>`, `>=`.
+Expressions are either measures of the event: `time[e]`, `event_id[e]`, `rule[e]`; or of the mixture, just before the
+event, `[.e]`, or just after it, `[e.]`:
+* `snapshot[.e]`: the whole mixture, written to a snapshot file `snapshot.<match>.ka` next to the output file; the
+  table holds the file name
+* `count{'<pattern>'}[.e]`: the number of embeddings of a Kappa pattern
+* `components[.e]`: the number of complexes
+* `largest_component[.e]`: the size of the largest complex
+* `component[.e]{<agent id>}`: the Kappa expression of the complex of the agent with that trace identifier; empty
+  while that agent is not in the mixture
+Lines starting with `//` are ignored. Results are written to the output file as a table, one row per match, one column
+per expression, headed by the expressions as written."""
+
+import csv
+import math
+import operator
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from ..core import KappaMixture, KappaSnapshot, KappaTrace
+from ..core.KappaTrace import TracePert, TraceRule
+
+
+class TraceQueryReturn(NamedTuple):
+    """An expression to return: its text as written, its kind, whether it is measured before the matched event (as
+    opposed to after it, for mixture measures), and its argument (a pattern, or an agent identifier), if any."""
+    text: str
+    kind: str
+    before: bool
+    argument: Any
+
+
+class TraceQuery(NamedTuple):
+    """A parsed query; see the module's documentation for the language."""
+    output_file: str
+    event_variable: str
+    period: Optional[float]
+    period_unit: Optional[str]
+    conditions: List[Tuple[str, Callable[[Any, Any], bool], Any]]
+    returns: List[TraceQueryReturn]
+
+
+_query_re = re.compile(r"^query\s+'([^']+)'\s+match\s+(\w+)"
+                       r"(?:\s+every\s+([0-9.eE+\-]+)\s+(seconds|events))?"
+                       r"(?:\s+when\s+(.+?))?"
+                       r"\s+return\s+(.+)$", re.DOTALL)
+_condition_re = re.compile(r"^(time|event_id|rule)\[(\w+)\]\s*(=|!=|<=|>=|<|>)\s*(.+)$")
+_event_measure_re = re.compile(r"^(time|event_id|rule)\[(\w+)\]$")
+_mixture_measure_re = re.compile(r"^(snapshot|components|largest_component)\[(\.\w+|\w+\.)\]$")
+_count_re = re.compile(r"^count\{'(.+)'\}\[(\.\w+|\w+\.)\]$")
+_component_re = re.compile(r"^component\[(\.\w+|\w+\.)\]\{(\d+)\}$")
+_comparisons = {'=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le,
+                '>': operator.gt, '>=': operator.ge}
+
+
+def _split_expressions(text: str) -> List[str]:
+    """Splits a list of expressions at its commas, except those within quotes or brackets, e.g. in patterns."""
+    expressions = []
+    depth = 0
+    quoted = False
+    current = ''
+    for char in text:
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char in '[{(':
+            depth += 1
+        elif not quoted and char in ']})':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            expressions.append(current.strip())
+            current = ''
+            continue
+        current += char
+    expressions.append(current.strip())
+    return expressions
+
+
+def _parse_position(position: str, event_variable: str, expression: str) -> bool:
+    """Returns whether a `[.e]` or `[e.]` position refers to the mixture before the event."""
+    if position.strip('.') != event_variable:
+        raise ValueError('Expression <{}> does not refer to the matched event <{}>'.format(expression, event_variable))
+    return position.startswith('.')
+
+
+def parse_trace_query(query_text: str) -> TraceQuery:
+    """Parses a query, written in the subset of the Kappa trace query language described in this module."""
+    lines = [line.split('//')[0] if not line.lstrip().startswith('//') else '' for line in query_text.splitlines()]
+    query_match = _query_re.match(' '.join(lines).strip())
+    if query_match is None:
+        raise ValueError('Could not parse query <{}>; expected query, match, and return clauses'.format(query_text))
+    output_file, event_variable, period, period_unit, conditions_text, returns_text = query_match.groups()
+    conditions = []
+    if conditions_text:
+        for condition_text in re.split(r'\s+and\s+', conditions_text.strip()):
+            condition_match = _condition_re.match(condition_text.strip())
+            if condition_match is None or condition_match.group(2) != event_variable:
+                raise ValueError('Could not parse condition <{}>'.format(condition_text))
+            measure, _, comparison, value_text = condition_match.groups()
+            value_text = value_text.strip()
+            value = value_text.strip("'") if value_text.startswith("'") else float(value_text)
+            conditions.append((measure, _comparisons[comparison], value))
+    returns = []
+    for expression in _split_expressions(returns_text):
+        if match := _event_measure_re.match(expression):
+            if match.group(2) != event_variable:
+                raise ValueError('Expression <{}> does not refer to the matched event <{}>'.format(
+                    expression, event_variable))
+            returns.append(TraceQueryReturn(expression, match.group(1), False, None))
+        elif match := _mixture_measure_re.match(expression):
+            returns.append(TraceQueryReturn(expression, match.group(1),
+                                            _parse_position(match.group(2), event_variable, expression), None))
+        elif match := _count_re.match(expression):
+            returns.append(TraceQueryReturn(expression, 'count',
+                                            _parse_position(match.group(2), event_variable, expression),
+                                            match.group(1)))
+        elif match := _component_re.match(expression):
+            returns.append(TraceQueryReturn(expression, 'component',
+                                            _parse_position(match.group(1), event_variable, expression),
+                                            int(match.group(2))))
+        else:
+            raise ValueError('Unsupported return expression <{}>'.format(expression))
+    return TraceQuery(output_file, event_variable, float(period) if period else None, period_unit,
+                      conditions, returns)
+
+
+def _measure_mixture(mixture: KappaMixture, to_return: TraceQueryReturn, snapshot_name: Optional[Path],
+                     snapshot_cache: Dict[str, KappaSnapshot]) -> Any:
+    """Evaluates a mixture measure; the snapshot of the mixture, needed for pattern counts, is made once per state."""
+    if to_return.kind == 'snapshot':
+        with open(snapshot_name, 'w') as snap_file:
+            snap_file.write(mixture.to_snapshot_text())
+        return snapshot_name.name
+    if to_return.kind == 'components':
+        return mixture.get_number_of_complexes()
+    if to_return.kind == 'largest_component':
+        return mixture.get_largest_complex_size()
+    if to_return.kind == 'component':
+        # an agent not yet created, or already removed, has no complex
+        try:
+            return mixture.get_complex_expression(to_return.argument)
+        except ValueError:
+            return ''
+    if 'snapshot' not in snapshot_cache:
+        snapshot_cache['snapshot'] = mixture.to_snapshot()
+    return snapshot_cache['snapshot'].get_abundance_of_pattern(to_return.argument)[0]
+
+
+def run_trace_query(trace_file: Union[str, Path], query: Union[str, TraceQuery],
+                    output_directory: Union[str, Path] = '.', verbose: bool = False) -> int:
+    """Evaluates a query, given as text or already parsed, over a trace, in one pass; writes the table to the query's
+    output file, in the output directory, along with any snapshot files; returns the number of matches."""
+    if isinstance(query, str):
+        query = parse_trace_query(query)
+    output_path = Path(output_directory) / query.output_file
+    if not output_path.parent.exists():
+        output_path.parent.mkdir(parents=True)
+    snapshot_columns = [to_return for to_return in query.returns if to_return.kind == 'snapshot']
+    trace = KappaTrace(trace_file)
+    mixture = KappaMixture.from_trace(trace)
+    next_boundary = 0.0
+    match_number = 0
+    with open(output_path, 'w', newline='') as out_file:
+        table_writer = csv.writer(out_file, dialect='excel')
+        table_writer.writerow([to_return.text for to_return in query.returns])
+        for step in trace.iter_steps():
+            if not isinstance(step, (TraceRule, TracePert)) or step.info is None:
+                mixture.apply_step(step)
+                continue
+            measures = {'time': step.info.time, 'event_id': step.info.event,
+                        'rule': trace.get_rule_name(step.rule_id) if isinstance(step, TraceRule) else ''}
+            is_match = all(comparison(measures[measure], value) for measure, comparison, value in query.conditions)
+            if is_match and query.period is not None:
+                position = measures['time'] if query.period_unit == 'seconds' else measures['event_id']
+                is_match = position >= next_boundary
+                if is_match:
+                    next_boundary = (math.floor(position / query.period) + 1) * query.period
+            if not is_match:
+                mixture.apply_step(step)
+                continue
+            match_number += 1
+            row: List[Any] = [None] * len(query.returns)
+            # measures of the mixture before the event, then after it
+            for before in (True, False):
+                snapshot_cache: Dict[str, KappaSnapshot] = {}
+                for col_ix, to_return in enumerate(query.returns):
+                    if to_return.kind in measures:
+                        row[col_ix] = measures[to_return.kind]
+                    elif to_return.before == before:
+                        snapshot_name = None
+                        if to_return.kind == 'snapshot':
+                            snapshot_name = output_path.parent / ('snapshot.{}.ka'.format(match_number) if len(
+                                snapshot_columns) == 1 else 'snapshot_{}.{}.ka'.format(col_ix, match_number))
+                        row[col_ix] = _measure_mixture(mixture, to_return, snapshot_name, snapshot_cache)
+                if before:
+                    mixture.apply_step(step)
+            table_writer.writerow(row)
+            if verbose:
+                print('\rMatched {} events; last was event {}'.format(match_number, measures['event_id']),
+                      end='', flush=True)
+    if verbose:
+        print()
+    return match_number
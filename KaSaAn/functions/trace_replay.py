@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Replay a KaSim trace into a `KappaMixture`, to sample the state of the mixture at event, or time, resolution without
+requiring KaSim to have dumped snapshots."""
+
+from pathlib import Path
+from typing import Iterator, Optional, Set, Tuple, Union
+
+from ..core import KappaMixture, KappaTrace
+
+
+def iter_trace_samples(trace_file: Union[str, Path], every_event: Optional[int] = None,
+                       every_time: Optional[float] = None) -> Iterator[Tuple[float, KappaMixture]]:
+    """Replays a trace, yielding the sample time and the mixture every `every_event` events, or every `every_time` units
+    of simulation time; if neither is given, after every event. The first sample is the initial mixture, at time zero;
+    a sample is the state just before the first step past its boundary, as KaSim's periodic snapshots would be, so a
+    time sample carries the time of its boundary, and an event sample the time of its last event. The final state is
+    also yielded, unless it was the last sample. The same mixture object is yielded each time, updated in place: turn
+    it into a snapshot, e.g. with `KappaMixture.to_snapshot`, before advancing the iterator."""
+    if every_event is not None and every_time is not None:
+        raise ValueError('Sample either every so many events, or every so much time, not both.')
+    if every_event is None and every_time is None:
+        every_event = 1
+    if (every_event is not None and every_event < 1) or (every_time is not None and every_time <= 0):
+        raise ValueError('Sampling interval must be positive.')
+    trace = KappaTrace(trace_file)
+    mixture = KappaMixture.from_trace(trace)
+    next_boundary: float = 0
+    changed_since_sample = True
+    for step in trace.iter_steps():
+        info = getattr(step, 'info', None)
+        if info is not None:
+            step_position = info.event if every_event is not None else info.time
+            while step_position > next_boundary:
+                yield (float(next_boundary) if every_time is not None else mixture.get_mixture_time()), mixture
+                changed_since_sample = False
+                next_boundary += every_event if every_event is not None else every_time
+        mixture.apply_step(step)
+        changed_since_sample = True
+    if changed_since_sample:
+        yield mixture.get_mixture_time(), mixture
+
+
+def scan_trace(trace_file: Union[str, Path]) -> Tuple[Set[str], int, float]:
+    """Cheap pass over a trace, tracking only the number of agents: returns the names of the agent types ever created,
+    the largest number of agents present at once, and the time of the last event."""
+    trace = KappaTrace(trace_file)
+    agent_types: Set[int] = set()
+    agent_number = 0
+    max_mass = 0
+    final_time = 0.0
+    for step in trace.iter_steps():
+        actions = getattr(step, 'actions', None) or getattr(getattr(step, 'event', None), 'actions', None) or []
+        for action in actions:
+            if action.kind == 'Create':
+                agent_types.add(action.target.type)
+                agent_number += 1
+            elif action.kind == 'Remove':
+                agent_number -= 1
+        max_mass = max(max_mass, agent_number)
+        info = getattr(step, 'info', None)
+        if info is not None:
+            final_time = info.time
+    return {trace.get_agent_name(agent_type) for agent_type in agent_types}, max_mass, final_time
@@ -3,16 +3,28 @@
 Get the catalytic potential per snapshot for a series.
 
 ``` {.text}
-usage: kappa_catalytic_potential [-h] [-d DIRECTORY] -e ENZYME_NAME -s SUBSTRATE_NAME [-v] [-o OUTPUT_FILE] [-p SNAPSHOT_PATTERN] [-ts TEXT_SIZE]
+usage: kappa_catalytic_potential [-h] [-d DIRECTORY] (-e ENZYME_NAME -s SUBSTRATE_NAME | --all_pairs [AGENT ...]) [-v] [-o OUTPUT_FILE] [-p SNAPSHOT_PATTERN] [-ts TEXT_SIZE] [--cache CACHE_FILE] [--watch SECONDS] [--shard INDEX/NUMBER] [--merge PARTIAL [PARTIAL ...]]
 [-h]                            Show detailed help.
 [-d DIRECTORY]                  Directory containing the snapshots.
 -e ENZYME_NAME                  Name of the first agent.
 -s SUBSTRATE_NAME               Name of the second agent.
+--all_pairs [AGENT ...]         Instead, every pair among the given agents, or among all agent types, in one pass.
 [-v]                            If set, print additional information to standard output.
 [-o OUTPUT_FILE]                If specified, save to file; else print to standard output.
 -p SNAPSHOT_PREFIX              The prefix by which the snapshots are named.
 [-ts TEXT_SIZE]                 Override default size for text, in points.
 [--text_instead_of_paths]       Output text elements instead of paths; embeds used glyphs
+[--cache CACHE_FILE]            Results store of per-snapshot results; only new or modified snapshots are parsed.
+[--watch SECONDS]               Re-analyze and re-save every so many seconds, e.g. while KaSim runs; requires -o.
+[--shard INDEX/NUMBER]          Analyze only one shard of the snapshots, e.g. <0/4>, saving partial results to -o.
+[--merge PARTIAL [PARTIAL ...]] Instead of reading snapshots, combine the partial results files of all shards.
+```
+
+To split the analysis over several machines, or processes, run each shard with its own output file, then merge:
+``` {.text}
+kappa_catalytic_potential -e GSK -s APC --shard 0/2 -o part_0.json
+kappa_catalytic_potential -e GSK -s APC --shard 1/2 -o part_1.json
+kappa_catalytic_potential -e GSK -s APC --merge part_0.json part_1.json -o potential.csv
 ```
 """
 
@@ -21,8 +33,11 @@ import csv
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import sys
+import time
 from pathlib import Path
-from KaSaAn.functions import get_potential_of_folder
+from KaSaAn.functions import get_potential_of_folder, get_colocalization_of_folder, collect_potentials_of_folder, \
+    potentials_from_results, parse_shard, write_partial_results, merge_partial_results
+from KaSaAn.functions.catalytic_potential import _potential_parameters
 
 
 def main(args=None):
@@ -35,11 +50,16 @@ def main(args=None):
     parser = argparse.ArgumentParser(description=main.__doc__)
     parser.add_argument('-d', '--directory', type=str, default='.',
                         help='The directory containing the snapshots to be analyzed.')
-    parser.add_argument('-e', '--enzyme_name', type=str, required=True,
+    parser.add_argument('-e', '--enzyme_name', type=str,
                         help='The name of the agent acting as an enzyme; e.g. <GSK(ARM, FTZ, ser3{ph})> would be simply'
                              ' <GSK>.')
-    parser.add_argument('-s', '--substrate_name', type=str, required=True,
+    parser.add_argument('-s', '--substrate_name', type=str,
                         help='The name of the agent acting as a substrate; e.g. <APC(ARM, OD)> would be simply <APC>.')
+    parser.add_argument('--all_pairs', type=str, nargs='*', default=None,
+                        help='Instead of a single enzyme and substrate, obtain in one pass the catalytic potential of'
+                             ' every pair among the given agents, e.g. <GSK APC(ARM{ph})>, or among all agent types if'
+                             ' none are given. The output file will have one column per pair, named <enzyme|substrate>,'
+                             ' with the time as the first column.')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='If set, print additional information, like number of snapshots found, and current'
                              ' snapshot being parsed.')
@@ -54,20 +74,77 @@ def main(args=None):
     parser.add_argument('--text_instead_of_paths', action='store_true',
                         help='If set, figure will embed used glyphs and export text elements, instead of rendering the'
                              ' glyphs into paths. Only supported for PDF export.')
+    parser.add_argument('--cache', type=Path, default=None,
+                        help='If given, file of the results store where per-snapshot results are kept, so that'
+                             ' re-running on the same directory only parses new or modified snapshots.')
+    parser.add_argument('--watch', type=float, default=None,
+                        help='If given, re-analyze the directory and re-save the output file every so many seconds,'
+                             ' until interrupted; meant to follow a running simulation. Requires an output file, and is'
+                             ' best paired with a results store, see --cache.')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='If given, as <index/number>, zero-based, e.g. <0/4>, analyze only that shard of the'
+                             ' snapshots: every number-th snapshot, starting at index. Partial results are saved to the'
+                             ' output file, to be combined later with --merge. Shards need no coordination, so they can'
+                             ' run on separate machines sharing the snapshot directory.')
+    parser.add_argument('--merge', type=Path, nargs='+', default=None,
+                        help='Instead of reading snapshots, combine the partial results files written by every shard'
+                             ' (see --shard), then save or plot the catalytic potentials as usual.')
 
     args = parser.parse_args()
+    if args.all_pairs is None and not args.merge and not (args.enzyme_name and args.substrate_name):
+        parser.error('either both an enzyme and a substrate (-e, -s), or --all_pairs, are required')
+    if (args.shard or args.merge) and (args.all_pairs is not None or args.watch is not None):
+        parser.error('--shard and --merge are not supported with --all_pairs nor --watch')
+    if args.shard and (args.merge or not args.output_file):
+        parser.error('--shard requires an output file for the partial results, see -o, and excludes --merge')
+    if args.all_pairs is not None and args.cache:
+        parser.error('--cache is not supported for --all_pairs')
+    if args.watch is not None and not args.output_file:
+        parser.error('--watch requires an output file, see -o')
     if args.text_size:
         mpl.rcParams['font.size'] = args.text_size
     if args.text_instead_of_paths:
         plt.rcParams['pdf.fonttype'] = 42
 
-    data = get_potential_of_folder(args.directory, args.enzyme_name, args.substrate_name,
-                                   args.verbose, args.snapshot_pattern)
-
-    if args.output_file:
+    if args.shard:
+        potentials = collect_potentials_of_folder(args.directory, args.enzyme_name, args.substrate_name,
+                                                  args.verbose, args.snapshot_pattern, args.cache, args.shard)
         if not args.output_file.parent.exists():
             args.output_file.parent.mkdir(parents=True)
-        with open(args.output_file, 'w') as out_file:
+        write_partial_results(args.output_file, potentials, 'catalytic_potential',
+                              _potential_parameters(args.enzyme_name, args.substrate_name), *args.shard)
+        return
+    if args.merge:
+        expected_parameters = None
+        if args.enzyme_name and args.substrate_name:
+            expected_parameters = _potential_parameters(args.enzyme_name, args.substrate_name)
+        potentials, _ = merge_partial_results(args.merge, 'catalytic_potential', expected_parameters)
+        _save_or_plot(potentials_from_results(potentials), args.output_file)
+        return
+
+    while True:
+        if args.all_pairs is not None:
+            agents, times, colocalization = get_colocalization_of_folder(
+                args.directory, args.verbose, args.snapshot_pattern, args.all_pairs if args.all_pairs else None)
+            _save_or_plot_pairs(agents, times, colocalization, args.output_file)
+        else:
+            data = get_potential_of_folder(args.directory, args.enzyme_name, args.substrate_name,
+                                           args.verbose, args.snapshot_pattern, args.cache)
+            _save_or_plot(data, args.output_file)
+        if args.watch is None:
+            break
+        try:
+            time.sleep(args.watch)
+        except KeyboardInterrupt:
+            break
+
+
+def _save_or_plot(data, output_file: Path) -> None:
+    """Save the catalytic potentials to the output file, or plot them if none was given."""
+    if output_file:
+        if not output_file.parent.exists():
+            output_file.parent.mkdir(parents=True)
+        with open(output_file, 'w') as out_file:
             q_writter = csv.writer(out_file)
             q_writter.writerow(['q', 't'])
             q_writter.writerows(data)
@@ -80,5 +157,28 @@ def main(args=None):
         plt.show()
 
 
+def _save_or_plot_pairs(agents, times, colocalization, output_file: Path) -> None:
+    """Save the catalytic potentials of all pairs to the output file, or plot them if none was given. The matrix is
+    symmetric, so only pairs with the enzyme at or before the substrate are reported."""
+    pair_ixs = [(i, j) for i in range(len(agents)) for j in range(i, len(agents))]
+    pair_names = [str(agents[i]) + '|' + str(agents[j]) for i, j in pair_ixs]
+    if output_file:
+        if not output_file.parent.exists():
+            output_file.parent.mkdir(parents=True)
+        with open(output_file, 'w') as out_file:
+            q_writter = csv.writer(out_file)
+            q_writter.writerow(['t'] + pair_names)
+            for snap_time, matrix in zip(times, colocalization):
+                q_writter.writerow([snap_time] + [matrix[i, j] for i, j in pair_ixs])
+    else:
+        _, ax = plt.subplots(layout='constrained')
+        for (i, j), pair_name in zip(pair_ixs, pair_names):
+            ax.plot(times, colocalization[:, i, j], label=pair_name)
+        ax.set_xlabel('Time')
+        ax.set_ylabel('q')
+        ax.legend()
+        plt.show()
+
+
 if __name__ == '__main__':
     main()
@@ -3,9 +3,10 @@
 Plot a variable from several output files.
 
 ``` {.text}
-usage: kappa_observable_coplotter [-h] -p PATTERN [-vi VARIABLE_BY_INDEX] [-vn VARIABLE_BY_NAME] [-ve VARIABLE_EXPRESSION] [-o OUT_FILE] [-d] [-fs WIDTH HEIGHT] [--limit_left LIMIT_LEFT] [--limit_right LIMIT_RIGHT] [--limit_bottom LIMIT_BOTTOM] [--limit_top LIMIT_TOP] [-lx] [-ly] [-nl] [-ts TEXT_SIZE]
+usage: kappa_observable_coplotter [-h] (-p PATTERN | -s SUMMARY_FILE) [-vi VARIABLE_BY_INDEX] [-vn VARIABLE_BY_NAME] [-ve VARIABLE_EXPRESSION] [-o OUT_FILE] [-d] [-fs WIDTH HEIGHT] [--limit_left LIMIT_LEFT] [--limit_right LIMIT_RIGHT] [--limit_bottom LIMIT_BOTTOM] [--limit_top LIMIT_TOP] [-lx] [-ly] [-nl] [-ts TEXT_SIZE] [--cache] [--downsample {minmax,lttb,none}] [-mt PROCESSES] [-g GRID_POINTS] [--interpolation {step,linear}] [--bands QUANTILE [QUANTILE ...]]
 [-h]                            Show detailed help.
 -p PATTERN                      Pattern matching desired files.
+-s SUMMARY_FILE                 Instead, ensemble summary from <kappa_observable_ensemble> to plot.
 [-vi VARIABLE_BY_INDEX]         Index of the variable to be co-plotted.
 [-vn VARIABLE_BY_NAME]          Name of the variable to be co-plotted.
 [-ve VARIABLE_EXPRESSION]       Algebraic expression of variable names.
@@ -28,6 +29,14 @@ usage: kappa_observable_coplotter [-h] -p PATTERN [-vi VARIABLE_BY_INDEX] [-vn V
                                     outside left lower, outside right lower
 [--legend_ncol LEGEND_NCOL]     Number of columns for the legend.
 [--text_instead_of_paths]       Output text elements instead of paths; embeds used glyphs
+[--cache]                       Keep a binary copy of each file's data next to it, memory-mapped on later calls.
+[--downsample {minmax,lttb,none}]
+                                Reduce long series to the axis's width before plotting; default <minmax>.
+[-mt PROCESSES]                 Read files in this many worker processes; default 1, a simple loop.
+[-g GRID_POINTS]                Resample replicates onto this many common time points, and plot their mean and bands.
+[--interpolation {step,linear}] How replicates are resampled onto the grid; default <step>, holding values.
+[--bands QUANTILE [QUANTILE ...]]
+                                Shade between each quantile and its complement; default <0.05 0.25>.
 ```
 """
 
@@ -35,15 +44,19 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 from argparse import ArgumentParser
 from pathlib import Path
-from KaSaAn.functions import observable_coplot_axis_annotator
+from KaSaAn.functions import observable_coplot_axis_annotator, downsample_methods, ensemble_summary_axis_annotator
 
 
 def main():
     """Co-plot the same variable from multiple files, save as file or display the figure."""
     parser = ArgumentParser(description=main.__doc__)
-    parser.add_argument('-p', '--pattern', type=str, required=True,
-                        help='Pattern, passed to glob.glob that would match the desired files to co-plot, should'
-                             ' probably be quoted.')
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('-p', '--pattern', type=str,
+                              help='Pattern, passed to glob.glob that would match the desired files to co-plot, should'
+                                   ' probably be quoted.')
+    source_group.add_argument('-s', '--summary_file', type=Path,
+                              help='Ensemble summary written by `kappa_observable_ensemble`; its mean and quantile'
+                                   ' bands are plotted, for a variable chosen by index or name.')
     parser.add_argument('-vi', '--variable_by_index', type=int, default=None,
                         help='Index of the variable to be co-plotted. Index is the order of declaration (i.e. var #1'
                              ' plot is observable #1), or column as printed in the out_file.csv from KaSim (i.e. var #1'
@@ -92,6 +105,29 @@ def main():
     parser.add_argument('--text_instead_of_paths', action='store_true',
                         help='If set, figure will embed used glyphs and export text elements, instead of rendering the'
                              ' glyphs into paths. Only supported for PDF export.')
+    parser.add_argument('--cache', action='store_true',
+                        help='If set, save the parsed data next to each input file, as <file>.cache.npy, with its'
+                             ' legend in <file>.cache.json; later calls memory-map these instead of parsing the files,'
+                             ' until they are modified. Meant for large outputs plotted repeatedly.')
+    parser.add_argument('--downsample', type=str, choices=downsample_methods, default='minmax',
+                        help='How series with many more points than the axis has pixels are reduced before plotting:'
+                             ' `minmax` keeps, for each pixel, the first, last, smallest and largest values; `lttb`'
+                             ' keeps the points that best preserve the shape of the line, for series not drawn as'
+                             ' steps; `none` plots every point. Default is `minmax`.')
+    parser.add_argument('-mt', '--multi_thread', type=int, default=1,
+                        help='Number of processes for the concurrent pool of workers to read-in files. Default'
+                        ' uses 1, so a single-process for-loop.')
+    parser.add_argument('-g', '--grid_points', type=int, default=None,
+                        help='If given, resample every file onto this many evenly spaced time points, spanning all'
+                             ' files, and plot the mean over files, with shaded quantile bands, instead of one line per'
+                             ' file. Meant for replicates of a simulation.')
+    parser.add_argument('--interpolation', type=str, choices=['step', 'linear'], default='step',
+                        help='How values are resampled onto the time grid: `step` takes the last value output at or'
+                             ' before each time, as KaSim holds values between outputs; `linear` interpolates'
+                             ' between outputs. Default is `step`.')
+    parser.add_argument('--bands', type=float, nargs='+', default=[0.05, 0.25],
+                        help='Quantiles below one half; with a time grid, or a summary, the area between each and its'
+                             ' complement, e.g. 0.05 and 0.95, is shaded. Default is 0.05 and 0.25.')
     args = parser.parse_args()
 
     if args.text_size:
@@ -100,15 +136,35 @@ def main():
         plt.rcParams['pdf.fonttype'] = 42
 
     fig, ax = plt.subplots(figsize=args.figure_size, layout='constrained')
-    observable_coplot_axis_annotator(target_axis=ax,
-                                     file_pattern=args.pattern,
-                                     variable_index=args.variable_by_index,
-                                     variable_name=args.variable_by_name,
-                                     variable_expr=args.variable_expression,
-                                     differential_toggle=args.differential,
-                                     log_axis_x=args.log_x,
-                                     log_axis_y=args.log_y,
-                                     no_legend=True)
+    if args.summary_file:
+        if args.variable_expression or args.differential:
+            parser.error('Ensemble summaries hold statistics of single observables; expressions and differentials'
+                         ' can not be derived from them.')
+        ensemble_summary_axis_annotator(target_axis=ax,
+                                        summary_file=args.summary_file,
+                                        variable_index=args.variable_by_index,
+                                        variable_name=args.variable_by_name,
+                                        log_axis_x=args.log_x,
+                                        log_axis_y=args.log_y,
+                                        no_legend=True,
+                                        band_quantiles=tuple(args.bands))
+    else:
+        observable_coplot_axis_annotator(target_axis=ax,
+                                         file_pattern=args.pattern,
+                                         variable_index=args.variable_by_index,
+                                         variable_name=args.variable_by_name,
+                                         variable_expr=args.variable_expression,
+                                         differential_toggle=args.differential,
+                                         log_axis_x=args.log_x,
+                                         log_axis_y=args.log_y,
+                                         no_legend=True,
+                                         use_cache=args.cache,
+                                         downsample=args.downsample,
+                                         x_limits=(args.limit_left, args.limit_right),
+                                         process_number=args.multi_thread,
+                                         grid_points=args.grid_points,
+                                         interpolation=args.interpolation,
+                                         band_quantiles=tuple(args.bands))
 
     if not args.no_legend:
         if args.legend_loc is not None:
@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+"""
+Reduce replicate observable files into ensemble statistics on a common time grid, reading one file at a time.
+
+``` {.text}
+usage: kappa_observable_ensemble [-h] -p PATTERN [-o OUTPUT_FILE] [-g GRID_POINTS] [--interpolation {step,linear}] [-vn [VARIABLE_NAMES ...]] [--sketch_size SKETCH_SIZE] [--quantiles QUANTILE [QUANTILE ...]] [--seed SEED] [--cache] [-v]
+[-h]                            Show detailed help.
+-p PATTERN                      Pattern matching the replicate files, e.g. <'replicate_*/data.csv'>.
+[-o OUTPUT_FILE]                NumPy archive for the summary; default <ensemble.npz>.
+[-g GRID_POINTS]                Number of evenly spaced time points; default 1000.
+[--interpolation {step,linear}] How replicates are resampled onto the grid; default <step>, holding values.
+[-vn [VARIABLE_NAMES ...]]      Observables to summarize; default all.
+[--sketch_size SKETCH_SIZE]     Values kept per time point and observable for quantiles; default 100.
+[--quantiles QUANTILE [QUANTILE ...]]
+                                Quantiles to keep; default 0.01 0.05 0.1 0.25 0.5 0.75 0.9 0.95 0.99.
+[--seed SEED]                   Seed for the sampling of values kept for quantiles.
+[--cache]                       Keep a binary copy of each file's data next to it, memory-mapped on later calls.
+[-v]                            If set, print progress to standard output.
+```
+
+For each observable and time point, the summary holds the number of replicates with a value there, the mean, standard
+deviation, minimum and maximum, and the requested quantiles, estimated from a random sample of at most `SKETCH_SIZE`
+replicates, exact for smaller ensembles. Memory use depends on the grid and the sketch size, not on the number of
+replicates. The summary can be plotted with `kappa_observable_coplotter`, e.g.
+`kappa_observable_coplotter -s ensemble.npz -vn 'AB' --bands 0.05 0.25`.
+"""
+
+import argparse
+from pathlib import Path
+from KaSaAn.functions import reduce_observable_ensemble, write_ensemble_summary
+from KaSaAn.functions.observable_coplotter import _find_data_files
+from KaSaAn.functions.observable_ensemble import default_quantiles
+
+
+def main():
+    """Reduce replicate observable files, one at a time, into the mean, spread, extremes, and quantiles of each
+    observable over a common time grid."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('-p', '--pattern', type=str, required=True,
+                        help='Pattern, passed to glob.glob, matching the replicate files; should probably be quoted.')
+    parser.add_argument('-o', '--output_file', type=Path, default=Path('ensemble.npz'),
+                        help='Name of the NumPy archive where the summary should be saved; default `ensemble.npz`.')
+    parser.add_argument('-g', '--grid_points', type=int, default=1000,
+                        help='Number of evenly spaced time points, spanning all files, onto which each replicate is'
+                             ' resampled. Default is 1000.')
+    parser.add_argument('--interpolation', type=str, choices=['step', 'linear'], default='step',
+                        help='How values are resampled onto the time grid: `step` takes the last value output at or'
+                             ' before each time, as KaSim holds values between outputs; `linear` interpolates'
+                             ' between outputs. Default is `step`.')
+    parser.add_argument('-vn', '--variable_names', type=str, default=None, nargs='*',
+                        help='Names of the observables to summarize; only their columns are read. Default is all.')
+    parser.add_argument('--sketch_size', type=int, default=100,
+                        help='Number of values kept, per time point and observable, to estimate quantiles. Quantiles'
+                             ' are exact for ensembles of up to this many replicates. Default is 100.')
+    parser.add_argument('--quantiles', type=float, nargs='+', default=list(default_quantiles),
+                        help='Quantiles to keep in the summary; the coplotter shades bands between pairs of them.'
+                             ' Default is 0.01 0.05 0.1 0.25 0.5 0.75 0.9 0.95 0.99.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the random sampling of the values kept for quantiles, for reproducible'
+                             ' summaries of large ensembles.')
+    parser.add_argument('--cache', action='store_true',
+                        help='If set, save the parsed data next to each input file, as <file>.cache.npy, with its'
+                             ' legend in <file>.cache.json; later calls memory-map these instead of parsing the files,'
+                             ' until they are modified.')
+    parser.add_argument('-v', '--verbosity', action='store_true',
+                        help='If set, print progress to standard output.')
+    args = parser.parse_args()
+
+    file_names = _find_data_files(args.pattern)
+    summary = reduce_observable_ensemble(file_names, args.grid_points, args.interpolation, args.variable_names or None,
+                                         args.sketch_size, args.quantiles, args.cache, args.seed, args.verbosity)
+    if not args.output_file.parent.exists():
+        args.output_file.parent.mkdir(parents=True)
+    write_ensemble_summary(summary, args.output_file)
+
+
+if __name__ == '__main__':
+    main()
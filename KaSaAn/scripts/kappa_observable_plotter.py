@@ -3,7 +3,7 @@
 Plot a trace file produced by KaSim.
 
 ``` {.text}
-usage: kappa_observable_plotter [-h] [-i INPUT_FILE_NAME] [-o OUTPUT_FILE_NAME] [-p PRINT_OBSERVABLES_TO_FILE] [-vi [VARIABLE_INDEXES ...]] [-vn [VARIABLE_NAMES ...]] [-ve [VARIABLE_EXPRESSIONS ...]] [-fs WIDTH HEIGHT] [--limit_left LIMIT_LEFT] [--limit_right LIMIT_RIGHT] [--limit_bottom LIMIT_BOTTOM] [--limit_top LIMIT_TOP] [-d] [-lx] [-ly] [-ts TEXT_SIZE] [--legend_loc {upper left,upper center,upper right,center left,center,center right,lower left,lower center,lower right,outside right upper,outside right lower,outside left upper,outside left lower}] [--legend_ncol LEGEND_NCOL]
+usage: kappa_observable_plotter [-h] [-i INPUT_FILE_NAME] [-o OUTPUT_FILE_NAME] [-p PRINT_OBSERVABLES_TO_FILE] [-vi [VARIABLE_INDEXES ...]] [-vn [VARIABLE_NAMES ...]] [-ve [VARIABLE_EXPRESSIONS ...]] [-fs WIDTH HEIGHT] [--limit_left LIMIT_LEFT] [--limit_right LIMIT_RIGHT] [--limit_bottom LIMIT_BOTTOM] [--limit_top LIMIT_TOP] [-d] [-lx] [-ly] [-ts TEXT_SIZE] [--legend_loc {upper left,upper center,upper right,center left,center,center right,lower left,lower center,lower right,outside right upper,outside right lower,outside left upper,outside left lower}] [--legend_ncol LEGEND_NCOL] [--cache] [--downsample {minmax,lttb,none}]
 [-h]                            Show detailed help.
 [-i INPUT_FILE_NAME]            File to be plotted, <data.csv> if omitted.
 [-o OUTPUT_FILE_NAME]           If given, save plot to file; else show.
@@ -28,6 +28,9 @@ usage: kappa_observable_plotter [-h] [-i INPUT_FILE_NAME] [-o OUTPUT_FILE_NAME]
                                     outside left lower, outside right lower
 [--legend_ncol LEGEND_NCOL]     Number of columns for the legend.
 [--text_instead_of_paths]       Output text elements instead of paths; embeds used glyphs
+[--cache]                       Keep a binary copy of the data next to the file, memory-mapped on later calls.
+[--downsample {minmax,lttb,none}]
+                                Reduce long series to the axis's width before plotting; default <minmax>.
 ```
 """
 
@@ -35,7 +38,8 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 from argparse import ArgumentParser
 from pathlib import Path
-from KaSaAn.functions import observable_file_reader, observable_list_axis_annotator
+from KaSaAn.functions import observable_file_reader, observable_list_axis_annotator, observable_file_legend, \
+    observable_columns_needed, downsample_methods
 
 
 def main():
@@ -95,6 +99,15 @@ def main():
     parser.add_argument('--text_instead_of_paths', action='store_true',
                         help='If set, figure will embed used glyphs and export text elements, instead of rendering the'
                              ' glyphs into paths. Only supported for PDF export.')
+    parser.add_argument('--cache', action='store_true',
+                        help='If set, save the parsed data next to the input file, as <file>.cache.npy, with its legend'
+                             ' in <file>.cache.json; later calls memory-map these instead of parsing the file, until'
+                             ' it is modified. Meant for large outputs plotted repeatedly.')
+    parser.add_argument('--downsample', type=str, choices=downsample_methods, default='minmax',
+                        help='How series with many more points than the axis has pixels are reduced before plotting:'
+                             ' `minmax` keeps, for each pixel, the first, last, smallest and largest values; `lttb`'
+                             ' keeps the points that best preserve the shape of the line, for series not drawn as'
+                             ' steps; `none` plots every point. Default is `minmax`.')
     args = parser.parse_args()
 
     if args.text_size:
@@ -102,16 +115,27 @@ def main():
     if args.text_instead_of_paths:
         plt.rcParams['pdf.fonttype'] = 42
 
-    this_data = observable_file_reader(args.input_file_name)
+    # only the columns of the requested variables, if any, are read; indexes are then resolved to their names
+    full_legend = observable_file_legend(args.input_file_name)
+    columns = observable_columns_needed(full_legend, args.variable_indexes, args.variable_names,
+                                        args.variable_expressions)
+    this_data = observable_file_reader(args.input_file_name, use_cache=args.cache, columns=columns)
+    if columns is not None:
+        vars_indexes = None
+        vars_names = [full_legend[ix - 1] for ix in args.variable_indexes or []] + list(args.variable_names or [])
+    else:
+        vars_indexes, vars_names = args.variable_indexes, args.variable_names
 
     fig, ax = plt.subplots(figsize=args.fig_size, layout='constrained')
     observable_list_axis_annotator(obs_axis=ax, data=this_data,
-                                   vars_indexes=args.variable_indexes,
-                                   vars_names=args.variable_names,
+                                   vars_indexes=vars_indexes,
+                                   vars_names=vars_names,
                                    vars_exprs=args.variable_expressions,
                                    axis_x_log=args.log_x, axis_y_log=args.log_y,
                                    diff_toggle=args.differential,
-                                   add_legend=False)
+                                   add_legend=False,
+                                   downsample=args.downsample,
+                                   x_limits=(args.limit_left, args.limit_right))
     if args.legend_loc is not None:
         fig.legend(loc=args.legend_loc, ncol=args.legend_ncol)
     else:
@@ -122,7 +146,7 @@ def main():
     # print out observables
     if args.print_observables_to_file:
         with open(args.print_observables_to_file, 'w') as file:
-            for obs in this_data[0]:
+            for obs in full_legend:
                 file.write(obs + '\n')
 
     # save or display the figure
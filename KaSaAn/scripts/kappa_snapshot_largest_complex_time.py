@@ -3,7 +3,7 @@
 Plot the compostion of the giant component in time from a set of snapshots located in a directory.
 
 ``` {.text}
-usage: kappa_snapshot_largest_complex_time [-h] [-d DIRECTORY] [-p PATTERN] [-cs COLORING_SCHEME] [-o OUTPUT_NAME] [-fs WIDTH HEIGHT] [--lin_log] [--log_lin] [--log_log] [--un_stacked] [-mt MULTI_THREAD] [-ts TEXT_SIZE]
+usage: kappa_snapshot_largest_complex_time [-h] [-d DIRECTORY] [-p PATTERN] [-cs COLORING_SCHEME] [-o OUTPUT_NAME] [-fs WIDTH HEIGHT] [--lin_log] [--log_lin] [--log_log] [--un_stacked] [-mt MULTI_THREAD] [-ts TEXT_SIZE] [--cache CACHE_FILE] [--watch SECONDS] [--shard INDEX/NUMBER] [--merge PARTIAL [PARTIAL ...]] [--trace TRACE_FILE] [--every_event EVENTS | --every_time TIME]
 [-h]                        Show detailed help.
 [-d DIRECTORY]              Directory where snapshots are stored, default is <.>
 [-p PATTERN]                Pattern that groups desired snapshots names; default 'snap*.ka'.
@@ -18,7 +18,7 @@ usage: kappa_snapshot_largest_complex_time [-h] [-d DIRECTORY] [-p PATTERN] [-cs
 [--log_lin]                 If specified, produce an additional plot with logarithmic X-axis and linear Y-axis.
 [--log_log]                 If specified, produce an additional plot with logarithmic X-axis and logarithmic Y-axis.
 [--un_stacked]              If given, produce regular non-stacked plot.
-[--mt THREADS]              Launch multiple threads for reading snapshots. Safe, but always less performant: WIP.
+[-mt PROCESSES]             Launch multiple worker processes for reading snapshots; default 1, a simple loop.
 [-ts TEXT_SIZE]             Override default size for text, in points.
 [--stack_method] {...}      The order of elements in the stackplot. Choices are:
                                 first_in_first_out:     Patterns are plotted in the order in which they are encountered while reading snapshots.
@@ -29,20 +29,38 @@ usage: kappa_snapshot_largest_complex_time [-h] [-d DIRECTORY] [-p PATTERN] [-cs
                                 descending_initial:     Patterns are plotted in descending abundances, as measured in the first snapshot.
                                 descending_final:       Patterns are plotted in descending abundances, as measured in the final snapshot.
 [--text_instead_of_paths]   Output text elements instead of paths; embeds used glyphs
+[--cache CACHE_FILE]        Results store of per-snapshot results; only new or modified snapshots are parsed.
+[--watch SECONDS]           Re-analyze and re-save every so many seconds, e.g. while KaSim runs; requires -o.
+[--shard INDEX/NUMBER]      Analyze only one shard of the snapshots, e.g. <0/4>, saving partial results to -o.
+[--merge PARTIAL ...]       Instead of reading snapshots, combine the partial results files of all shards, then plot.
+[--trace TRACE_FILE]        Instead of reading snapshots, replay a KaSim trace, sampling the mixture after every event.
+[--every_event EVENTS]      With --trace, sample the mixture every so many events instead.
+[--every_time TIME]         With --trace, sample the mixture every so many units of simulation time instead.
+```
+
+To split the analysis over several machines, or processes, run each shard with its own output file, then merge:
+``` {.text}
+kappa_snapshot_largest_complex_time -d sims --shard 0/2 -o part_0.json
+kappa_snapshot_largest_complex_time -d sims --shard 1/2 -o part_1.json
+kappa_snapshot_largest_complex_time --merge part_0.json part_1.json -o largest_complex.png
 ```
 """
 
 import argparse
 import ast
+import json
 import matplotlib as mpl
 import matplotlib.colors as mpco
 import matplotlib.pyplot as plt
+import time
 from pathlib import Path
 from KaSaAn.core.KappaError import ComplexParseError, AgentParseError
 from KaSaAn.core.KappaAgent import KappaAgent
 from KaSaAn.core.KappaComplex import KappaComplex
-from KaSaAn.functions import find_snapshot_names
-from KaSaAn.functions.graph_largest_complex_composition import snapshot_list_to_plot_matrix, _make_figure, _stacked_plot_methods
+from KaSaAn.functions import find_snapshot_names, parse_shard, select_shard, write_partial_results, \
+    merge_partial_results
+from KaSaAn.functions.graph_largest_complex_composition import collect_snapshot_summaries, summaries_to_plot_matrix, \
+    _make_figure, _stacked_plot_methods, _pattern_expressions, collect_trace_summaries
 
 
 def main():
@@ -81,8 +99,9 @@ def main():
                         ' formulae). Useful when plotting patterns that may overlap, ergo whose stacking would not be'
                         ' as intuitive.')
     parser.add_argument('-mt', '--multi_thread', type=int, default=1,
-                        help='Number of threads for the concurrent pool of workers to read-in snapshots. Default uses'
-                        ' 1, so a single-threaded for-loop.')
+                        help='Number of processes for the concurrent pool of workers to read-in snapshots. Default'
+                        ' uses 1, so a single-process for-loop. Workers return only the time and largest-complex'
+                        ' composition of each snapshot; results are gathered as they complete.')
     parser.add_argument('-ts', '--text_size', type=int,
                         help="If given, set point size for all text elements, overriding MatPlotLib's default.")
     parser.add_argument('--stack_method', choices=_stacked_plot_methods.keys(), type=str, default=next(iter(_stacked_plot_methods)),
@@ -90,7 +109,43 @@ def main():
     parser.add_argument('--text_instead_of_paths', action='store_true',
                         help='If set, figure will embed used glyphs and export text elements, instead of rendering the'
                              ' glyphs into paths. Only supported for PDF export.')
+    parser.add_argument('--cache', type=Path, default=None,
+                        help='If given, file of the results store where per-snapshot results are kept, so that'
+                             ' re-running on the same directory only parses new or modified snapshots (e.g. to re-plot'
+                             ' with different axes, or after a simulation produced more snapshots).')
+    parser.add_argument('--watch', type=float, default=None,
+                        help='If given, re-analyze the directory and re-save the figures every so many seconds, until'
+                             ' interrupted; meant to follow a running simulation. Requires an output name, and is best'
+                             ' paired with a results store, see --cache.')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='If given, as <index/number>, zero-based, e.g. <0/4>, analyze only that shard of the'
+                             ' snapshots: every number-th snapshot, starting at index. Instead of figures, partial'
+                             ' results are saved to the output name, to be combined later with --merge. Shards need no'
+                             ' coordination, so they can run on separate machines sharing the snapshot directory.')
+    parser.add_argument('--merge', type=Path, nargs='+', default=None,
+                        help='Instead of reading snapshots, combine the partial results files written by every shard'
+                             ' (see --shard), then plot as usual. Shards must have been run with the same color'
+                             ' scheme, as it determines the patterns analyzed.')
+    parser.add_argument('--trace', type=Path, default=None,
+                        help='If given, a KaSim trace file (e.g. from `-trace t.json`) to replay instead of reading'
+                             ' snapshots: the largest complex is then followed at event resolution, without KaSim'
+                             ' having dumped any snapshot.')
+    trace_sampling = parser.add_mutually_exclusive_group()
+    trace_sampling.add_argument('--every_event', type=int, default=None,
+                                help='With --trace, sample the mixture every so many events; default is every event.')
+    trace_sampling.add_argument('--every_time', type=float, default=None,
+                                help='With --trace, sample the mixture every so many units of simulation time.')
     args = parser.parse_args()
+    if (args.every_event is not None or args.every_time is not None) and not args.trace:
+        parser.error('--every_event and --every_time require a trace, see --trace')
+    if args.trace and (args.shard or args.merge or args.cache):
+        parser.error('--trace is not supported with --shard, --merge, nor --cache')
+    if args.watch is not None and not args.output_name:
+        parser.error('--watch requires an output name, see -o')
+    if (args.shard or args.merge) and args.watch is not None:
+        parser.error('--shard and --merge are not supported with --watch')
+    if args.shard and (args.merge or not args.output_name):
+        parser.error('--shard requires an output name for the partial results, see -o, and excludes --merge')
 
     if args.text_size:
         mpl.rcParams['font.size'] = args.text_size
@@ -119,11 +174,44 @@ def main():
     else:
         coloring_scheme = None
 
-    snap_name_list = find_snapshot_names(target_directory=args.directory, name_pattern=args.pattern)
-    s_times, p_matrix, pattern_list = snapshot_list_to_plot_matrix(snapshot_names=snap_name_list,
-                                                                   patterns_requested=coloring_scheme,
-                                                                   thread_number=args.multi_thread,
-                                                                   stack_order=args.stack_method)
+    if args.shard:
+        snap_name_list = select_shard(find_snapshot_names(target_directory=args.directory, name_pattern=args.pattern),
+                                      *args.shard)
+        summaries = collect_snapshot_summaries(snap_name_list, coloring_scheme, args.multi_thread, args.cache)
+        if not args.output_name.parent.exists():
+            args.output_name.parent.mkdir(parents=True)
+        write_partial_results(args.output_name, summaries, 'largest_complex_composition',
+                              json.dumps(_pattern_expressions(coloring_scheme)), *args.shard)
+        return
+
+    while True:
+        _plot_directory(args, coloring_scheme)
+        if args.watch is None:
+            break
+        plt.close('all')
+        try:
+            time.sleep(args.watch)
+        except KeyboardInterrupt:
+            break
+
+
+def _plot_directory(args: argparse.Namespace, coloring_scheme) -> None:
+    """Analyze the snapshots in the requested directory, merge the partial results of its shards, or replay the
+    requested trace, then save or display the figures."""
+    if args.trace:
+        summaries = collect_trace_summaries(args.trace, coloring_scheme, args.every_event, args.every_time)
+    elif args.merge:
+        summaries, _ = merge_partial_results(args.merge, 'largest_complex_composition',
+                                             json.dumps(_pattern_expressions(coloring_scheme)))
+    else:
+        snap_name_list = find_snapshot_names(target_directory=args.directory, name_pattern=args.pattern)
+        summaries = collect_snapshot_summaries(snapshot_names=snap_name_list,
+                                               patterns_requested=coloring_scheme,
+                                               thread_number=args.multi_thread,
+                                               cache_file=args.cache)
+    s_times, p_matrix, pattern_list = summaries_to_plot_matrix(summaries=summaries,
+                                                               patterns_requested=coloring_scheme,
+                                                               stack_order=args.stack_method)
     # scale plot
     fig_lin_lin = _make_figure(s_times, p_matrix, pattern_list, args.figure_size,
                                'linear', 'linear', args.un_stacked, coloring_scheme)
@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+"""
+Summarize a series of snapshots into one table, parsing each snapshot once.
+
+``` {.text}
+usage: kappa_snapshot_summarize [-h] [-d DIRECTORY] [-p PATTERN] [-o OUTPUT_FILE] [-mt PROCESSES]
+                                [--patterns [PATTERN ...]] [-v]
+[-h]                            Show detailed help.
+[-d DIRECTORY]                  Directory where snapshots are stored, default is <.>
+[-p PATTERN]                    Pattern that groups desired snapshots names; default 'snap*.ka'.
+[-o OUTPUT_FILE]                File for the table; CSV like KaSim's <data.csv>, or NumPy archive if ending in <.npz>.
+                                Default <snapshot_summary.csv>.
+[-mt PROCESSES]                 Launch multiple worker processes for reading snapshots; default 1, a simple loop.
+[--patterns [PATTERN ...]]      Kappa patterns whose number of embeddings should also be reported.
+[-v]                            If set, print progress to standard output.
+```
+
+One row per snapshot, sorted by time. Columns are time, event, total mass, number of species, number of complexes,
+size of the largest complex, the mean and variance of complex size, and the mass-weighted mean size; then the abundance
+of each agent type, the value of each token, and the number of embeddings of each requested pattern, named as `|A()|`,
+`|token|`, and `|pattern|` respectively. The table can be plotted with `kappa_observable_plotter`, e.g.
+`kappa_observable_plotter -i snapshot_summary.csv -vn largest_size`.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from KaSaAn.functions import find_snapshot_names
+from KaSaAn.functions.snapshot_summarizer import summarize_snapshots, write_summary
+from KaSaAn.core import KappaSnapshot
+
+
+def main():
+    """Summarize each snapshot in a directory into one row of a table: time, mass, number of species, sizes, agent type
+    composition, token values, and pattern counts. Each snapshot is parsed once."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('-d', '--directory', type=str, default='.',
+                        help='Name of the directory where snapshots are stored; default is current directory.')
+    parser.add_argument('-p', '--pattern', type=str, default='snap*.ka',
+                        help='Pattern that should be used to get the snapshot names; default is as produced by KaSim,'
+                        ' `snap*.ka`')
+    parser.add_argument('-o', '--output_file', type=Path, default=Path('snapshot_summary.csv'),
+                        help='Name of the file where the table should be saved. If it ends in `.npz`, a NumPy archive'
+                             ' with arrays `columns` and `data`; otherwise a CSV laid out like KaSim\'s `data.csv`.'
+                             ' Default is `snapshot_summary.csv`.')
+    parser.add_argument('-mt', '--multi_thread', type=int, default=1,
+                        help='Number of processes for the concurrent pool of workers to read-in snapshots. Default'
+                        ' uses 1, so a single-process for-loop.')
+    parser.add_argument('--patterns', type=str, nargs='*', default=None,
+                        help='Kappa expressions, of agents or complexes, whose number of embeddings in each snapshot'
+                             ' should be added to the table.')
+    parser.add_argument('-v', '--verbosity', action='store_true',
+                        help='If set, print progress to standard output.')
+    args = parser.parse_args()
+
+    snap_names = find_snapshot_names(target_directory=args.directory, name_pattern=args.pattern)
+    column_names, table = summarize_snapshots(snap_names, args.patterns, args.multi_thread, args.verbosity)
+    if not args.output_file.parent.exists():
+        args.output_file.parent.mkdir(parents=True)
+    write_summary(column_names, table, args.output_file,
+                  recipe=' '.join("'{}'".format(arg) for arg in ['kappa_snapshot_summarize'] + sys.argv[1:]),
+                  uuid=KappaSnapshot.read_header(snap_names[0])[1] if snap_names else '')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@
 Make a movie out of a set of snapshot files, and save it to disk.
 
 ``` {.text}
-usage: kappa_trace_movie_maker [-h] [-d DIRECTORY] [-p PATTERN] [-m {mass,count,size}] [-o OUTPUT_FILE] [-w FIG_WIDTH] [-r XY_RATIO] [-s] [-l LEGEND_COLUMNS] [-f FRAME_INTERVAL] [-v] [-ts TEXT_SIZE]
+usage: kappa_trace_movie_maker [-h] [-d DIRECTORY] [-p PATTERN] [-m {mass,count,size}] [-o OUTPUT_FILE] [-w FIG_WIDTH] [-r XY_RATIO] [-s] [-l LEGEND_COLUMNS] [-f FRAME_INTERVAL] [-v] [-ts TEXT_SIZE] [--stream] [-mp PROCESSES] [--trace TRACE_FILE] [--every_event EVENTS | --every_time TIME]
 [-h]                            Show detailed help.
 [-d DIRECTORY]                  Directory where snapshots are located, default <.>
 [-m {mass,count,size}]          What dictates area; default is mass.
@@ -15,6 +15,11 @@ usage: kappa_trace_movie_maker [-h] [-d DIRECTORY] [-p PATTERN] [-m {mass,count,
 [-f FRAME_INTERVAL]             Number of mili-seconds between frames in the animation.
 [-v]                            Display information about number of snapshots found.
 [-ts TEXT_SIZE]                 Override default size for text, in points.
+[--stream]                      Write frames to file as they are rendered, holding one snapshot at a time; requires -o.
+[-mp PROCESSES]                 Render frames in this many worker processes, then write them in order; requires -o.
+[--trace TRACE_FILE]            Replay a KaSim trace instead of reading snapshots, a frame per event; requires -o.
+[--every_event EVENTS]          With --trace, draw a frame every so many events instead.
+[--every_time TIME]             With --trace, draw a frame every so many units of simulation time instead.
 ```
 
 For example:
@@ -30,7 +35,8 @@ import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 import matplotlib.widgets as mpw
 from pathlib import Path
-from KaSaAn.functions import movie_from_snapshots
+from KaSaAn.functions import movie_from_snapshots, movie_from_snapshots_streaming, movie_from_snapshots_parallel, \
+    movie_from_trace
 
 
 def main(args=None):
@@ -70,12 +76,83 @@ def main(args=None):
                         help='Display information about number of snapshots found.')
     parser.add_argument('-ts', '--text_size', type=int,
                         help="If given, set point size for all text elements, overriding MatPlotLib's default.")
+    parser.add_argument('--stream', action='store_true',
+                        help='If set, write the movie to file frame by frame: a first pass over the snapshots gathers'
+                             ' the agents present and the maximum mass, a second one parses, renders, and writes each'
+                             ' snapshot in turn, so that only one snapshot and one frame are held in memory. Meant for'
+                             ' long traces. Requires an output file.')
+    parser.add_argument('-mp', '--multi_process', type=int, default=1,
+                        help='Number of worker processes rendering frames into image buffers, which are then written'
+                             ' in order; as with --stream, snapshots are parsed one at a time per worker. Default'
+                             ' uses 1, i.e. no worker pool. Requires an output file.')
+    parser.add_argument('--trace', type=Path, default=None,
+                        help='If given, a KaSim trace file (e.g. from `-trace t.json`) to replay instead of reading'
+                             ' snapshots, drawing frames of the mixture at event resolution; frames are written as'
+                             ' with --stream. Requires an output file.')
+    trace_sampling = parser.add_mutually_exclusive_group()
+    trace_sampling.add_argument('--every_event', type=int, default=None,
+                                help='With --trace, draw a frame every so many events; default is every event.')
+    trace_sampling.add_argument('--every_time', type=float, default=None,
+                                help='With --trace, draw a frame every so many units of simulation time.')
 
     args = parser.parse_args()
+    if args.trace and not args.output_file:
+        parser.error('--trace requires an output file, see -o')
+    if (args.every_event is not None or args.every_time is not None) and not args.trace:
+        parser.error('--every_event and --every_time require a trace, see --trace')
+    if args.stream and not args.output_file:
+        parser.error('--stream requires an output file, see -o')
+    if args.multi_process > 1 and not args.output_file:
+        parser.error('--multi_process requires an output file, see -o')
 
     if args.text_size:
         mpl.rcParams['font.size'] = args.text_size
 
+    # replay the trace, writing frames as they are drawn
+    if args.trace:
+        if not args.output_file.parent.exists():
+            args.output_file.parent.mkdir(parents=True)
+        movie_from_trace(trace_file=args.trace,
+                         output_file=args.output_file,
+                         writer=_pick_writer(args.output_file, 1000 / args.frame_interval),
+                         vis_mode=args.vis_mode,
+                         fig_width=args.fig_width,
+                         xy_ratio=args.XY_ratio,
+                         dont_scale_mass=args.do_not_scale_mass,
+                         legend_cols=args.legend_columns,
+                         every_event=args.every_event,
+                         every_time=args.every_time,
+                         verbose=args.verbose)
+        return
+    # render frames in parallel, write them in order
+    if args.multi_process > 1:
+        if not args.output_file.parent.exists():
+            args.output_file.parent.mkdir(parents=True)
+        movie_from_snapshots_parallel(directory=args.directory, pattern=args.pattern,
+                                      output_file=args.output_file,
+                                      writer=_pick_writer(args.output_file, 1000 / args.frame_interval),
+                                      vis_mode=args.vis_mode,
+                                      fig_width=args.fig_width,
+                                      xy_ratio=args.XY_ratio,
+                                      dont_scale_mass=args.do_not_scale_mass,
+                                      legend_cols=args.legend_columns,
+                                      process_number=args.multi_process,
+                                      verbose=args.verbose)
+        return
+    # stream the animation to file
+    if args.stream:
+        if not args.output_file.parent.exists():
+            args.output_file.parent.mkdir(parents=True)
+        movie_from_snapshots_streaming(directory=args.directory, pattern=args.pattern,
+                                       output_file=args.output_file,
+                                       writer=_pick_writer(args.output_file, 1000 / args.frame_interval),
+                                       vis_mode=args.vis_mode,
+                                       fig_width=args.fig_width,
+                                       xy_ratio=args.XY_ratio,
+                                       dont_scale_mass=args.do_not_scale_mass,
+                                       legend_cols=args.legend_columns,
+                                       verbose=args.verbose)
+        return
     # make the animation
     my_animation = movie_from_snapshots(directory=args.directory, pattern=args.pattern,
                                         vis_mode=args.vis_mode,
@@ -89,13 +166,9 @@ def main(args=None):
     if args.output_file:
         if not args.output_file.parent.exists():
             args.output_file.parent.mkdir(parents=True)
-        # Use the ImageMagick writer if a gif was requested; else use the default mpeg writer
-        if args.output_file[-4:] == '.gif':
-            my_writer = animation.ImageMagickFileWriter()
-        else:
-            my_writer = 'ffmpeg'
+        my_writer = _pick_writer(args.output_file, 1000 / args.frame_interval)
         if args.verbose:
-            print('Now saving animation to file <<' + args.output_file + '>>')
+            print('Now saving animation to file <<' + str(args.output_file) + '>>')
         my_animation.save(filename=args.output_file, writer=my_writer)
     else:
         # adjust axis to add space for plot controls; add axes
@@ -121,5 +194,13 @@ def main(args=None):
         plt.show()
 
 
+def _pick_writer(output_file: Path, fps: float) -> animation.AbstractMovieWriter:
+    """Use the ImageMagick writer if a gif was requested; else use the default mpeg writer."""
+    if output_file.suffix == '.gif':
+        return animation.ImageMagickFileWriter(fps=fps)
+    else:
+        return animation.FFMpegWriter(fps=fps)
+
+
 if __name__ == '__main__':
     main()
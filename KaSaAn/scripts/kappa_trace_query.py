@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+"""
+Evaluate a trace query, in a subset of the Kappa trace query language, over a KaSim trace, in a single pass.
+
+``` {.text}
+usage: kappa_trace_query [-h] -t TRACE_FILE -q QUERY_FILE [-d OUTPUT_DIRECTORY] [-v]
+[-h]                            Show detailed help.
+[-t TRACE_FILE]                 Trace file written by KaSim, e.g. <t.json>.
+[-q QUERY_FILE]                 File containing the query.
+[-d OUTPUT_DIRECTORY]           Directory where the query's output file, and any snapshots, are written; default <.>
+[-v]                            If set, print progress to standard output.
+```
+
+For example, the query in `models/trace_viz/my_query.txt`:
+``` {.text}
+query 'snapshots.csv'
+match e every 10 seconds
+return snapshot[.e]
+```
+writes a snapshot of the mixture every 10 units of simulated time, named `snapshot.1.ka`, `snapshot.2.ka`, etc., as
+read by `kappa_trace_movie_maker`, and lists them in `snapshots.csv`. Besides snapshots, queries can return the time,
+event number, and rule of the matched event; pattern counts; the number of complexes; the size of the largest one; and
+the complex of a given agent. See `KaSaAn.functions.trace_query` for the supported language.
+"""
+
+import argparse
+from pathlib import Path
+from KaSaAn.functions import run_trace_query
+
+
+def main():
+    """Evaluate a trace query over a KaSim trace, writing a table of results, and snapshots if requested."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('-t', '--trace_file', type=Path, required=True,
+                        help='Trace file written by KaSim, e.g. by running it with `-trace t.json`.')
+    parser.add_argument('-q', '--query_file', type=Path, required=True,
+                        help='File containing the query, with its query, match, and return clauses.')
+    parser.add_argument('-d', '--output_directory', type=Path, default=Path('.'),
+                        help='Directory where the output file named by the query is written, along with any'
+                             ' snapshots; default is current directory.')
+    parser.add_argument('-v', '--verbosity', action='store_true',
+                        help='If set, print progress to standard output.')
+    args = parser.parse_args()
+
+    with open(args.query_file, 'r') as query_file:
+        query_text = query_file.read()
+    match_number = run_trace_query(args.trace_file, query_text, args.output_directory, args.verbosity)
+    if args.verbosity:
+        print('Query matched {} events'.format(match_number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+"""
+Tabulate, from a KaSim trace, how often each rule fired, and the intervals between its firings, in bins of time.
+
+``` {.text}
+usage: kappa_trace_rule_activity [-h] -t TRACE_FILE [-b BINS] [-o OUTPUT_FILE]
+[-h]                            Show detailed help.
+[-t TRACE_FILE]                 Trace file written by KaSim, e.g. <t.json>.
+[-b BINS]                       Number of time bins; default 100. At least half of them are used.
+[-o OUTPUT_FILE]                File for the table; CSV like KaSim's <data.csv>, or NumPy archive if ending in <.npz>.
+                                Default <rule_activity.csv>.
+```
+
+One row per bin of simulation time, starting at time zero, all bins of equal width. Columns are the start time of the
+bin; the number of events in it, with the mean and standard deviation of the time between consecutive events; then,
+for each rule, named `r`, the number of times it fired, `firings(r)`, and the mean and standard deviation of the time
+since its previous firing, `interval_mean(r)` and `interval_std(r)`. The trace is read once, in constant memory. The
+table can be plotted with `kappa_observable_plotter`, e.g.
+`kappa_observable_plotter -i rule_activity.csv -vn 'firings(A.B)' 'firings(A.B_op)'`.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from KaSaAn.core import KappaTrace
+from KaSaAn.functions import rule_activity_of_trace, write_summary
+
+
+def main():
+    """Tabulate the firings of each rule, and the intervals between them, in bins of simulation time, from a trace."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('-t', '--trace_file', type=Path, required=True,
+                        help='Trace file written by KaSim, e.g. by running it with `-trace t.json`.')
+    parser.add_argument('-b', '--bins', type=int, default=100,
+                        help='Number of bins of simulation time. Their width is adjusted as the trace is read, so that'
+                             ' at least half of them are used. Default is 100.')
+    parser.add_argument('-o', '--output_file', type=Path, default=Path('rule_activity.csv'),
+                        help='Name of the file where the table should be saved. If it ends in `.npz`, a NumPy archive'
+                             ' with arrays `columns` and `data`; otherwise a CSV laid out like KaSim\'s `data.csv`.'
+                             ' Default is `rule_activity.csv`.')
+    args = parser.parse_args()
+
+    column_names, table = rule_activity_of_trace(args.trace_file, args.bins)
+    if not args.output_file.parent.exists():
+        args.output_file.parent.mkdir(parents=True)
+    write_summary(column_names, table, args.output_file,
+                  recipe=' '.join("'{}'".format(arg) for arg in ['kappa_trace_rule_activity'] + sys.argv[1:]),
+                  uuid=KappaTrace(args.trace_file).get_trace_uuid() or '')
+
+
+if __name__ == '__main__':
+    main()
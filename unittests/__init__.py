@@ -3,7 +3,10 @@
 from .test_KappaAgent import TestKappaAgent
 from .test_KappaComplex import TestKappaComplex
 from .test_KappaCounter import TestKappaCounter
+from .test_KappaMixture import TestKappaMixture
 from .test_KappaPort import TestKappaPort
 from .test_KappaRule import TestKappaRule
 from .test_KappaSnapshot import TestKappaSnapshot
+from .test_KappaSnapshotSeries import TestKappaSnapshotSeries
 from .test_KappaToken import TestKappaToken
+from .test_KappaTrace import TestKappaTrace
@@ -2,7 +2,8 @@
 
 import unittest
 from KaSaAn.core import KappaAgent
-from KaSaAn.core.KappaComplex import KappaComplex, NetMap, _edge_match, _node_match, _traverse_from
+from KaSaAn.core.KappaComplex import KappaComplex, NetMap, embed_and_map, iter_embeddings, count_embeddings, _edge_match, _node_match, \
+    _traverse_from
 
 
 class TestKappaComplex(unittest.TestCase):
@@ -113,6 +114,37 @@ class TestKappaComplex(unittest.TestCase):
         self.assertEqual(t0.get_number_of_embeddings(a2), t0.get_number_of_embeddings(s2))
         self.assertEqual(sim.get_number_of_embeddings('Dvl(DIX-head[1]), Dvl(DIX-tail[1])'), 2)
 
+    def test_iter_embeddings(self):
+        t6 = KappaComplex('Bob(h[3], t[1]), Bob(h[1], t[2]), Bob(h[2], t[3])')
+        t7 = KappaComplex('A(h[4], t[1]), A(h[1], t[2]), A(h[2], t[3], b[5]), A(h[3], t[4], b[6]), B(a[5]), B(a[6], s{r})')
+        ring = KappaComplex('A(h[4], t[1]), A(h[1], t[2]), A(h[2], t[3]), A(h[3], t[4])')
+        self.assertNotIsInstance(iter_embeddings(t6, t6), list)
+        self.assertEqual(3, len(list(iter_embeddings(t6, t6))))
+        self.assertEqual(1, len(list(iter_embeddings(t6, t6, unique=True))))
+        self.assertEqual(4, len(list(iter_embeddings(ring, t7))))
+        self.assertEqual(1, len(list(iter_embeddings(ring, t7, unique=True))))
+        self.assertEqual(0, len(list(iter_embeddings(t7, ring))))
+        maps_all, maps_unique = embed_and_map(ring, t7)
+        self.assertEqual(maps_all, list(iter_embeddings(ring, t7)))
+        self.assertEqual(maps_unique, set(iter_embeddings(ring, t7, unique=True)))
+
+    def test_count_embeddings(self):
+        t6 = KappaComplex('Bob(h[3], t[1]), Bob(h[1], t[2]), Bob(h[2], t[3])')
+        t7 = KappaComplex('A(h[4], t[1]), A(h[1], t[2]), A(h[2], t[3], b[5]), A(h[3], t[4], b[6]), B(a[5]), B(a[6], s{r})')
+        ring = KappaComplex('A(h[4], t[1]), A(h[1], t[2]), A(h[2], t[3]), A(h[3], t[4])')
+        self.assertEqual(3, t6.get_number_of_automorphisms())
+        self.assertEqual(4, ring.get_number_of_automorphisms())
+        self.assertEqual((3, 1), count_embeddings(t6, t6))
+        self.assertEqual((4, 1), count_embeddings(ring, t7))
+        self.assertEqual((0, 0), count_embeddings(t7, ring))
+        self.assertEqual((4, 1), count_embeddings(ring, t7, validate=True))
+        # symmetry broken by internal state on the query, but not on the target: image-set fallback
+        half_labeled = KappaComplex('B(b[1]{a}), B(b[1])')
+        full_labeled = KappaComplex('B(b[1]{a}), B(b[1]{a})')
+        maps_all, maps_unique = embed_and_map(half_labeled, full_labeled)
+        self.assertEqual((len(maps_all), len(maps_unique)), count_embeddings(half_labeled, full_labeled))
+        self.assertEqual((2, 1), count_embeddings(half_labeled, full_labeled))
+
     def test_get_agent_identifiers(self):
         self.assertTrue(33 in KappaComplex('x22:A(s[2]), x33:A(s[1])').get_agent_identifiers())
         self.assertTrue(22 in KappaComplex('x22:A(s[2]), x33:A(s[1])').get_agent_identifiers())
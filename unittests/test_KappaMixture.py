@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from KaSaAn.core import KappaMixture, KappaTrace
+from KaSaAn.core.KappaTrace import TraceAction, TraceAgent, TraceQuark
+
+
+class TestKappaMixture(unittest.TestCase):
+    """Testing the replay of trace actions into a KappaMixture."""
+    trace_prz = KappaTrace('./models/trace_viz/t.json')
+
+    def _connected_components(self, mixture):
+        """Components recomputed from scratch, to check the incremental ones against."""
+        components = []
+        seen = set()
+        for agent_id in range(len(mixture._agent_type)):
+            if mixture._agent_type[agent_id] < 0 or agent_id in seen:
+                continue
+            component = {agent_id}
+            frontier = [agent_id]
+            while frontier:
+                frontier = [n for c in frontier for n in mixture._neighbors(c) if n not in component
+                            and not component.add(n)]
+            seen |= component
+            components.append(sorted(component))
+        return sorted(components)
+
+    def test_actions(self):
+        mixture = KappaMixture([{'name': 'A', 'decl': [{'name': 'l', 'decl': [[], None, None]},
+                                                       {'name': 'r', 'decl': [[], None, None]}]}])
+        for agent_id in range(4):
+            mixture.apply_action(TraceAction('Create', TraceAgent(agent_id, 0), ((0, None), (1, None))))
+        # a ring of four: the first three bonds join complexes, the last closes the cycle
+        for agent_id in range(4):
+            mixture.apply_action(TraceAction('Bind', TraceQuark(TraceAgent(agent_id, 0), 1),
+                                             TraceQuark(TraceAgent((agent_id + 1) % 4, 0), 0)))
+        self.assertEqual(mixture.get_complex_sizes(), [4])
+        # opening the ring keeps one complex; cutting it again splits it
+        mixture.apply_action(TraceAction('Free', TraceQuark(TraceAgent(3, 0), 1)))
+        self.assertEqual(mixture.get_complex_sizes(), [4])
+        mixture.apply_action(TraceAction('Free', TraceQuark(TraceAgent(1, 0), 1)))
+        self.assertEqual(sorted(mixture.get_complex_sizes()), [2, 2])
+        self.assertEqual(mixture.get_complex_of_agent(3), {2, 3})
+        self.assertIsNone(mixture.get_partner(1, 1))
+        # removing the middle of a chain leaves its ends apart
+        mixture.apply_action(TraceAction('Bind', TraceQuark(TraceAgent(1, 0), 1), TraceQuark(TraceAgent(2, 0), 0)))
+        mixture.apply_action(TraceAction('Remove', TraceAgent(1, 0)))
+        self.assertEqual(mixture.get_number_of_agents(), 3)
+        self.assertEqual(sorted(mixture.get_complex_sizes()), [1, 2])
+        self.assertEqual(self._connected_components(mixture), [[0], [2, 3]])
+        # agents removed, or never created, have no complex
+        with self.assertRaises(ValueError):
+            mixture.get_complex_expression(1)
+        with self.assertRaises(ValueError):
+            mixture.get_complex_of_agent(7)
+
+    def test_replay(self, trace=trace_prz):
+        mixture = KappaMixture.from_trace(trace)
+        for step_index, step in enumerate(trace):
+            mixture.apply_step(step)
+            if step_index % 250 == 0:
+                self.assertEqual(self._connected_components(mixture),
+                                 sorted(sorted(members) for members in mixture._complex_members.values()))
+        self.assertEqual(mixture.get_mixture_event(), 2917)
+        self.assertEqual(mixture.get_number_of_agents(), 2201)
+        snap = mixture.to_snapshot()
+        self.assertEqual(snap.get_snapshot_event(), 2917)
+        self.assertEqual(snap.get_total_mass(), 2201)
+        self.assertEqual(len(snap.get_all_complexes()), 5)
+        self.assertEqual(sum(snap.get_all_abundances()), mixture.get_number_of_complexes())
+        self.assertEqual(snap.get_largest_complexes()[0][0].get_size_of_complex(), 3)
+        snap_ids = mixture.to_snapshot(identifiers=True)
+        self.assertEqual(snap_ids.get_total_mass(), 2201)
+
+    def test_checkpoint(self, trace=trace_prz):
+        mixture = KappaMixture.from_trace(trace)
+        raw_steps = trace.iter_raw_steps()
+        for offset, raw_step in raw_steps:
+            if offset > 60000:
+                break
+            mixture.apply_step(trace.decode_step(raw_step))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checkpoint_file = os.path.join(temp_dir, 'mixture.npz')
+            mixture.save_checkpoint(checkpoint_file, offset)
+            restored, restored_offset = KappaMixture.load_checkpoint(checkpoint_file, trace)
+        self.assertEqual(restored.to_snapshot_text(), mixture.to_snapshot_text())
+        # resuming from the checkpoint reaches the same final state as replaying on
+        mixture.apply_step(trace.decode_step(raw_step))
+        for _, raw_step in trace.iter_raw_steps(restored_offset):
+            restored.apply_step(trace.decode_step(raw_step))
+        for _, raw_step in raw_steps:
+            mixture.apply_step(trace.decode_step(raw_step))
+        self.assertEqual(restored.to_snapshot_text(identifiers=True), mixture.to_snapshot_text(identifiers=True))
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 
+import math
 import networkx
 import unittest
 from KaSaAn.core import KappaSnapshot, KappaComplex, KappaAgent, KappaToken
+from KaSaAn.functions.snapshot_summarizer import summarize_snapshot
 
 
 class TestKappaSnapshot(unittest.TestCase):
@@ -130,6 +132,63 @@ class TestKappaSnapshot(unittest.TestCase):
         self.assertEqual((12, 3), snap_kite.get_abundance_of_pattern('A(a[4], b[1]), A(a[1], b[2]), A(a[2], b[3]), A(a[3], b[4])'))
         self.assertEqual(snap_kite.get_abundance_of_pattern('A(a[4], b[1]), A(a[1], b[2]), A(a[2], b[3]), A(a[3], b[4])', multi_thread=False), snap_kite.get_abundance_of_pattern('A(a[4], b[1]), A(a[1], b[2]), A(a[2], b[3]), A(a[3], b[4])', multi_thread=True))
 
+    def test_iter_pattern_matches(self, snap_wi_lab=snap_prz_labeled, snap_kite=snap_kte):
+        ring = 'A(a[4], b[1]), A(a[1], b[2]), A(a[2], b[3]), A(a[3], b[4])'
+        self.assertEqual(12, sum(ab for _, ab, _ in snap_kite.iter_pattern_matches(ring)))
+        self.assertEqual(3, sum(ab for _, ab, _ in snap_kite.iter_pattern_matches(ring, unique=True)))
+        self.assertEqual(5, sum(ab for _, ab, _ in snap_wi_lab.iter_pattern_matches('A(b[1]), B(a[1] c[2]), C(b[2])')))
+        self.assertEqual(21, sum(ab for _, ab, _ in snap_wi_lab.iter_pattern_matches(KappaAgent('C(b[.])'))))
+        for cx, _, mapping in snap_kite.iter_pattern_matches(ring):
+            self.assertEqual(4, len(mapping.node_map))
+            self.assertIn(cx, snap_kite.get_all_complexes())
+
+    def test_agent_index(self):
+        snap_kite = KappaSnapshot('./models/kite_snap.ka')
+        snap_wi_lab = KappaSnapshot('./models/labeled_vs_unlabeled_snapshots/prozone_snap_with_identifiers.ka')
+        agent_queries = ['A()', 'A(a{ph})', 'B(c{ph})', 'A(c[_])', 'A(a[.])', 'A(a[1])', 'A(a{ph}[_] c[#])', 'Q()']
+        scanned = [snap_kite.get_abundance_of_agent(q) for q in agent_queries]
+        scanned_complexes = [snap_kite.get_complexes_with_agent(q) for q in agent_queries]
+        snap_kite.build_agent_index()
+        self.assertEqual(scanned, [snap_kite.get_abundance_of_agent(q) for q in agent_queries])
+        self.assertEqual(scanned_complexes, [snap_kite.get_complexes_with_agent(q) for q in agent_queries])
+        self.assertEqual(5, snap_kite.get_abundance_of_agent('A(a{ph})'))
+        self.assertEqual([], snap_kite.get_complexes_with_agent('Q()'))
+        ring = 'A(a[4], b[1]), A(a[1], b[2]), A(a[2], b[3]), A(a[3], b[4])'
+        self.assertEqual((12, 3), snap_kite.get_abundance_of_pattern(ring))
+        self.assertEqual((12, 3), snap_kite.get_abundance_of_pattern(ring, multi_thread=True))
+        snap_wi_lab.build_agent_index()
+        self.assertEqual((21, 21), snap_wi_lab.get_abundance_of_pattern('C(b[.])'))
+        self.assertEqual((4, 4), snap_wi_lab.get_abundance_of_pattern('B(a[.] c[1]), C(b[1])'))
+        self.assertEqual(5, sum(ab for _, ab, _ in snap_wi_lab.iter_pattern_matches('A(b[1]), B(a[1] c[2]), C(b[2])')))
+
+    def test_composition_matrix(self, ref_snap_dim=snap_dim, ref_snap_kte=snap_kte):
+        agent_types, matrix, abundances, sizes, masses = ref_snap_dim.composition_matrix()
+        self.assertEqual([KappaAgent('A()')], agent_types)
+        self.assertEqual([[2], [1]], matrix.tolist())
+        self.assertEqual([241, 18], abundances.tolist())
+        self.assertEqual([2, 1], sizes.tolist())
+        self.assertEqual([482, 18], masses.tolist())
+        self.assertIs(matrix, ref_snap_dim.composition_matrix()[1])
+        agent_types, matrix, abundances, sizes, masses = ref_snap_kte.composition_matrix()
+        self.assertEqual(ref_snap_kte.get_all_sizes(), sizes.tolist())
+        self.assertEqual(ref_snap_kte.get_total_mass(), masses.sum())
+        self.assertEqual(sorted(ref_snap_kte.get_agent_types_present()), agent_types)
+
+    def test_token_only_snapshot(self):
+        snap_tok = KappaSnapshot('./models/tokens_only_snap.ka')
+        _, matrix, abundances, sizes, masses = snap_tok.composition_matrix()
+        self.assertEqual((0, 0), matrix.shape)
+        self.assertEqual([], abundances.tolist())
+        self.assertRaises(ValueError, snap_tok.get_size_at_percentile, 50)
+        self.assertRaises(ValueError, snap_tok.get_size_at_percentile, 50, 'mass')
+        summary = summarize_snapshot('./models/tokens_only_snap.ka')
+        self.assertEqual(1.5, summary['[T]'])
+        self.assertEqual(0, summary['complexes'])
+        self.assertEqual(0, summary['largest_size'])
+        self.assertTrue(math.isnan(summary['size_mean']))
+        self.assertTrue(math.isnan(summary['size_mass_mean']))
+        self.assertEqual(10.0, summary['|tok|'])
+
     def test_get_composition(self, ref_snap_abc=snap_abc, ref_snap_dim=snap_dim, ref_snap_kte=snap_kte):
         self.assertEqual(ref_snap_abc.get_composition(),
                          {KappaAgent("Aa()"): 1000, KappaAgent("Ab()"): 1000, KappaAgent("Ac()"): 1000,
@@ -163,6 +222,32 @@ class TestKappaSnapshot(unittest.TestCase):
         self.assertEqual(ref_snap_dim.get_complexes_of_size(2), [(KappaComplex("A(a[1]{#}), A(a[1]{#})"), 241)])
         self.assertEqual(ref_snap_dim.get_complexes_of_size(3), [])
 
+    def test_get_complexes_in_size_range(self, ref_snap_dim=snap_dim, ref_snap_kte=snap_kte):
+        self.assertEqual(ref_snap_dim.get_complexes_in_size_range(1, 2),
+                         [(KappaComplex("A(a[.]{#})"), 18), (KappaComplex("A(a[1]{#}), A(a[1]{#})"), 241)])
+        self.assertEqual(ref_snap_dim.get_complexes_in_size_range(2, 10), ref_snap_dim.get_complexes_of_size(2))
+        self.assertEqual(ref_snap_dim.get_complexes_in_size_range(3, 10), [])
+        self.assertEqual(ref_snap_kte.get_complexes_in_size_range(7, 7), ref_snap_kte.get_largest_complexes())
+
+    def test_get_top_complexes(self, ref_snap_dim=snap_dim, ref_snap_abc=snap_abc):
+        self.assertEqual(ref_snap_dim.get_top_complexes(1), [(KappaComplex("A(a[1]{#}), A(a[1]{#})"), 241)])
+        self.assertEqual(ref_snap_dim.get_top_complexes(1, by='mass'), [(KappaComplex("A(a[1]{#}), A(a[1]{#})"), 241)])
+        self.assertEqual(ref_snap_dim.get_top_complexes(5, by='abundance'),
+                         [(KappaComplex("A(a[1]{#}), A(a[1]{#})"), 241), (KappaComplex("A(a[.]{#})"), 18)])
+        self.assertEqual([cx for cx, _ in ref_snap_abc.get_top_complexes(1, by='abundance')],
+                         ref_snap_abc.get_most_abundant_complexes())
+        self.assertEqual(ref_snap_abc.get_top_complexes(1)[0][0].get_size_of_complex(), 21899)
+        self.assertRaises(ValueError, ref_snap_dim.get_top_complexes, 1, 'volume')
+
+    def test_get_size_at_percentile(self, ref_snap_dim=snap_dim):
+        self.assertEqual(ref_snap_dim.get_size_at_percentile(0), 1)
+        self.assertEqual(ref_snap_dim.get_size_at_percentile(5), 1)
+        self.assertEqual(ref_snap_dim.get_size_at_percentile(50), 2)
+        self.assertEqual(ref_snap_dim.get_size_at_percentile(3, weight='mass'), 1)
+        self.assertEqual(ref_snap_dim.get_size_at_percentile(4, weight='mass'), 2)
+        self.assertEqual(ref_snap_dim.get_size_at_percentile(50, weight='species'), 1)
+        self.assertRaises(ValueError, ref_snap_dim.get_size_at_percentile, 101)
+
     def test_get_largest_complexes(self, ref_snap_abc=snap_abc, ref_snap_dim=snap_dim):
         self.assertEqual(ref_snap_abc.get_largest_complexes()[0][0].get_number_of_bonds(), 78483)
         self.assertEqual(ref_snap_abc.get_largest_complexes()[0][0].get_size_of_complex(), 21899)
@@ -178,6 +263,25 @@ class TestKappaSnapshot(unittest.TestCase):
                           KappaAgent("Al()"): 826, KappaAgent("Ar()"): 817})
         self.assertEqual(ref_snap_dim.get_largest_complexes(), [(KappaComplex("A(a[1]{#}), A(a[1]{#})"), 241)])
 
+    def test_read_largest_complexes(self, ref_snap_abc=snap_abc, ref_snap_dim=snap_dim, ref_snap_prz=snap_prz_labeled):
+        self.assertEqual(KappaSnapshot.read_largest_complexes('./models/dimerization_with_tokens_snap.ka'),
+                         (10.0, ref_snap_dim.get_largest_complexes()))
+        self.assertEqual(KappaSnapshot.read_largest_complexes('./models/alphabet_soup_snap.ka')[1],
+                         ref_snap_abc.get_largest_complexes())
+        self.assertEqual(KappaSnapshot.read_largest_complexes(
+            './models/labeled_vs_unlabeled_snapshots/prozone_snap_with_identifiers.ka')[1],
+            ref_snap_prz.get_largest_complexes())
+
+    def test_raw_expression(self, ref_snap_dim=snap_dim):
+        with open('./models/dimerization_with_tokens_snap.ka', 'r') as kf:
+            raw_expression = kf.read()
+        from_text = KappaSnapshot('./models/dimerization_with_tokens_snap.ka', raw_expression)
+        self.assertEqual(from_text.get_all_complexes_and_abundances(), ref_snap_dim.get_all_complexes_and_abundances())
+        self.assertEqual(from_text.get_all_tokens_and_values(), ref_snap_dim.get_all_tokens_and_values())
+        self.assertEqual(from_text.get_snapshot_time(), ref_snap_dim.get_snapshot_time())
+        self.assertEqual(KappaSnapshot.read_largest_complexes('nowhere.ka', raw_expression),
+                         (10.0, ref_snap_dim.get_largest_complexes()))
+
     def test_get_smallest_complexes(self, ref_snap_abc=snap_abc, ref_snap_dim=snap_dim):
         self.assertEqual(ref_snap_abc.get_smallest_complexes(), [
             (KappaComplex("As(a[.]{#} b[.]{#} c[.]{#} d[.]{#} e[.]{#} f[.]{#} g[.]{#} h[.]{#} i[.]{#} j[.]{#} k[.]{#} l[.]{#} m[.]{#} n[.]{#} o[.]{#} p[.]{#} q[.]{#} r[.]{#} s[.]{#} t[.]{#} u[.]{#} v[.]{#} w[.]{#} x[.]{#} y[.]{#} z[.]{#})"), 182),
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import unittest
+from KaSaAn.core import KappaSnapshot, KappaSnapshotSeries
+
+
+class TestKappaSnapshotSeries(unittest.TestCase):
+    """Testing various elements of KappaSnapshotSeries representation."""
+    series_ts = KappaSnapshotSeries('./models/time_series', 'snap_*.ka', cache_size=2)
+
+    def test_read_header(self):
+        self.assertEqual(KappaSnapshot.read_header('./models/kite_snap.ka'), (1, '000000000', 1.0))
+        self.assertEqual(KappaSnapshot.read_header('./models/time_series/snap_100.ka'),
+                         (100, '974460868', 6.483293146479111e-07))
+
+    def test_indexing(self, series=series_ts):
+        self.assertEqual(len(series), 6)
+        self.assertEqual(series.get_snapshot_events(), [100, 200, 300, 400, 500, 600])
+        self.assertEqual(series.get_snapshot_times(), sorted(series.get_snapshot_times()))
+        self.assertEqual(series[0].get_snapshot_event(), 100)
+        self.assertEqual(series[-1].get_snapshot_event(), 600)
+        self.assertRaises(IndexError, series.__getitem__, 6)
+
+    def test_slicing(self, series=series_ts):
+        self.assertIsInstance(series[1:3], KappaSnapshotSeries)
+        self.assertEqual(series[1:3].get_snapshot_events(), [200, 300])
+        self.assertEqual(series[::2].get_snapshot_events(), [100, 300, 500])
+        self.assertRaises(ValueError, series.__getitem__, slice(None, None, -1))
+        self.assertEqual(series[2::2].get_index_nearest_to_time(series.get_snapshot_times()[4]), 1)
+        self.assertEqual([snap.get_snapshot_event() for snap in series[4:]], [500, 600])
+
+    def test_time_lookup(self, series=series_ts):
+        times = series.get_snapshot_times()
+        self.assertEqual(series.get_index_nearest_to_time(0), 0)
+        self.assertEqual(series.get_index_nearest_to_time(times[3]), 3)
+        self.assertEqual(series.get_index_nearest_to_time(times[4] * 0.99), 4)
+        self.assertEqual(series.get_index_nearest_to_time(1e9), 5)
+        self.assertEqual(series.get_indexes_bracketing_time(times[2]), (2, 2))
+        self.assertEqual(series.get_indexes_bracketing_time((times[2] + times[3]) / 2), (2, 3))
+        self.assertEqual(series.get_indexes_bracketing_time(0), (None, 0))
+        self.assertEqual(series.get_indexes_bracketing_time(1e9), (5, None))
+        before, after = series.get_snapshots_bracketing_time((times[0] + times[1]) / 2)
+        self.assertEqual((before.get_snapshot_event(), after.get_snapshot_event()), (100, 200))
+        self.assertEqual(series.get_snapshot_nearest_to_time(times[5]).get_snapshot_event(), 600)
+
+    def test_cache(self):
+        series = KappaSnapshotSeries('./models/time_series', 'snap_*.ka', cache_size=2)
+        first = series[0]
+        self.assertIs(first, series[0])
+        for _ in series:
+            pass
+        self.assertEqual(len(series._cache), 2)
+        self.assertIsNot(first, series[0])
+        self.assertIs(series[0], series[0:1][0])
+        uncached = KappaSnapshotSeries('./models/time_series', 'snap_*.ka', cache_size=0)
+        self.assertIsNot(uncached[0], uncached[0])
+        self.assertRaises(ValueError, KappaSnapshotSeries, './models/time_series', 'snap_*.ka', -1)
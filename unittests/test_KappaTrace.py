@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import unittest
+from KaSaAn.core import KappaTrace
+from KaSaAn.core.KappaTrace import TraceAction, TraceAgent, TraceInit, TraceQuark, TraceRule
+from KaSaAn.functions.rule_activity import rule_activity_of_trace
+
+
+class TestKappaTrace(unittest.TestCase):
+    """Testing various elements of KappaTrace reading."""
+    trace_prz = KappaTrace('./models/trace_viz/t.json', chunk_size=256)
+
+    def test_header(self, trace=trace_prz):
+        self.assertEqual(trace.get_trace_uuid(), '426839286')
+        self.assertEqual(trace.get_agent_names(), ['A', 'B', 'C'])
+        self.assertEqual(trace.get_site_name(1, 1), 'c')
+        self.assertEqual(trace.get_rule_name(1), 'A.B')
+
+    def test_raw_steps(self, trace=trace_prz):
+        with open('./models/trace_viz/t.json', 'r') as tf:
+            ref_steps = json.load(tf)['trace']
+        raw_steps = list(trace.iter_raw_steps())
+        self.assertEqual([raw_step for _, raw_step in raw_steps], ref_steps)
+        # offsets point at the steps, and reading can resume from them
+        offset, raw_step = raw_steps[1234]
+        self.assertEqual(next(trace.iter_raw_steps(offset)), (offset, raw_step))
+        self.assertEqual(len(list(trace.iter_raw_steps(offset))), len(ref_steps) - 1234)
+
+    def test_typed_steps(self, trace=trace_prz):
+        steps = list(trace)
+        self.assertEqual(sum(isinstance(step, TraceInit) for step in steps), 100)
+        self.assertEqual(sum(isinstance(step, TraceRule) for step in steps), 2917)
+        self.assertEqual(steps[0].actions[0], TraceAction('Create', TraceAgent(0, 0), ((0, None),)))
+        self.assertEqual(steps[200].event.actions, [
+            TraceAction('Bind', TraceQuark(TraceAgent(262, 1), 1), TraceQuark(TraceAgent(147, 2), 0))])
+        self.assertEqual(steps[200].info.event, 101)
+        self.assertEqual([step.info.time for step in steps[100:]], sorted(step.info.time for step in steps[100:]))
+
+    def test_rule_firings(self, trace=trace_prz):
+        self.assertEqual(trace.get_rule_names(), ['/', 'A.B', 'A.B_op', 'C.B', 'C.B_op'])
+        firings = list(trace.iter_rule_firings())
+        rule_steps = [step for step in trace if isinstance(step, TraceRule)]
+        self.assertEqual(firings, [(step.rule_id, step.info.event, step.info.time) for step in rule_steps])
+
+    def test_unlabeled_rules(self):
+        with open('./models/trace_viz/t.json', 'r') as tf:
+            trace_json = json.load(tf)
+        trace_json['model']['ast_rules'][2][0] = None
+        trace_json['model']['ast_rules'][4][0] = None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_file = os.path.join(tmp_dir, 'unlabeled.json')
+            with open(trace_file, 'w') as tf:
+                json.dump(trace_json, tf)
+            trace = KappaTrace(trace_file)
+            self.assertEqual(trace.get_rule_names(), ['/', 'A.B', 'rule_3', 'C.B', 'rule_5'])
+            self.assertEqual(trace.get_rule_name(1), 'A.B')
+            self.assertEqual(trace.get_rule_name(2), 'rule_3')
+            legend, _ = rule_activity_of_trace(trace_file, bin_number=10)
+        firing_columns = [column for column in legend if column.startswith('firings(')]
+        self.assertEqual(firing_columns, ['firings(/)', 'firings(A.B)', 'firings(rule_3)', 'firings(C.B)',
+                                          'firings(rule_5)'])
+
+    def test_index(self, trace=trace_prz):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_file = os.path.join(tmp_dir, 't.json.idx.npz')
+            trace.build_index(every=100, index_file=index_file)
+            trace_reread = KappaTrace('./models/trace_viz/t.json')
+            self.assertTrue(trace_reread.load_index(index_file))
+        checkpoint = trace_reread.get_checkpoint(time=500)
+        self.assertEqual((checkpoint.step, checkpoint.event), (900, 800))
+        self.assertLessEqual(checkpoint.time, 500)
+        first_step = next(trace_reread.iter_steps(checkpoint.offset))
+        self.assertEqual(first_step.info.event, 801)
+        self.assertEqual(trace_reread.get_checkpoint(event=1500).event, 1500)
+        self.assertEqual(trace_reread.get_checkpoint(time=-1).event, 0)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+from KaSaAn.functions.snapshot_prefetch import prefetch_snapshot_files
+
+
+class TestSnapshotPrefetch(unittest.TestCase):
+    """Testing the background reading of snapshot files."""
+    snapshot_names = ['./models/time_series/snap_{}.ka'.format(event) for event in range(600, 0, -100)] + \
+        ['./models/kite_snap.ka']
+
+    def _contents(self, snapshot_name):
+        with open(snapshot_name, 'r') as kf:
+            return kf.read()
+
+    def test_order(self, names=snapshot_names):
+        for depth in (0, 1, 2, 8):
+            prefetched = list(prefetch_snapshot_files(names, depth=depth))
+            self.assertEqual([snap_name for snap_name, _ in prefetched], names)
+            self.assertEqual([snap_text for _, snap_text in prefetched], [self._contents(name) for name in names])
+
+    def test_errors(self, names=snapshot_names):
+        names_with_missing = names[:2] + ['./models/no_such_snap.ka'] + names[2:]
+        for depth in (0, 2):
+            prefetched = prefetch_snapshot_files(names_with_missing, depth=depth)
+            self.assertEqual(next(prefetched)[0], names[0])
+            self.assertEqual(next(prefetched)[0], names[1])
+            self.assertRaises(FileNotFoundError, next, prefetched)
+            prefetched = list(prefetch_snapshot_files(names_with_missing, depth=depth, yield_errors=True))
+            self.assertEqual([snap_name for snap_name, _ in prefetched], names_with_missing)
+            self.assertIsInstance(prefetched[2][1], FileNotFoundError)
+            self.assertEqual([snap_text for _, snap_text in prefetched[3:]],
+                             [self._contents(name) for name in names[2:]])
+
+    def test_early_close(self, names=snapshot_names):
+        threads_before = set(threading.enumerate())
+        prefetched = prefetch_snapshot_files(names, depth=2)
+        self.assertEqual(next(prefetched)[0], names[0])
+        self.assertGreater(len(set(threading.enumerate()) - threads_before), 0)
+        prefetched.close()
+        self.assertEqual([thread for thread in set(threading.enumerate()) - threads_before if thread.is_alive()], [])
+
+    def test_empty(self):
+        for depth in (0, 4):
+            self.assertEqual(list(prefetch_snapshot_files([], depth=depth)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()